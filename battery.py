@@ -0,0 +1,206 @@
+# Battery discharge rate and remaining flight time from the voltage telemetry.
+#
+# BatteryEstimator fits a straight line to the last `window` points of the
+# pack voltage. Samples are first averaged over `interval` seconds, so at
+# the defaults the window spans about four minutes. The least-squares
+# sums are updated in O(1) as points enter and leave the window; once per
+# window they are recomputed from the NumPy arrays to shed rounding drift.
+#
+# Voltage sags while the motors pull hard and recovers when they ease off.
+# To keep those dips from steering the slope, every point is clipped to
+# within 2.5 robust standard deviations of the current fit before it is
+# added (winsorized). The scale comes from the median absolute residual of
+# the window, taken whenever the sums are recomputed.
+
+import math
+import threading
+import time
+
+import numpy as np
+
+BATTERY_KEY = 'Battery Voltage'
+BATTERY_WINDOW = 512          # fitted points
+BATTERY_INTERVAL = 0.5        # seconds of samples averaged into one point
+WARN_CELL_VOLTAGE = 3.5
+EMPTY_CELL_VOLTAGE = 3.3
+FULL_CELL_VOLTAGE = 4.25      # a bit above 4.2, for guessing the cell count
+MIN_FIT_POINTS = 16
+MIN_FIT_SPAN = 20.0           # seconds before a trend is reported
+CLIP_SIGMAS = 2.5
+
+
+class BatteryEstimator:
+    """Robust sliding-window discharge slope of one battery; see the module comment.
+
+    `cells` is guessed from the first voltage (a charged pack) unless given.
+    """
+
+    def __init__(self, cells=None, window=BATTERY_WINDOW, interval=BATTERY_INTERVAL,
+                 warn_cell_voltage=WARN_CELL_VOLTAGE, empty_cell_voltage=EMPTY_CELL_VOLTAGE):
+        self.cells = cells
+        self.window = window
+        self.interval = interval
+        self.warn_cell_voltage = warn_cell_voltage
+        self.empty_cell_voltage = empty_cell_voltage
+        self._lock = threading.Lock()
+        self._times = np.zeros(window)
+        self._values = np.zeros(window)   # winsorized voltages, as fitted
+        self._index = 0
+        self._count = 0                   # points in the window
+        self._pushed = 0
+        self._origin = None               # times are fitted relative to this
+        # Least-squares sums over the window, x = time - origin
+        self._sx = self._sy = self._sxx = self._sxy = 0.0
+        self._scale = None                # robust standard deviation of the residuals
+        # Samples being averaged into the next point
+        self._pending_start = None
+        self._pending_sum = 0.0
+        self._pending_count = 0
+        self.latest = None
+        self.samples = 0
+
+    def add(self, timestamp, voltage):
+        with self._lock:
+            self.latest = voltage
+            self.samples += 1
+            if self.cells is None and voltage > 0:
+                self.cells = max(1, math.ceil(voltage / FULL_CELL_VOLTAGE))
+            if self._pending_start is None:
+                self._pending_start = timestamp
+            self._pending_sum += voltage
+            self._pending_count += 1
+            if timestamp - self._pending_start >= self.interval:
+                self._push((self._pending_start + timestamp) / 2, self._pending_sum / self._pending_count)
+                self._pending_start = None
+                self._pending_sum = 0.0
+                self._pending_count = 0
+
+    def _fit(self):
+        """(slope, intercept) in x = time - origin, or None."""
+        n = self._count
+        denominator = n * self._sxx - self._sx * self._sx
+        if n < 2 or denominator <= 0:
+            return None
+        slope = (n * self._sxy - self._sx * self._sy) / denominator
+        return slope, (self._sy - slope * self._sx) / n
+
+    def _push(self, timestamp, voltage):
+        if self._origin is None:
+            self._origin = timestamp
+        x = timestamp - self._origin
+        if self._scale is not None:
+            fit = self._fit()
+            if fit is not None:
+                predicted = fit[1] + fit[0] * x
+                limit = CLIP_SIGMAS * self._scale
+                voltage = min(max(voltage, predicted - limit), predicted + limit)
+        index = self._index
+        if self._count == self.window:
+            old_x = float(self._times[index]) - self._origin
+            old_y = float(self._values[index])
+            self._sx -= old_x
+            self._sy -= old_y
+            self._sxx -= old_x * old_x
+            self._sxy -= old_x * old_y
+        else:
+            self._count += 1
+        self._times[index] = timestamp
+        self._values[index] = voltage
+        self._sx += x
+        self._sy += voltage
+        self._sxx += x * x
+        self._sxy += x * voltage
+        self._index = (index + 1) % self.window
+        self._pushed += 1
+        if self._pushed % self.window == 0 or (self._scale is None and self._count >= MIN_FIT_POINTS):
+            self._resync()
+
+    def _resync(self):
+        # Exact sums from the arrays, relative to the oldest point, and a fresh robust scale
+        count = self._count
+        times = self._times[:count]
+        values = self._values[:count]
+        self._origin = float(times.min())
+        x = times - self._origin
+        self._sx = float(x.sum())
+        self._sy = float(values.sum())
+        self._sxx = float(x @ x)
+        self._sxy = float(x @ values)
+        fit = self._fit()
+        if fit is not None:
+            residuals = values - (fit[1] + fit[0] * x)
+            # Floor: a perfectly steady voltage must not clip everything to the line
+            self._scale = max(1.4826 * float(np.median(np.abs(residuals))), 0.005)
+
+    def estimate(self, now=None):
+        """Current discharge estimate as a dict, or None before the first sample.
+
+        'voltage' is the fitted (sag-free) voltage now, 'rate' the slope in
+        V/min; 'remaining' and 'to_warning' are the seconds until the fit
+        reaches the empty and warning cell voltages, None while the voltage
+        is not falling or the window is too short.
+        """
+        with self._lock:
+            if self.latest is None:
+                return None
+            now = time.monotonic() if now is None else now
+            estimate = {'voltage': self.latest, 'rate': None, 'remaining': None, 'to_warning': None,
+                        'cells': self.cells}
+            fit = self._fit()
+            if fit is None or self._count < MIN_FIT_POINTS:
+                return estimate
+            span = float(self._times[:self._count].max() - self._times[:self._count].min())
+            if span < MIN_FIT_SPAN:
+                return estimate
+            slope, intercept = fit
+            voltage = intercept + slope * (now - self._origin)
+            estimate['voltage'] = voltage
+            estimate['rate'] = slope * 60.0
+            if slope < 0:
+                for key, cell_voltage in (('remaining', self.empty_cell_voltage),
+                                          ('to_warning', self.warn_cell_voltage)):
+                    estimate[key] = max((voltage - cell_voltage * self.cells) / -slope, 0.0)
+            return estimate
+
+
+class VehicleBatteries:
+    """A BatteryEstimator per vehicle; publish() has the IngestService sink signature."""
+
+    def __init__(self, cells=None):
+        self.cells = cells
+        self._lock = threading.Lock()
+        self._vehicles = {}
+
+    def estimator(self, vehicle_id):
+        estimator = self._vehicles.get(vehicle_id)
+        if estimator is None:
+            with self._lock:
+                estimator = self._vehicles.setdefault(vehicle_id, BatteryEstimator(self.cells))
+        return estimator
+
+    def publish(self, vehicle_id, samples):
+        for key, value in samples:
+            if key == BATTERY_KEY:
+                try:
+                    self.estimator(vehicle_id).add(time.monotonic(), float(value))
+                except (TypeError, ValueError):
+                    pass
+
+
+def format_estimate(estimate):
+    """Text for the dashboard, e.g. "-0.08 V/min, 11:20 left" and "warning in 07:45" below."""
+    if estimate is None:
+        return ""
+    if estimate['rate'] is None:
+        return "measuring discharge..."
+    lines = [f"{estimate['rate']:+.2f} V/min"]
+    if estimate['remaining'] is not None:
+        lines[0] += f", {_minutes(estimate['remaining'])} left"
+        lines.append(f"warning in {_minutes(estimate['to_warning'])}")
+    return "\n".join(lines)
+
+
+def _minutes(seconds):
+    if seconds >= 100 * 60:
+        return "99:59+"
+    return f"{int(seconds // 60):02d}:{int(seconds % 60):02d}"
@@ -0,0 +1,107 @@
+# Micro-benchmark: telemetry line decoding, old if/elif chain vs the schema table.
+#
+# The two decode at about the same rate; the table is there so receiver.py and
+# new.py share one schema, not for speed. The parse path got faster through
+# chunked reads and line splitting, see parse_legacy vs parse_reader in run.py.
+#
+# Usage: python benchmarks/bench_decoder.py [CYCLES]
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telemetry import TelemetryDecoder  # noqa: E402
+
+SAMPLE_CYCLE = [
+    'Battery Voltage: 11.84',
+    'Roll: -2.37',
+    'Pitch: 1.05',
+    'Heading: 271.4',
+    'Number of Satellites: 9',
+    'Main Mode: 2',
+    'Sub Mode: 1',
+    'Error: 0',
+    'GPS: 1',
+    'Latitude: 12.971599',
+    'Longitude: 77.594566',
+    'Altitude: 42.7',
+    'Distance Right: 183',
+    'Distance Left: 240',
+    'Distance Upper: 95',
+    'Armed or Not: Yes',
+]
+
+
+def legacy_decode(line, state):
+    # The chain receiver.py used before the schema, minus its print() calls
+    key_value = line.split(':')
+    if len(key_value) == 2:
+        key = key_value[0].strip()
+        value = key_value[1].strip()
+        if key == 'Battery Voltage':
+            state['battery_voltage'] = float(value)
+        elif key == 'Roll':
+            state['roll'] = float(value)
+        elif key == 'Pitch':
+            state['pitch'] = float(value)
+        elif key == 'Heading':
+            state['heading'] = float(value)
+        elif key == 'Number of Satellites':
+            state['num_satellites'] = int(value)
+        elif key == 'Main Mode':
+            state['mainmode'] = str(value)
+        elif key == 'Sub Mode':
+            state['submode'] = str(value)
+        elif key == 'Error':
+            state['error'] = int(value)
+        elif key == 'GPS':
+            state['gps'] = bool(value)
+        elif key == 'Latitude':
+            state['latitude'] = float(value)
+        elif key == 'Longitude':
+            state['longitude'] = float(value)
+        elif key == 'Altitude':
+            state['altitude'] = float(value)
+        elif key == 'Distance Right':
+            state['distance_right'] = int(value)
+        elif key == 'Distance Left':
+            state['distance_left'] = int(value)
+        elif key == 'Distance Upper':
+            state['distance_upper'] = int(value)
+        elif key == 'Armed or Not':
+            state['armed'] = str(value)
+
+
+def bench_legacy(lines):
+    state = {}
+    start = time.perf_counter()
+    for line in lines:
+        legacy_decode(line, state)
+    return len(lines) / (time.perf_counter() - start)
+
+
+def bench_table(lines):
+    state = {}
+    decode_line = TelemetryDecoder().decode_line
+    start = time.perf_counter()
+    for line in lines:
+        decoded = decode_line(line)
+        if decoded is not None:
+            spec, value = decoded
+            state[spec.slot] = value
+    return len(lines) / (time.perf_counter() - start)
+
+
+def main():
+    cycles = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    lines = SAMPLE_CYCLE * cycles
+    legacy = max(bench_legacy(lines) for _ in range(3))
+    table = max(bench_table(lines) for _ in range(3))
+    print(f"if/elif chain : {legacy:12,.0f} lines/s")
+    print(f"schema table  : {table:12,.0f} lines/s  ({table / legacy:.2f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,363 @@
+# Benchmark suite for the dashboard hot paths.
+#
+# Runs headless on Qt's offscreen platform and writes machine-readable
+# results; --compare flags regressions against an earlier results file.
+#
+# Usage:
+#   python benchmarks/run.py [-o results.json] [--compare baseline.json] [--threshold 0.10]
+#                            [--only NAME ...] [--repeat N]
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np  # noqa: E402
+from PyQt5.QtCore import Qt, QObject, pyqtSignal  # noqa: E402
+from PyQt5.QtWidgets import QApplication  # noqa: E402
+
+from battery import BatteryEstimator  # noqa: E402
+from ingest import VehicleLink  # noqa: E402
+from bench_decoder import SAMPLE_CYCLE, legacy_decode  # noqa: E402
+from serial_reader import SerialLineReader  # noqa: E402
+from shared_telemetry import SharedTelemetryBlock  # noqa: E402
+from snapshots import SnapshotRing  # noqa: E402
+from strip_chart import ChannelHistory, min_max_decimate  # noqa: E402
+from telemetry import TelemetryDecoder  # noqa: E402
+from telemetry_store import TelemetryStore  # noqa: E402
+from video import FrameMailbox, FrameScaler  # noqa: E402
+
+CAMERA_FRAME_SHAPE = (720, 1280, 3)
+CAMERA_LABEL_SIZE = (1101, 561)   # labelCameraFeed in drone.ui
+CHART_WIDTH = 269                  # one of the four default strip charts
+
+
+class ChunkedPort:
+    """Stand-in serial port returning a prepared byte stream in fixed-size chunks."""
+
+    def __init__(self, data, chunk_size=4096):
+        self.data = data
+        self.chunk_size = chunk_size
+        self.position = 0
+
+    @property
+    def in_waiting(self):
+        return min(self.chunk_size, len(self.data) - self.position)
+
+    def read(self, size):
+        chunk = self.data[self.position:self.position + size]
+        self.position += len(chunk)
+        return chunk
+
+
+def _rate(count, func):
+    start = time.perf_counter()
+    func()
+    return count / (time.perf_counter() - start)
+
+
+def bench_parse_legacy(cycles=20000):
+    # The original serial thread: readline(), decode and rstrip per line, then the if/elif chain.
+    # BytesIO.readline() stands in for pyserial's, which is slower still
+    data = ''.join(line + '\r\n' for line in SAMPLE_CYCLE * cycles).encode('ascii')
+    port = io.BytesIO(data)
+    count = len(SAMPLE_CYCLE) * cycles
+    state = {}
+
+    def run():
+        for _ in range(count):
+            legacy_decode(port.readline().decode('utf-8').rstrip(), state)
+    return _rate(count, run), 'lines/s'
+
+
+def bench_parse_reader(cycles=20000):
+    # The reader and decoder VehicleLink.poll uses, without the port: chunked read, line split and table decode
+    data = ''.join(line + '\r\n' for line in SAMPLE_CYCLE * cycles).encode('ascii')
+    reader = SerialLineReader(ChunkedPort(data))
+    decode_line = TelemetryDecoder().decode_line
+    count = len(SAMPLE_CYCLE) * cycles
+
+    def run():
+        decoded = 0
+        while decoded < count:
+            for record in reader.read_records():
+                decode_line(record)
+                decoded += 1
+    return _rate(count, run), 'lines/s'
+
+
+def bench_ingest_poll(cycles=20000):
+    # IngestService's per-port work without the port: VehicleLink.poll reading, decoding and updating the store
+    data = ''.join(line + '\r\n' for line in SAMPLE_CYCLE * cycles).encode('ascii')
+    link = VehicleLink('bench', 'bench')
+    link.reader = SerialLineReader(ChunkedPort(data))
+    count = len(SAMPLE_CYCLE) * cycles
+
+    def run():
+        decoded = 0
+        while decoded < count:
+            decoded += len(link.poll())
+    return _rate(count, run), 'lines/s'
+
+
+def bench_signal_dispatch(count=20000):
+    # Queued delivery of one dict signal per line, the dashboard's original serial-to-GUI path (baseline)
+    class Emitter(QObject):
+        data_received = pyqtSignal(dict)
+
+    class Receiver(QObject):
+        received = 0
+
+        def on_data(self, data):
+            self.received += 1
+
+    app = QApplication.instance()
+    emitter, receiver = Emitter(), Receiver()
+    emitter.data_received.connect(receiver.on_data, Qt.QueuedConnection)
+    payload = {'Roll': -2.37}
+
+    def run():
+        for _ in range(count):
+            emitter.data_received.emit(payload)
+        while receiver.received < count:
+            app.processEvents()
+    return _rate(count, run), 'signals/s'
+
+
+def _main_window():
+    import new
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        window = new.MainWindow()
+        window.camera_thread.stop()
+        window.render_timer.stop()
+        window.display_timer.stop()
+    return window
+
+
+def bench_update_telemetry(count=2000):
+    # Full 16-field cycle pushed into the Ui_DroneDashboard widgets per call
+    window = _main_window()
+    decoder = TelemetryDecoder()
+    cycle = dict((spec.key, value) for spec, value in map(decoder.decode_line, SAMPLE_CYCLE))
+    cycle['Armed or Not'] = 'No'   # keep the flight timer out of the measurement
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            for index in range(count):
+                cycle['Roll'] = float(index)
+                window.update_telemetry_data(cycle)
+    try:
+        return _rate(count, run), 'calls/s'
+    finally:
+        window.close()
+
+
+def bench_store_render(count=20000):
+    # Serial-side store update followed by the render tick's changed_since() read
+    store = TelemetryStore()
+    decoder = TelemetryDecoder()
+    cycle = dict((spec.key, value) for spec, value in map(decoder.decode_line, SAMPLE_CYCLE))
+
+    def run():
+        version = 0
+        for index in range(count):
+            cycle['Roll'] = float(index)
+            store.update(cycle)
+            version, changed = store.changed_since(version)
+    return _rate(count, run), 'cycles/s'
+
+
+def bench_shared_render(count=20000):
+    # As bench_store_render, through the shared-memory block the ingest process writes
+    block = SharedTelemetryBlock(create=True)
+    decoder = TelemetryDecoder()
+    cycle = dict((spec.key, value) for spec, value in map(decoder.decode_line, SAMPLE_CYCLE))
+
+    def run():
+        version = 0
+        for index in range(count):
+            cycle['Roll'] = float(index)
+            block.update(cycle)
+            version, changed = block.changed_since(version)
+    try:
+        return _rate(count, run), 'cycles/s'
+    finally:
+        block.close()
+
+
+def bench_chart_decimate(count=200):
+    # A strip chart frame over a full history: window the raw and bucket rings, then min/max per column
+    history = ChannelHistory()
+    samples = history.capacity * (history.bucket + 1)
+    for index in range(samples):
+        history.append(index * 0.01, float(np.sin(index / 100)))
+    end = samples * 0.01
+    start = end - samples * 0.01
+
+    def run():
+        for _ in range(count):
+            times, mins, maxs = history.window(start, end)
+            min_max_decimate(times, mins, maxs, start, end, CHART_WIDTH)
+    return _rate(count, run), 'frames/s'
+
+
+def bench_battery_estimate(count=100000):
+    # Per-sample cost of the discharge fit at telemetry rate (20 Hz sample times)
+    estimator = BatteryEstimator()
+
+    def run():
+        for index in range(count):
+            estimator.add(index * 0.05, 12.6 - index * 1e-5)
+    return _rate(count, run), 'samples/s'
+
+
+def bench_camera_legacy(count=200):
+    # The original per-frame work: full-size cvtColor and QImage wrap on the camera thread,
+    # then pixmap conversion and the label's setScaledContents() rescale on the GUI thread
+    import cv2
+    from PyQt5.QtGui import QImage, QPixmap
+
+    frame = np.random.randint(0, 255, CAMERA_FRAME_SHAPE, np.uint8)
+
+    def run():
+        for _ in range(count):
+            rgb_image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            h, w, ch = rgb_image.shape
+            image = QImage(rgb_image.data, w, h, ch * w, QImage.Format_RGB888)
+            QPixmap.fromImage(image).scaled(*CAMERA_LABEL_SIZE)
+    return _rate(count, run), 'frames/s'
+
+
+def bench_camera_scaled(count=200):
+    # Worker-side scale + convert into the buffer pool, mailbox handoff and pixmap conversion
+    from PyQt5.QtGui import QPixmap
+
+    frame = np.random.randint(0, 255, CAMERA_FRAME_SHAPE, np.uint8)
+    scaler = FrameScaler()
+    scaler.set_target_size(*CAMERA_LABEL_SIZE)
+    mailbox = FrameMailbox()
+
+    def run():
+        displayed = None
+        for _ in range(count):
+            mailbox.put(scaler.convert(frame))
+            display_frame = mailbox.take()
+            QPixmap.fromImage(display_frame.image)
+            # As in MainWindow.display_camera_frame: the previous frame is released once replaced
+            if displayed is not None:
+                displayed.release()
+            displayed = display_frame
+        displayed.release()
+    return _rate(count, run), 'frames/s'
+
+
+def bench_snapshot_ring(count=500):
+    # What the pre-trigger snapshot ring adds to the camera thread per full-resolution frame
+    frame = np.random.randint(0, 255, CAMERA_FRAME_SHAPE, np.uint8)
+    ring = SnapshotRing()
+
+    def run():
+        for index in range(count):
+            ring.add(frame, index / 30.0)
+    return _rate(count, run), 'frames/s'
+
+
+BENCHMARKS = {
+    'parse_legacy': bench_parse_legacy,
+    'parse_reader': bench_parse_reader,
+    'ingest_poll': bench_ingest_poll,
+    'signal_dispatch': bench_signal_dispatch,
+    'update_telemetry': bench_update_telemetry,
+    'store_render': bench_store_render,
+    'shared_render': bench_shared_render,
+    'chart_decimate': bench_chart_decimate,
+    'battery_estimate': bench_battery_estimate,
+    'camera_legacy': bench_camera_legacy,
+    'camera_scaled': bench_camera_scaled,
+    'snapshot_ring': bench_snapshot_ring,
+}
+
+
+def run_benchmarks(names, repeat):
+    results = {}
+    for name in names:
+        best, unit = 0.0, ''
+        for _ in range(repeat):
+            value, unit = BENCHMARKS[name]()
+            best = max(best, value)
+        # All benchmarks report a rate, so higher is better
+        results[name] = {'value': best, 'unit': unit}
+        print(f"{name:18} {best:14,.1f} {unit}")
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def compare(results, baseline, threshold):
+    """Print the change per benchmark; return the names that got slower than `threshold`."""
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get('results', {}).get(name)
+        if not previous or not previous['value']:
+            continue
+        change = result['value'] / previous['value'] - 1
+        flag = ''
+        if change < -threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f"{name:18} {previous['value']:14,.1f} -> {result['value']:14,.1f} {result['unit']} "
+              f"({change:+.1%}){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard hot paths.")
+    parser.add_argument('-o', '--output', default='bench_results.json', help="results file to write")
+    parser.add_argument('--compare', metavar='BASELINE', help="earlier results file to compare against")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="relative slowdown reported as a regression (default 0.10)")
+    parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS), help="run only these benchmarks")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per benchmark, the best is kept")
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication(sys.argv[:1])  # noqa: F841 (kept alive for the Qt benchmarks)
+    results = run_benchmarks(args.only or list(BENCHMARKS), args.repeat)
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as output_file:
+        json.dump(report, output_file, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.threshold)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,291 @@
+# Republishes the decoded telemetry to viewers on the local network.
+#
+# TelemetryFanout is an IngestService sink: publish() only merges the new
+# samples into a per-vehicle pending dict. A background thread wakes at
+# `rate` Hz, encodes each vehicle's changes once as a JSON line and hands
+# the same bytes to every subscriber:
+#
+#   UDP multicast   one sendto() per message, whatever the number of
+#                   listeners; a full snapshot goes out every
+#                   `snapshot_interval` seconds for late joiners and losses
+#   TCP             newline-delimited JSON to every connected client
+#
+# TCP clients are written non-blocking. A client whose previous message is
+# still in its socket buffer does not queue up the messages it misses: it is
+# marked stale, and once it has drained it gets the current snapshot
+# instead (latest-value coalescing). Snapshots are also encoded at most
+# once per tick, so a slow client costs no more than a fast one.
+#
+# Usage as a viewer: python fanout.py --connect HOST[:PORT] | --multicast [GROUP:PORT]
+
+import argparse
+import json
+import selectors
+import socket
+import struct
+import threading
+import time
+
+from ringlog import get_logger
+
+log = get_logger('network')
+
+TCP_PORT = 5770
+MULTICAST_GROUP = ('239.255.42.99', 5771)
+FANOUT_RATE_HZ = 20
+
+
+def encode_message(kind, vehicle_id, sequence, values):
+    return json.dumps({'type': kind, 'vehicle': vehicle_id, 'seq': sequence, 'time': time.time(),
+                       'values': values}, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+class Subscriber:
+    __slots__ = ('sock', 'address', 'pending', 'stale', 'sent', 'coalesced')
+
+    def __init__(self, sock, address):
+        self.sock = sock
+        self.address = address
+        self.pending = None   # unsent rest of the last message
+        self.stale = True     # needs a snapshot; new subscribers start with one
+        self.sent = 0
+        self.coalesced = 0    # messages skipped while the client was behind
+
+    def write(self, data):
+        """Send as much of `data` as the socket takes; return True if all of it went out."""
+        sent = self.sock.send(data)
+        if sent < len(data):
+            self.pending = memoryview(data)[sent:]
+            return False
+        self.sent += 1
+        return True
+
+    def flush(self):
+        sent = self.sock.send(self.pending)
+        if sent < len(self.pending):
+            self.pending = self.pending[sent:]
+            return False
+        self.pending = None
+        self.sent += 1
+        return True
+
+
+class TelemetryFanout:
+    """Publishes telemetry over UDP multicast and/or TCP; see the module comment."""
+
+    def __init__(self, tcp_address=('', TCP_PORT), multicast_group=MULTICAST_GROUP, rate=FANOUT_RATE_HZ,
+                 snapshot_interval=1.0, multicast_ttl=1):
+        self.rate = rate
+        self.snapshot_interval = snapshot_interval
+        self._lock = threading.Lock()
+        self._pending = {}    # vehicle_id -> {key: value} received since the last tick
+        self._state = {}      # vehicle_id -> latest {key: value}
+        self._sequence = 0
+        self._last_snapshot = 0.0
+        self._snapshot = None
+        self.subscribers = []
+        self.messages = 0
+
+        self._selector = selectors.DefaultSelector()
+        self._server = None
+        if tcp_address is not None:
+            self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._server.bind(tcp_address)
+            self._server.listen()
+            self._server.setblocking(False)
+            self._selector.register(self._server, selectors.EVENT_READ)
+        self.multicast_group = multicast_group
+        self._udp = None
+        if multicast_group is not None:
+            self._udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+            self._udp.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, multicast_ttl)
+            self._udp.setblocking(False)
+
+        self._running = False
+        self._thread = None
+
+    @property
+    def tcp_port(self):
+        return self._server.getsockname()[1] if self._server else None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='TelemetryFanout', daemon=True)
+        self._thread.start()
+        log.info("Telemetry fan-out on TCP port %s, multicast %s", self.tcp_port, self.multicast_group)
+
+    def publish(self, vehicle_id, samples):
+        """IngestService sink: queue (key, value) samples of `vehicle_id` for the next tick."""
+        with self._lock:
+            pending = self._pending.get(vehicle_id)
+            if pending is None:
+                pending = self._pending[vehicle_id] = {}
+            pending.update(samples)
+
+    def _run(self):
+        interval = 1.0 / self.rate
+        next_tick = time.monotonic()
+        while self._running:
+            timeout = max(next_tick - time.monotonic(), 0)
+            if self._selector.get_map():
+                ready = self._selector.select(timeout)
+            else:
+                time.sleep(timeout)   # multicast only; select() needs a socket on Windows
+                ready = ()
+            for key, events in ready:
+                if key.fileobj is self._server:
+                    self._accept()
+                    continue
+                if events & selectors.EVENT_READ and not self._receive(key.data):
+                    continue
+                if events & selectors.EVENT_WRITE:
+                    self._drain(key.data)
+            now = time.monotonic()
+            if now >= next_tick:
+                self._tick(now)
+                next_tick = max(next_tick + interval, now)
+
+    def _accept(self):
+        try:
+            sock, address = self._server.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        subscriber = Subscriber(sock, address)
+        self.subscribers.append(subscriber)
+        # Registered for writability only while it has a backlog or needs its first snapshot
+        self._selector.register(sock, selectors.EVENT_READ | selectors.EVENT_WRITE, subscriber)
+        log.info("Telemetry subscriber %s:%s connected", *address[:2])
+
+    def _tick(self, now):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        deltas = []
+        for vehicle_id, values in pending.items():
+            self._state.setdefault(vehicle_id, {}).update(values)
+            self._sequence += 1
+            deltas.append(encode_message('delta', vehicle_id, self._sequence, values))
+        self.messages += len(deltas)
+        self._snapshot = None   # encoded on first use in this tick
+
+        if self._udp is not None:
+            send_snapshot = now - self._last_snapshot >= self.snapshot_interval
+            if send_snapshot:
+                self._last_snapshot = now
+            for message in self._snapshot_messages() if send_snapshot else deltas:
+                try:
+                    self._udp.sendto(message, self.multicast_group)
+                except (BlockingIOError, OSError) as e:
+                    log.debug("Multicast send failed: %s", e)
+
+        if not deltas:
+            return
+        data = b''.join(deltas)
+        for subscriber in list(self.subscribers):
+            if subscriber.pending is not None or subscriber.stale:
+                subscriber.stale = True
+                subscriber.coalesced += 1
+                continue
+            try:
+                if not subscriber.write(data):
+                    self._selector.modify(subscriber.sock, selectors.EVENT_READ | selectors.EVENT_WRITE, subscriber)
+            except OSError:
+                self._disconnect(subscriber)
+
+    def _snapshot_messages(self):
+        if self._snapshot is None:
+            self._snapshot = [encode_message('snapshot', vehicle_id, self._sequence, values)
+                              for vehicle_id, values in self._state.items()]
+        return self._snapshot
+
+    def _drain(self, subscriber):
+        # The subscriber's socket is writable again: finish its backlog, then catch it up with a snapshot
+        try:
+            if subscriber.pending is not None and not subscriber.flush():
+                return
+            if subscriber.stale:
+                subscriber.stale = False
+                if self._state and not subscriber.write(b''.join(self._snapshot_messages())):
+                    return
+        except OSError:
+            self._disconnect(subscriber)
+            return
+        self._selector.modify(subscriber.sock, selectors.EVENT_READ, subscriber)
+
+    def _receive(self, subscriber):
+        # Subscribers have nothing to say; reading only notices when they hang up
+        try:
+            data = subscriber.sock.recv(4096)
+        except BlockingIOError:
+            return True
+        except OSError:
+            data = b''
+        if not data:
+            self._disconnect(subscriber)
+            return False
+        return True
+
+    def _disconnect(self, subscriber):
+        log.info("Telemetry subscriber %s:%s disconnected", *subscriber.address[:2])
+        self.subscribers.remove(subscriber)
+        self._selector.unregister(subscriber.sock)
+        subscriber.sock.close()
+
+    def stats(self):
+        return {
+            'messages': self.messages,
+            'subscribers': [{'address': f"{s.address[0]}:{s.address[1]}", 'sent': s.sent,
+                             'coalesced': s.coalesced} for s in list(self.subscribers)],
+        }
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+        for subscriber in list(self.subscribers):
+            self._disconnect(subscriber)
+        if self._server is not None:
+            self._selector.unregister(self._server)
+            self._server.close()
+        if self._udp is not None:
+            self._udp.close()
+        self._selector.close()
+
+
+def _address(spec, default_host, default_port):
+    host, _, port = (spec or '').rpartition(':')
+    if not host and spec and not port.isdigit():
+        host, port = spec, ''
+    return host or default_host, int(port) if port else default_port
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Watch the telemetry republished by the dashboard.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--connect', metavar='HOST[:PORT]', help="subscribe over TCP")
+    source.add_argument('--multicast', metavar='GROUP[:PORT]', nargs='?', const='',
+                        help=f"join a multicast group (default {MULTICAST_GROUP[0]}:{MULTICAST_GROUP[1]})")
+    args = parser.parse_args()
+
+    try:
+        if args.connect is not None:
+            with socket.create_connection(_address(args.connect, 'localhost', TCP_PORT)) as sock:
+                for line in sock.makefile('rb'):
+                    print(line.decode('utf-8').rstrip())
+        else:
+            group, port = _address(args.multicast, *MULTICAST_GROUP)
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(('', port))
+            membership = struct.pack('4s4s', socket.inet_aton(group), socket.inet_aton('0.0.0.0'))
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+            while True:
+                print(sock.recv(65536).decode('utf-8').rstrip())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
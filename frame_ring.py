@@ -0,0 +1,403 @@
+# Camera capture in a separate process, handing frames over in shared memory.
+#
+# The capture process owns the VideoCapture. It decodes every frame straight
+# into a slot of a FrameRing, a preallocated multiprocessing.shared_memory
+# segment of `slot_count` slots, and converts it there for display as well:
+#
+#   ring header   frames published, newest slot, display size requested by
+#                 the dashboard, capture rate
+#   slot headers  sequence (odd while the slot is written), frame index,
+#                 time.monotonic() capture time, frame shape, display size,
+#                 pin count
+#   slot data     the full-resolution BGR frame, then the BGRA display image
+#
+# In the dashboard process CaptureProcess stands in for CameraThread: a
+# small thread waits for each published frame, pins its slot and puts a
+# DisplayFrame whose QImage wraps the slot's display image into the frame
+# mailbox, without copying a pixel. The capture process never writes to a
+# pinned slot; releasing the DisplayFrame unpins it. Pinning and claiming a
+# slot for writing happen under that slot's multiprocessing lock, which
+# also orders the shared-memory stores between the processes. Otherwise a
+# semaphore release per frame is all that crosses the process boundary.
+
+import multiprocessing
+import queue
+import threading
+import time
+
+import numpy as np
+from multiprocessing import shared_memory
+from PyQt5.QtGui import QImage
+
+from ringlog import get_logger
+from video import CaptureProfile, DisplayFrame, RateMeter
+
+log = get_logger('camera')
+
+RING_SLOTS = 6
+
+RING_HEADER_DTYPE = np.dtype([
+    ('published', '<u8'),         # frames published so far
+    ('latest_slot', '<u8'),
+    ('capture_rate', '<f8'),
+    ('slot_count', '<u4'),
+    ('height', '<u4'),            # full-resolution frame shape
+    ('width', '<u4'),
+    ('channels', '<u4'),
+    ('display_width', '<u4'),     # display image capacity of a slot
+    ('display_height', '<u4'),
+    ('target_width', '<u4'),      # display size requested by the dashboard
+    ('target_height', '<u4'),
+])
+
+SLOT_HEADER_DTYPE = np.dtype([
+    ('sequence', '<u8'),
+    ('frame_index', '<u8'),
+    ('timestamp', '<f8'),
+    ('height', '<u4'),
+    ('width', '<u4'),
+    ('channels', '<u4'),
+    ('display_width', '<u4'),
+    ('display_height', '<u4'),
+    ('pinned', '<u4'),            # pins held by the dashboard
+])
+
+_ALIGN = 64
+
+
+def _aligned(size):
+    return size + -size % _ALIGN
+
+
+class FrameRing:
+    """Shared-memory ring of camera frames; see the module comment for the layout.
+
+    `locks` are the per-slot locks shared by the writer and the reader; both
+    sides must be given the same ones.
+    """
+
+    def __init__(self, name=None, create=False, slot_count=RING_SLOTS, frame_shape=None, display_capacity=None,
+                 locks=None):
+        header_size = _aligned(RING_HEADER_DTYPE.itemsize)
+        if create:
+            height, width, channels = frame_shape
+            display_width, display_height = display_capacity
+            raw_size = _aligned(height * width * channels)
+            slot_size = raw_size + _aligned(display_width * display_height * 4)
+            size = header_size + _aligned(SLOT_HEADER_DTYPE.itemsize * slot_count) + slot_size * slot_count
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+            self.header = np.ndarray((), RING_HEADER_DTYPE, buffer=self._shm.buf)
+            self.header[()] = 0
+            self.header[()] = (0, 0, 0.0, slot_count, height, width, channels, display_width, display_height,
+                               display_width, display_height)
+        else:
+            self._shm = shared_memory.SharedMemory(name)
+            self.header = np.ndarray((), RING_HEADER_DTYPE, buffer=self._shm.buf)
+        self.name = self._shm.name
+        self._owner = create
+
+        header = self.header
+        self.slot_count = int(header['slot_count'])
+        # Without shared locks (one process only) the ring makes its own
+        self._locks = locks if locks is not None else [multiprocessing.Lock() for _ in range(self.slot_count)]
+        self.frame_shape = (int(header['height']), int(header['width']), int(header['channels']))
+        self.display_capacity = (int(header['display_width']), int(header['display_height']))
+        raw_size = _aligned(int(np.prod(self.frame_shape)))
+        display_size = _aligned(self.display_capacity[0] * self.display_capacity[1] * 4)
+        self.slots = np.ndarray((self.slot_count,), SLOT_HEADER_DTYPE, buffer=self._shm.buf, offset=header_size)
+        data_offset = header_size + _aligned(SLOT_HEADER_DTYPE.itemsize * self.slot_count)
+        self._frames = []
+        self._display = []
+        for slot in range(self.slot_count):
+            offset = data_offset + slot * (raw_size + display_size)
+            self._frames.append(np.ndarray(self.frame_shape, np.uint8, buffer=self._shm.buf, offset=offset))
+            self._display.append(np.ndarray(display_size, np.uint8, buffer=self._shm.buf, offset=offset + raw_size))
+
+    def frame(self, slot):
+        """NumPy view of the full-resolution BGR frame in `slot`."""
+        return self._frames[slot]
+
+    def display(self, slot, width, height):
+        """NumPy view of the (height, width, 4) BGRA display image in `slot`."""
+        return self._display[slot][:width * height * 4].reshape(height, width, 4)
+
+    def display_size(self, width, height):
+        """The requested display size, shrunk to fit a slot if it is larger, keeping the aspect ratio."""
+        capacity_width, capacity_height = self.display_capacity
+        scale = min(1.0, capacity_width / width, capacity_height / height) if width and height else 0
+        if not scale:
+            return capacity_width, capacity_height
+        return max(int(width * scale), 1), max(int(height * scale), 1)
+
+    # Writer (capture process)
+
+    def begin_write(self, after):
+        """Claim the next unpinned slot after slot `after`; return it with its sequence made odd."""
+        slots = self.slots
+        for step in range(1, self.slot_count + 1):
+            slot = (after + step) % self.slot_count
+            with self._locks[slot]:
+                if slots['pinned'][slot]:
+                    continue
+                slots['sequence'][slot] += 1
+            return slot
+        return None
+
+    def abort(self, slot):
+        """Give up a slot claimed by begin_write() without publishing it."""
+        with self._locks[slot]:
+            self.slots['sequence'][slot] += 1
+
+    def commit(self, slot, frame_index, timestamp, display_size):
+        entry = self.slots[slot]
+        entry['frame_index'] = frame_index
+        entry['timestamp'] = timestamp
+        entry['height'], entry['width'], entry['channels'] = self.frame_shape
+        entry['display_width'], entry['display_height'] = display_size
+        with self._locks[slot]:
+            entry['sequence'] += 1   # even: complete
+        self.header['latest_slot'] = slot
+        self.header['published'] = frame_index + 1
+
+    # Reader (dashboard)
+
+    def pin(self, slot, frame_index):
+        """Pin `slot` if it still holds `frame_index` complete; return whether it does.
+
+        Pins nest: the slot stays pinned until every pin has been released.
+        """
+        slots = self.slots
+        with self._locks[slot]:
+            sequence = int(slots['sequence'][slot])
+            if not sequence or sequence & 1 or int(slots['frame_index'][slot]) != frame_index:
+                return False
+            slots['pinned'][slot] += 1
+        return True
+
+    def unpin(self, slot):
+        with self._locks[slot]:
+            self.slots['pinned'][slot] -= 1
+
+    release = unpin   # DisplayFrame hands its slot back through pool.release()
+
+    def find(self, frame_index):
+        """Slot still holding `frame_index`, or None once it has been overwritten."""
+        matches = np.flatnonzero(self.slots['frame_index'] == frame_index)
+        for slot in matches:
+            sequence = int(self.slots['sequence'][slot])
+            if sequence and not sequence & 1:   # 0: never written
+                return int(slot)
+        return None
+
+    def close(self):
+        self.header = self.slots = None
+        self._frames = self._display = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+def _run_capture(camera_port, profile, slot_locks, target_size, commands, replies, frame_ready):
+    """Capture process: read frames into a FrameRing until told to stop."""
+    from video import convert_frame, negotiated_settings
+
+    cap = profile.open(camera_port)
+    negotiated = negotiated_settings(cap)
+    replies.put(('opened', negotiated))
+
+    def stopped():
+        try:
+            return commands.get_nowait() == 'stop'
+        except queue.Empty:
+            return False
+
+    # The first frame decides the slot size
+    ret, frame = cap.read()
+    while not ret:
+        if stopped():
+            cap.release()
+            return
+        time.sleep(0.05)
+        ret, frame = cap.read()
+
+    display_capacity = (max(target_size[0], frame.shape[1]), max(target_size[1], frame.shape[0]))
+    slot_count = len(slot_locks)
+    ring = FrameRing(create=True, slot_count=slot_count, frame_shape=frame.shape, display_capacity=display_capacity,
+                     locks=slot_locks)
+    ring.header['target_width'], ring.header['target_height'] = target_size
+    replies.put(('ring', ring.name))
+
+    capture_rate = RateMeter()
+    scratch = None
+    slot = slot_count - 1
+    frame_index = 0
+    try:
+        while not stopped():
+            next_slot = ring.begin_write(slot)
+            if next_slot is None:
+                time.sleep(0.005)   # every slot pinned; the dashboard lets go within a display tick
+                continue
+            slot = next_slot
+            view = ring.frame(slot)
+            if frame is not None:
+                view[...] = frame   # the first frame, read before the ring existed
+                frame = None
+                ret = True
+            else:
+                # Decodes into shared memory directly when the shape matches
+                ret, read = cap.read(view)
+                if ret and read is not view:
+                    if read.shape != view.shape:
+                        log.error("Camera frame size changed from %s to %s", view.shape, read.shape)
+                        break
+                    view[...] = read
+            timestamp = time.monotonic()
+            if not ret:
+                ring.abort(slot)
+                time.sleep(0.05)
+                continue
+            size = ring.display_size(int(ring.header['target_width']), int(ring.header['target_height']))
+            scratch = convert_frame(view, size, ring.display(slot, *size), scratch)
+            ring.commit(slot, frame_index, timestamp, size)
+            frame_index += 1
+            frame_ready.release()
+            capture_rate.tick()
+            ring.header['capture_rate'] = capture_rate.rate
+    finally:
+        cap.release()
+        view = None   # no view may outlive the mapping
+        # Unlinking only removes the name, the dashboard's mapping stays valid
+        ring.close()
+
+
+class _CaptureRate:
+    """RateMeter look-alike reading the rate the capture process measured."""
+
+    def __init__(self):
+        self.ring = None
+
+    @property
+    def rate(self):
+        return float(self.ring.header['capture_rate']) if self.ring is not None else 0.0
+
+
+class CaptureProcess:
+    """Drop-in for CameraThread that captures in a separate process into a FrameRing.
+
+    Display frames go to `mailbox` as DisplayFrames backed by ring slots;
+    while `video_recorder` and `snapshots` are set, every full-resolution
+    frame still in the ring is submitted to them.
+    """
+
+    def __init__(self, camera_port=0, mailbox=None, profile=None, slot_count=RING_SLOTS):
+        self.camera_port = camera_port
+        self.mailbox = mailbox
+        self.profile = profile or CaptureProfile()
+        self.slot_count = slot_count
+        self.negotiated = {}
+        self.capture_rate = _CaptureRate()
+        self.video_recorder = None
+        self.snapshots = None
+        self.recording_missed = 0   # frames overwritten before they could be submitted for recording
+        self.ring = None
+        self.target_size = (0, 0)
+        self.running = False
+
+        context = multiprocessing.get_context('spawn')
+        self._commands = context.Queue()
+        self._replies = context.Queue()
+        self._frame_ready = context.Semaphore(0)
+        self._slot_locks = [context.Lock() for _ in range(slot_count)]
+        self._context = context
+        self._process = None
+        self._thread = None
+
+    def set_target_size(self, width, height):
+        self.target_size = (width, height)
+        if self.ring is not None:
+            self.ring.header['target_width'], self.ring.header['target_height'] = width, height
+
+    def start(self):
+        self.running = True
+        # The display size at start decides the slot size, later changes go through the ring header
+        self._process = self._context.Process(
+            target=_run_capture, name='CaptureProcess',
+            args=(self.camera_port, self.profile, self._slot_locks, self.target_size, self._commands, self._replies,
+                  self._frame_ready))
+        self._process.start()
+        self._thread = threading.Thread(target=self._follow, name='CaptureFollower', daemon=True)
+        self._thread.start()
+
+    def _follow(self):
+        # Wait for the capture process to open the camera and create the ring
+        while self.running and self.ring is None:
+            try:
+                kind, value = self._replies.get(timeout=0.2)
+            except queue.Empty:
+                if not self._process.is_alive():
+                    return
+                continue
+            if kind == 'opened':
+                self.negotiated = value
+                log.info("Camera %s: requested %s, negotiated %s (capture process)",
+                         self.camera_port, self.profile, value)
+            elif kind == 'ring':
+                self.ring = FrameRing(value, locks=self._slot_locks)
+                self.ring.header['target_width'], self.ring.header['target_height'] = self.target_size
+                self.capture_rate.ring = self.ring
+        next_index = 0
+        while self.running:
+            if not self._frame_ready.acquire(timeout=0.2):
+                continue
+            while self._frame_ready.acquire(block=False):
+                pass   # several frames arrived: the newest one is shown, all of them recorded
+            ring = self.ring
+            latest = int(ring.header['published']) - 1
+            if self.video_recorder is not None or self.snapshots is not None:
+                self._record(ring, next_index, latest)
+            next_index = latest + 1
+            if self.mailbox is not None:
+                self._show(ring, latest)
+
+    def _record(self, ring, first, last):
+        video_recorder, snapshots = self.video_recorder, self.snapshots
+        for frame_index in range(max(first, last - ring.slot_count + 1), last + 1):
+            slot = ring.find(frame_index)
+            if slot is None or not ring.pin(slot, frame_index):
+                if video_recorder is not None:
+                    self.recording_missed += 1
+                continue
+            try:
+                frame, timestamp = ring.frame(slot), float(ring.slots['timestamp'][slot])
+                if video_recorder is not None:
+                    video_recorder.submit(frame, timestamp)
+                if snapshots is not None:
+                    snapshots.add(frame, timestamp)
+            finally:
+                ring.unpin(slot)
+
+    def _show(self, ring, frame_index):
+        slot = int(ring.header['latest_slot'])
+        if not ring.pin(slot, frame_index):
+            return   # already overwritten; the next frame is on its way
+        entry = ring.slots[slot]
+        width, height = int(entry['display_width']), int(entry['display_height'])
+        view = ring.display(slot, width, height)
+        image = QImage(view.data, width, height, width * 4, QImage.Format_RGB32)
+        replaced = self.mailbox.put(DisplayFrame(image, slot, ring))
+        if replaced is not None:
+            replaced.release()
+
+    def stop(self):
+        self.running = False
+        log.info("CaptureProcess stopping")
+        if self._process is None:
+            return
+        if self._process.is_alive():
+            self._commands.put('stop')
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+        self._process.join(timeout=3.0)
+        if self._process.is_alive():
+            self._process.terminate()
+        # The ring stays mapped here: the label's pixmap may still show a slot until the window is gone
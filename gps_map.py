@@ -0,0 +1,447 @@
+# Offline map of the GPS track.
+#
+# Raster tiles come from a local tile directory (<dir>/<z>/<x>/<y>.png, as
+# written by most tile downloaders) or an MBTiles file. No network access.
+# A TileLoader thread reads and decodes them into QImages, newest request
+# first; the GUI turns each into a QPixmap once and keeps the most recently
+# drawn TILE_CACHE_SIZE of them in an LRU.
+#
+# GpsTrack keeps every fix in growable NumPy arrays of Web Mercator
+# coordinates. Points are simplified with Douglas-Peucker in chunks of
+# TRACK_CHUNK as they arrive, each chunk starting where the previous one
+# ended, so a fix costs amortized O(1) and earlier chunks are never looked at
+# again. A repaint projects the simplified track plus the unsimplified tail
+# and drops points that land on the same pixel as their predecessor, so
+# drawing a 100k-fix flight stays a matter of milliseconds.
+
+import math
+import os
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+
+import numpy as np
+from PyQt5.QtCore import QPointF, QRectF, Qt, QThread, QTimer, pyqtSignal
+from PyQt5.QtGui import QColor, QFont, QImage, QPainter, QPen, QPixmap
+from PyQt5.QtWidgets import QWidget
+
+from ringlog import get_logger
+from strip_chart import make_polygon
+
+log = get_logger('ui')
+
+MAP_TILES = 'tiles'        # default tile directory or .mbtiles file
+TILE_SIZE = 256
+TILE_CACHE_SIZE = 192      # decoded tiles kept, 256 KB each
+MIN_ZOOM = 1
+MAX_ZOOM = 19
+DEFAULT_ZOOM = 16
+TRACK_CHUNK = 256          # fixes simplified together
+TRACK_TOLERANCE = 0.5      # metres a simplified track may deviate from the fixes
+STROKE_POINTS = 64         # track points per drawPolyline()
+MAP_RATE_HZ = 5
+EARTH_CIRCUMFERENCE = 40075016.686
+
+
+def mercator(latitude, longitude):
+    """Web Mercator (x, y) in [0, 1) of degrees; works on scalars and arrays."""
+    x = (np.asarray(longitude, np.float64) + 180.0) / 360.0
+    sin = np.sin(np.radians(np.clip(latitude, -85.0511, 85.0511)))
+    y = 0.5 - np.log((1 + sin) / (1 - sin)) / (4 * math.pi)
+    return x, y
+
+
+def _mercator_point(latitude, longitude):
+    # mercator() for one fix, without NumPy's per-call overhead
+    sin = math.sin(math.radians(min(max(latitude, -85.0511), 85.0511)))
+    return (longitude + 180.0) / 360.0, 0.5 - math.log((1 + sin) / (1 - sin)) / (4 * math.pi)
+
+
+def douglas_peucker(x, y, tolerance):
+    """Indices of the points of the polyline (x, y) kept by Douglas-Peucker at `tolerance`."""
+    count = len(x)
+    keep = np.zeros(count, bool)
+    keep[0] = keep[count - 1] = True
+    stack = [(0, count - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        dx, dy = x[last] - x[first], y[last] - y[first]
+        px, py = x[first + 1:last] - x[first], y[first + 1:last] - y[first]
+        norm = math.hypot(dx, dy)
+        distance = np.abs(px * dy - py * dx) / norm if norm else np.hypot(px, py)
+        index = int(distance.argmax())
+        if distance[index] > tolerance:
+            index += first + 1
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return np.flatnonzero(keep)
+
+
+class _Points:
+    """Growable (x, y) arrays, doubled when full."""
+
+    def __init__(self, capacity=1024):
+        self.x = np.empty(capacity)
+        self.y = np.empty(capacity)
+        self.count = 0
+
+    def extend(self, x, y):
+        needed = self.count + len(x)
+        if needed > len(self.x):
+            capacity = max(needed, 2 * len(self.x))
+            self.x = np.resize(self.x, capacity)
+            self.y = np.resize(self.y, capacity)
+        self.x[self.count:needed] = x
+        self.y[self.count:needed] = y
+        self.count = needed
+
+
+class GpsTrack:
+    """All fixes of one vehicle plus their incrementally simplified polyline."""
+
+    def __init__(self, tolerance=TRACK_TOLERANCE, chunk=TRACK_CHUNK):
+        self.tolerance = tolerance
+        self.chunk = chunk
+        self._lock = threading.Lock()
+        self._fixes = _Points()
+        self._simplified = _Points()
+        self._anchor = 0            # first fix of the chunk not simplified yet
+        self._units = None          # tolerance in mercator units, set from the first fix
+        self.latest = None          # (latitude, longitude)
+
+    def add(self, latitude, longitude):
+        x, y = _mercator_point(latitude, longitude)
+        with self._lock:
+            self.latest = (latitude, longitude)
+            fixes = self._fixes
+            if fixes.count and fixes.x[fixes.count - 1] == x and fixes.y[fixes.count - 1] == y:
+                return   # hovering: the track does not move
+            if self._units is None:
+                self._units = self.tolerance / (EARTH_CIRCUMFERENCE * math.cos(math.radians(latitude)))
+                self._simplified.extend((x,), (y,))
+            fixes.extend((x,), (y,))
+            if fixes.count - self._anchor > self.chunk:
+                self._simplify()
+
+    def _simplify(self):
+        # The chunk's first fix is the previous chunk's last kept point, already in _simplified
+        first, last = self._anchor, self._fixes.count
+        x, y = self._fixes.x[first:last], self._fixes.y[first:last]
+        kept = douglas_peucker(x, y, self._units)[1:]
+        self._simplified.extend(x[kept], y[kept])
+        self._anchor = last - 1
+
+    def points(self):
+        """Copies of the (x, y) mercator coordinates to draw: the simplified track and the newest fixes."""
+        with self._lock:
+            simplified, fixes = self._simplified, self._fixes
+            if not fixes.count:
+                return np.empty(0), np.empty(0)
+            start = self._anchor + 1
+            return (np.concatenate((simplified.x[:simplified.count], fixes.x[start:fixes.count])),
+                    np.concatenate((simplified.y[:simplified.count], fixes.y[start:fixes.count])))
+
+    @property
+    def fix_count(self):
+        return self._fixes.count
+
+
+class VehicleTracks:
+    """A GpsTrack per vehicle; publish() has the IngestService sink signature."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tracks = {}
+        self._positions = {}   # vehicle_id -> [latitude, longitude] of the fix being received
+
+    def track(self, vehicle_id):
+        track = self._tracks.get(vehicle_id)
+        if track is None:
+            with self._lock:
+                track = self._tracks.setdefault(vehicle_id, GpsTrack())
+        return track
+
+    def publish(self, vehicle_id, samples):
+        # A chunk may hold several fixes, or end halfway through one: a fix is
+        # recorded whenever both of its coordinates have arrived
+        position = self._positions.get(vehicle_id)
+        for key, value in samples:
+            if key == 'Latitude' or key == 'Longitude':
+                if position is None:
+                    position = self._positions[vehicle_id] = [None, None]
+                try:
+                    position[key == 'Longitude'] = float(value)
+                except (TypeError, ValueError):
+                    continue
+                if position[0] is not None and position[1] is not None:
+                    self.record(vehicle_id, *position)
+                    position[0] = position[1] = None
+
+    def record(self, vehicle_id, latitude, longitude):
+        # 0, 0 is what the firmware sends before the first fix
+        if latitude is None or longitude is None or (latitude == 0 and longitude == 0):
+            return
+        if -90 <= latitude <= 90 and -180 <= longitude <= 180:
+            self.track(vehicle_id).add(latitude, longitude)
+
+
+class TileDirectory:
+    """Tiles stored as <path>/<z>/<x>/<y>.<extension>."""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(os.path.normpath(path))
+
+    def read(self, zoom, x, y):
+        for extension in ('png', 'jpg', 'jpeg', 'webp'):
+            try:
+                with open(os.path.join(self.path, str(zoom), str(x), f"{y}.{extension}"), 'rb') as file:
+                    return file.read()
+            except OSError:
+                continue
+        return None
+
+    def close(self):
+        pass
+
+
+class MBTilesSource:
+    """Tiles of an MBTiles (SQLite) file; rows are numbered from the south (TMS)."""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
+        self._connection = None   # opened by the loader thread, the one that reads
+
+    def read(self, zoom, x, y):
+        if self._connection is None:
+            self._connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        row = self._connection.execute(
+            "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+            (zoom, x, (1 << zoom) - 1 - y)).fetchone()
+        return row[0] if row else None
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+
+
+def open_tile_source(path):
+    """TileDirectory or MBTilesSource for `path`, None if it does not exist."""
+    if path and os.path.isdir(path):
+        return TileDirectory(path)
+    if path and os.path.isfile(path):
+        return MBTilesSource(path)
+    return None
+
+
+class TileLoader(QThread):
+    """Reads and decodes tiles in the background, most recent request first."""
+
+    tile_loaded = pyqtSignal(tuple, QImage)   # (zoom, x, y), null image if the source has no such tile
+
+    def __init__(self, source, max_pending=64):
+        super().__init__()
+        self.source = source
+        self.max_pending = max_pending
+        self._condition = threading.Condition()
+        self._pending = deque()
+        self._running = True
+
+    def request(self, key):
+        """Queue `key` for loading; return the key dropped to make room, if any."""
+        dropped = None
+        with self._condition:
+            if key in self._pending:
+                return None
+            self._pending.append(key)
+            if len(self._pending) > self.max_pending:
+                dropped = self._pending.popleft()   # scrolled past long ago
+            self._condition.notify()
+        return dropped
+
+    def run(self):
+        while True:
+            with self._condition:
+                while self._running and not self._pending:
+                    self._condition.wait()
+                if not self._running:
+                    break
+                key = self._pending.pop()
+            try:
+                data = self.source.read(*key)
+            except (OSError, sqlite3.Error) as e:
+                log.warning("Cannot read map tile %s: %s", key, e)
+                data = None
+            image = QImage()
+            if data is not None and not image.loadFromData(data):
+                log.warning("Cannot decode map tile %s", key)
+            if not image.isNull():
+                image = image.convertToFormat(QImage.Format_ARGB32_Premultiplied)
+            self.tile_loaded.emit(key, image)
+        self.source.close()
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        self.wait()
+
+
+class MapPanel(QWidget):
+    """Window with the selected vehicle's track over the offline tiles.
+
+    Follows the vehicle until dragged; double-click to follow again, wheel to zoom.
+    """
+
+    def __init__(self, tile_path=MAP_TILES, parent=None):
+        super().__init__(parent, Qt.Window)
+        self.setWindowTitle("GPS Map")
+        self.resize(800, 600)
+        self.setAttribute(Qt.WA_OpaquePaintEvent)
+        self.track = None
+        self.zoom = DEFAULT_ZOOM
+        self.center = None          # mercator (x, y) while not following
+        self.follow = True
+        self._drag_start = None
+        self._font = QFont("Arial Narrow", 10)
+        self.tiles = OrderedDict()  # (zoom, x, y) -> QPixmap, or None where the source has no tile
+        self._requested = set()
+
+        self.source = open_tile_source(tile_path)
+        self.loader = None
+        if self.source is None:
+            log.warning("No map tiles at %s, drawing the track on a grid", tile_path)
+        else:
+            log.info("Map tiles from %s", tile_path)
+            self.loader = TileLoader(self.source)
+            self.loader.tile_loaded.connect(self.add_tile)
+            self.loader.start()
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.update)
+        self.timer.start(int(1000 / MAP_RATE_HZ))
+
+    def set_track(self, track):
+        self.track = track
+        self.follow = True
+        self.update()
+
+    def add_tile(self, key, image):
+        self._requested.discard(key)
+        self.tiles[key] = QPixmap.fromImage(image) if not image.isNull() else None
+        while len(self.tiles) > TILE_CACHE_SIZE:
+            self.tiles.popitem(last=False)
+        if key[0] == self.zoom:
+            self.update()
+
+    def _tile(self, key):
+        if key in self.tiles:
+            self.tiles.move_to_end(key)
+            return self.tiles[key]
+        if self.loader is not None and key not in self._requested:
+            self._requested.add(key)
+            dropped = self.loader.request(key)
+            if dropped is not None:
+                self._requested.discard(dropped)   # asked for again if it comes back into view
+        return None
+
+    def _center(self):
+        if self.follow and self.track is not None and self.track.latest is not None:
+            x, y = mercator(*self.track.latest)
+            return float(x), float(y)
+        if self.center is not None:
+            return self.center
+        return 0.5, 0.5
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor('#101010'))
+        width, height = self.width(), self.height()
+        scale = TILE_SIZE * (1 << self.zoom)   # world size in pixels
+        center_x, center_y = self._center()
+        left, top = center_x * scale - width / 2, center_y * scale - height / 2
+
+        # Tiles, or a tile grid where there are none
+        tile_count = 1 << self.zoom
+        painter.setPen(QPen(QColor('#2a2a2a')))
+        for tile_y in range(max(int(top // TILE_SIZE), 0), min(int((top + height) // TILE_SIZE) + 1, tile_count)):
+            for tile_x in range(int(left // TILE_SIZE), int((left + width) // TILE_SIZE) + 1):
+                pixmap = self._tile((self.zoom, tile_x % tile_count, tile_y))
+                position = QPointF(tile_x * TILE_SIZE - left, tile_y * TILE_SIZE - top)
+                if pixmap is not None:
+                    painter.drawPixmap(position, pixmap)
+                else:
+                    painter.drawRect(QRectF(position.x(), position.y(), TILE_SIZE, TILE_SIZE))
+
+        fixes = 0
+        if self.track is not None:
+            fixes = self.track.fix_count
+            xs, ys = self.track.points()
+            if len(xs):
+                xs = np.rint(xs * scale - left)
+                ys = np.rint(ys * scale - top)
+                # One point per pixel: consecutive points on the same pixel add nothing
+                moved = np.ones(len(xs), bool)
+                moved[1:] = (np.diff(xs) != 0) | (np.diff(ys) != 0)
+                xs, ys = xs[moved], ys[moved]
+                painter.setRenderHint(QPainter.Antialiasing)
+                painter.setPen(QPen(QColor('#ff00ff'), 3))
+                # Stroked in short pieces: one wide antialiased path that crosses itself costs
+                # several times more than the same path in pieces
+                for first in range(0, len(xs) - 1, STROKE_POINTS):
+                    last = first + STROKE_POINTS + 1
+                    painter.drawPolyline(make_polygon(xs[first:last], ys[first:last]))
+                painter.setPen(QPen(Qt.black, 2))
+                painter.setBrush(Qt.cyan)
+                painter.drawEllipse(QPointF(xs[-1], ys[-1]), 7, 7)
+
+        painter.setFont(self._font)
+        painter.setPen(Qt.cyan)
+        latest = self.track.latest if self.track is not None else None
+        position = f"{latest[0]:.6f}, {latest[1]:.6f}" if latest else "no fix"
+        tiles = self.source.name if self.source else "no tiles"
+        painter.drawText(QRectF(8, 4, width - 16, 20), Qt.AlignLeft | Qt.AlignVCenter,
+                         f"{position}   zoom {self.zoom}   {fixes} fixes   {tiles}"
+                         f"{'' if self.follow else '   (double-click to follow)'}")
+
+    def wheelEvent(self, event):
+        zoom = min(max(self.zoom + (1 if event.angleDelta().y() > 0 else -1), MIN_ZOOM), MAX_ZOOM)
+        if zoom != self.zoom:
+            self.zoom = zoom
+            self.update()
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            self._drag_start = (event.pos(), self._center())
+
+    def mouseMoveEvent(self, event):
+        if self._drag_start is None:
+            return
+        start, (center_x, center_y) = self._drag_start
+        scale = TILE_SIZE * (1 << self.zoom)
+        delta = event.pos() - start
+        self.follow = False
+        self.center = (center_x - delta.x() / scale, min(max(center_y - delta.y() / scale, 0.0), 1.0))
+        self.update()
+
+    def mouseReleaseEvent(self, event):
+        self._drag_start = None
+
+    def mouseDoubleClickEvent(self, event):
+        self.follow = True
+        self.update()
+
+    def closeEvent(self, event):
+        # Only hidden: the panel keeps its tiles and position for the next time it is opened
+        self.hide()
+        event.ignore()
+
+    def shutdown(self):
+        self.hide()
+        self.timer.stop()
+        if self.loader is not None:
+            self.loader.stop()
@@ -0,0 +1,266 @@
+# Single-threaded telemetry ingest for several vehicles at once.
+#
+# IngestService owns one VehicleLink per serial port and waits on all of
+# them with a selector, so any number of vehicles costs one thread that
+# sleeps while every link is idle. Each link has its own reader, decoder
+# and TelemetryStore: decoded samples are tagged with the link's vehicle ID
+# and routed to that vehicle's store, its FlightRecorder and an optional
+# sink callback. The dashboard shows one store at a time and can switch
+# between them without touching the ports.
+#
+# Serial handles cannot be registered with a selector on Windows. There the
+# same thread checks in_waiting of every port and sleeps `poll_interval`
+# after a pass that found nothing.
+
+import os
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+
+import serial
+
+from ringlog import get_logger
+from serial_reader import SerialLineReader
+from telemetry import TelemetryDecoder
+from telemetry_store import TelemetryStore
+from tracing import tracer
+
+log = get_logger('ingest')
+
+SELECTABLE_PORTS = os.name == 'posix'
+
+
+def parse_vehicle(spec, baudrate=9600):
+    """Parse "ID=PORT[@BAUD]" (or just "PORT", which is then also the ID) into (id, port, baudrate)."""
+    vehicle_id, _, port = spec.rpartition('=')
+    port, _, baud = port.partition('@')
+    if not port:
+        raise ValueError(f"no port in vehicle {spec!r}")
+    return vehicle_id or port, port, int(baud) if baud else baudrate
+
+
+class VehicleLink:
+    """One vehicle's serial port, decoder and telemetry store.
+
+    The link owns `recorder` and closes it together with the port.
+    """
+
+    def __init__(self, vehicle_id, port, baudrate=9600, protocol='auto', store=None, recorder=None):
+        self.vehicle_id = vehicle_id
+        self.port = port
+        self.baudrate = baudrate
+        self.protocol = protocol
+        self.store = store if store is not None else TelemetryStore()
+        self.recorder = recorder
+        self.decoder = TelemetryDecoder()
+        self.ser = None
+        self.reader = None
+        self.error = None
+        self.failed_at = None   # time.monotonic() of the error
+        self.closed = False     # set once the ingest thread has let go of the link
+
+    def open(self):
+        # timeout=0: reads return what is buffered, waiting is the selector's job
+        self.ser = serial.Serial(self.port, self.baudrate, timeout=0)
+        self.reader = SerialLineReader(self.ser, protocol=self.protocol)
+
+    def fileno(self):
+        return self.ser.fileno()
+
+    @property
+    def in_waiting(self):
+        return self.ser.in_waiting
+
+    def poll(self):
+        """Decode everything buffered on the port into the store; return the (key, value) samples."""
+        records = self.reader.read_records()
+        if not records:
+            return []
+        received_at = time.monotonic()
+        # bytes_received: when the read returned, before the chunk was split into records
+        trace = tracer.start('telemetry', self.reader.read_at) if tracer.enabled else None
+        samples = []
+        decode_line = self.decoder.decode_line
+        for record in records:
+            if isinstance(record, tuple):
+                samples.extend(record[1].items())   # binary frame: a whole cycle
+                continue
+            decoded = decode_line(record)
+            if decoded is not None:
+                samples.append((decoded[0].key, decoded[1]))
+        if trace is not None:
+            trace.mark()   # line_decoded
+        if samples:
+            self.store.update(dict(samples), trace)   # the store marks signal_emitted
+            if self.recorder is not None:
+                self.recorder.record_many(samples, received_at)
+        return samples
+
+    def stats(self):
+        stats = self.reader.stats() if self.reader else {}
+        stats.update(self.decoder.stats())
+        stats.update(vehicle_id=self.vehicle_id, port=self.port, baudrate=self.baudrate, error=self.error)
+        return stats
+
+    def close(self):
+        if self.ser is not None:
+            self.ser.close()
+        if self.recorder is not None:
+            self.recorder.close()
+        self.closed = True
+
+
+class IngestService:
+    """Reads every VehicleLink from one background thread.
+
+    `sink`, if given, is called on the ingest thread as
+    sink(vehicle_id, samples) for every chunk of decoded samples; add_sink()
+    adds more.
+    """
+
+    def __init__(self, sink=None, poll_interval=0.005):
+        self.sinks = [sink] if sink is not None else []
+        self.poll_interval = poll_interval
+        self.links = {}
+        self._changes = deque()   # ('add' | 'remove', link), applied by the ingest thread
+        self._active = []         # links being read; owned by the ingest thread once it runs
+        self._selector = selectors.DefaultSelector() if SELECTABLE_PORTS else None
+        self._wake_receive, self._wake_send = socket.socketpair()
+        self._wake_receive.setblocking(False)
+        if self._selector is not None:
+            self._selector.register(self._wake_receive, selectors.EVENT_READ)
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='IngestService', daemon=True)
+        self._thread.start()
+
+    def add_sink(self, sink):
+        # Replaced, not appended to: the ingest thread may be iterating the old list
+        self.sinks = self.sinks + [sink]
+
+    def add_vehicle(self, vehicle_id, port, baudrate=9600, protocol='auto', recorder=None, recorder_path=None,
+                    store=None):
+        """Open `port` for `vehicle_id` and start reading it; return its VehicleLink.
+
+        Samples are logged to `recorder`, or to a new FlightRecorder at
+        `recorder_path`. Raises serial.SerialException if the port cannot be
+        opened. A vehicle that is already connected is disconnected first.
+        """
+        if vehicle_id in self.links:
+            self.remove_vehicle(vehicle_id)
+        link = VehicleLink(vehicle_id, port, baudrate, protocol, store, recorder)
+        try:
+            link.open()
+        except serial.SerialException:
+            if recorder is not None:
+                recorder.close()
+            raise
+        if recorder is None and recorder_path is not None:
+            # Only now: reconnect attempts on a missing port leave no empty recordings behind
+            from recorder import FlightRecorder
+
+            link.recorder = FlightRecorder(recorder_path)
+        self.links[vehicle_id] = link
+        self._apply('add', link)
+        log.info("Vehicle %s connected on %s at %s baud", vehicle_id, port, baudrate)
+        return link
+
+    def remove_vehicle(self, vehicle_id):
+        link = self.links.pop(vehicle_id, None)
+        if link is not None:
+            self._apply('remove', link)
+            log.info("Vehicle %s disconnected", vehicle_id)
+
+    def store(self, vehicle_id):
+        return self.links[vehicle_id].store
+
+    def stats(self):
+        return {vehicle_id: link.stats() for vehicle_id, link in list(self.links.items())}
+
+    def _apply(self, action, link):
+        if self._thread is None or not self._thread.is_alive():
+            # Not running (yet): nothing is reading the links, apply right here
+            self._change(action, link)
+            return
+        self._changes.append((action, link))
+        self._wake()
+
+    def _wake(self):
+        # Interrupt select(); the polling loop picks up changes on its next pass anyway
+        if self._selector is not None:
+            self._wake_send.send(b'\0')
+
+    def _change(self, action, link):
+        if action == 'add':
+            if self._selector is not None:
+                self._selector.register(link, selectors.EVENT_READ)
+            self._active.append(link)
+        elif link in self._active:
+            if self._selector is not None:
+                self._selector.unregister(link)
+            self._active.remove(link)
+            link.close()
+
+    def _run(self):
+        while self._running:
+            while self._changes:
+                self._change(*self._changes.popleft())
+            if self._selector is not None:
+                ready = [key.fileobj for key, _ in self._selector.select(1.0)]
+            else:
+                ready = [link for link in self._active if self._waiting(link)]
+                if not ready:
+                    time.sleep(self.poll_interval)
+            for link in ready:
+                if link is self._wake_receive:
+                    try:
+                        link.recv(4096)
+                    except BlockingIOError:
+                        pass
+                    continue
+                self._poll(link)
+        for link in list(self._active):
+            self._change('remove', link)
+
+    def _waiting(self, link):
+        try:
+            return link.in_waiting > 0
+        except (serial.SerialException, OSError) as e:
+            self._fail(link, e)
+            return False
+
+    def _poll(self, link):
+        if link.error is not None:
+            return
+        try:
+            samples = link.poll()
+        except (serial.SerialException, OSError) as e:
+            self._fail(link, e)
+            return
+        if samples:
+            for sink in self.sinks:
+                sink(link.vehicle_id, samples)
+
+    def _fail(self, link, error):
+        # The port went away (e.g. unplugged): stop reading it, keep its store for display
+        log.error("Vehicle %s: serial error on %s: %s", link.vehicle_id, link.port, error)
+        link.error = str(error)
+        link.failed_at = time.monotonic()
+        self._changes.append(('remove', link))
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._wake()
+            self._thread.join(timeout=2.0)
+        else:
+            for link in list(self._active):
+                self._change('remove', link)
+        self.links.clear()
+        self._wake_send.close()
+        self._wake_receive.close()
@@ -1,101 +1,224 @@
+from startup import collect_style_sheets, merged_style_sheet, startup_timer   # first: times the imports below
+import argparse
+import logging
+import os
 import sys
 import serial   # for Arduino Python communication
-import serial.tools.list_ports
-import cv2      # for real-time camera feed using OpenCV
 import time
-from PyQt5.QtCore import QThread, pyqtSignal, QTimer
-from PyQt5.QtGui import QImage, QPixmap
-from PyQt5.QtWidgets import QApplication, QMainWindow, QFileDialog, QLabel, QLCDNumber, QFileDialog
+from PyQt5.QtCore import QThread, pyqtSignal, QTimer, QRect
+from PyQt5.QtGui import QPixmap, QKeySequence
+from PyQt5.QtWidgets import QApplication, QMainWindow, QLabel, QLCDNumber, QComboBox, QShortcut
+from PyQt5.QtWidgets import QPushButton
 from drone import Ui_DroneDashboard
+from telemetry import TELEMETRY_SCHEMA
+from telemetry_store import TelemetryStore
+from video import CaptureProfile, FrameMailbox, FrameScaler, RateMeter, negotiated_settings
+from ingest import IngestService, parse_vehicle
+from fanout import MULTICAST_GROUP, TCP_PORT, TelemetryFanout
+from video_recorder import VIDEO_EXTENSION, VideoRecorder
+from battery import VehicleBatteries, format_estimate
+from port_watcher import LinkReconnector, PortWatcher, list_ports
+from snapshots import SNAPSHOT_DIR, SNAPSHOT_FRAMES, SnapshotCapture
+from gps_map import MAP_TILES, VehicleTracks
+from strip_chart import CHART_CHANNELS, CHART_COLORS, CHART_RATE_HZ, StripChart, VehicleHistories
+from tracing import tracer
+from simulator import DEFAULT_RATE, create_simulator
+from protocol import BAUD_RATES
+from ringlog import configure_logging, debug_enabled, get_logger, parse_levels, set_debug
 # from receiver import battery_voltage
 
+serial_log = get_logger('serial')
+camera_log = get_logger('camera')
+ui_log = get_logger('ui')
 
-class SerialThread(QThread):
-    #data_received = pyqtSignal(str)
-    data_received = pyqtSignal(dict)
-    def __init__(self, port):
-        super().__init__()
-        self.port = port
-        self.running = True
-        print(f"SerialThread initialised with port : {self.port}")
-
-    # def run(self):
-    #     with serial.Serial(self.port, 9600, timeout=1) as ser:
-    #         while self.running:
-    #             data = ser.readline().decode().strip()
-    #             if data:
-    #                 self.data_received.emit(data)
-
-    def run(self):
-        print("SerialThread started")
-        try:
-            with serial.Serial(self.port, 9600, timeout=1) as ser:
-                while self.running:
-                    if ser.in_waiting > 0:
-                        line = ser.readline().decode('utf-8').rstrip()
-                        print(f"Received line: {line}")
-                        key_value = line.split(':')
-                        if len(key_value) == 2:
-                            key = key_value[0].strip()
-                            value = key_value[1].strip()
-                            print(f"Parsed key: {key}, value: {value}")
-                            self.data_received.emit({key: value})
-        except serial.SerialException as e:
-            print(f"Serial exception: {e}")
-            self.running = False  # Graceful handling of permission errors
+startup_timer.mark('imports')
 
-    def stop(self):
-        self.running = False
-        self.quit()
-        self.wait()
 
 class CameraThread(QThread):
-    frame_received = pyqtSignal(QImage)
+    capture_opened = pyqtSignal(dict)   # settings the device actually negotiated
 
-    def __init__(self, camera_port=0):
+    def __init__(self, camera_port=0, mailbox=None, profile=None):
         super().__init__()
         self.camera_port = camera_port
         self.running = True
+        # Requested resolution/FPS/FOURCC/buffer size/backend, see CaptureProfile
+        self.profile = profile or CaptureProfile()
+        self.negotiated = {}
+        # The newest display frame is left in this FrameMailbox for the GUI to take
+        self.mailbox = mailbox
+        self.capture_rate = RateMeter()
+        # Mailbox frames are scaled to the display size here, off the GUI thread
+        self.scaler = FrameScaler()
+        # While a VideoRecorder is set, every full-resolution frame is also submitted to it
+        self.video_recorder = None
+        # Likewise copied into the SnapshotCapture's pre-trigger ring
+        self.snapshots = None
+
+    def set_target_size(self, width, height):
+        self.scaler.set_target_size(width, height)
 
     def run(self):
-        cap = cv2.VideoCapture(self.camera_port)
+        # OpenCV loads in open(), on the camera thread, not while the window starts
+        cap = self.profile.open(self.camera_port)
+        self.negotiated = negotiated_settings(cap)
+        camera_log.info("Camera %s: requested %s, negotiated %s", self.camera_port, self.profile, self.negotiated)
+        self.capture_opened.emit(self.negotiated)
+        frame = None
         while self.running:
-            ret, frame = cap.read()
-            if ret:
-                rgb_image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                h, w, ch = rgb_image.shape
-                bytes_per_line = ch * w
-                qt_image = QImage(rgb_image.data, w, h, bytes_per_line, QImage.Format_RGB888)
-                self.frame_received.emit(qt_image)
+            # Passing the previous frame lets OpenCV decode into the same array
+            ret, frame = cap.read(frame)
+            if not ret:
+                frame = None
+                self.msleep(50)   # no camera or no frame yet, don't spin
+                continue
+            trace = tracer.start('camera') if tracer.enabled and self.mailbox is not None else None   # frame_read
+            self.capture_rate.tick()
+            snapshots = self.snapshots
+            if snapshots is not None:
+                snapshots.add(frame, time.monotonic())
+            video_recorder = self.video_recorder
+            if video_recorder is not None:
+                video_recorder.submit(frame)   # never blocks, drops when the encoder is behind
+            if self.mailbox is not None:
+                display_frame = self.scaler.convert(frame)
+                if display_frame is not None:
+                    if trace is not None:
+                        trace.mark()   # color_converted
+                        display_frame.trace = trace   # the mailbox marks frame_emitted
+                    replaced = self.mailbox.put(display_frame)
+                    if replaced is not None:
+                        replaced.release()
+        cap.release()
 
     def stop(self):
         self.running = False
-        print("CameraThread stopping")
+        camera_log.info("CameraThread stopping")
         self.quit()
         self.wait()
 
-from PyQt5.QtWidgets import QLCDNumber
+
+# Widget refresh rate of the dashboard, independent of the telemetry rate
+RENDER_RATE_HZ = 30
+# Camera feed refresh rate; frames the display cannot keep up with are dropped
+DISPLAY_RATE_HZ = 30
+# Every vehicle connection is logged to a new flight recording in this directory
+FLIGHTS_DIR = 'flights'
+# Failed vehicle links are checked for reopening this often; the backoff itself is in port_watcher.py
+RECONNECT_CHECK_MS = 250
+# The startup timing report is logged at the first camera frame, or after this many seconds without one
+STARTUP_REPORT_DELAY = 10.0
 
 class MainWindow(QMainWindow, Ui_DroneDashboard):
-    def __init__(self):
+    def __init__(self, render_rate=RENDER_RATE_HZ, display_rate=DISPLAY_RATE_HZ, extra_ports=(), vehicles=(),
+                 ingest=None, capture_process=False, chart_channels=CHART_CHANNELS, battery_cells=None,
+                 map_tiles=MAP_TILES, fast_start=False, snapshot_dir=SNAPSHOT_DIR, snapshot_frames=SNAPSHOT_FRAMES,
+                 snapshot_burst=0):
         super().__init__()
-        self.setupUi(self)
+        # Fast start: drone.ui's ~40 widget style sheets become one application style sheet,
+        # and the port scan and camera start wait until the window is up
+        self.fast_start = fast_start
+        self.ui_style_sheets = {}   # object name -> drone.ui style sheet merged into the application's
+        if fast_start:
+            with collect_style_sheets() as calls:
+                self.setupUi(self)
+            sheet, unmerged = merged_style_sheet(calls)
+            QApplication.instance().setStyleSheet(sheet)
+            for widget, widget_sheet in unmerged.items():
+                widget.setStyleSheet(widget_sheet)
+            self.ui_style_sheets = {widget.objectName(): widget_sheet for widget, widget_sheet in calls}
+        else:
+            self.setupUi(self)
+        startup_timer.mark('setup_ui')
+        # Ports listed after the physical ones, e.g. a simulator pty
+        self.extra_ports = list(extra_ports)
 
-        self.serial_thread = None
         self.camera_thread = None
 
-        print("MainWindow initialized")
+        # Reads every connected vehicle into its own store: an IngestService thread by default,
+        # or an IngestProcess publishing through shared memory
+        self.ingest = ingest if ingest is not None else IngestService()
+        # Strip chart history, battery estimate and GPS track of every vehicle, fed with each
+        # decoded chunk on the ingest thread (an IngestProcess forwards its chunks to a thread here)
+        self.chart_histories = VehicleHistories(chart_channels)
+        self.batteries = VehicleBatteries(battery_cells)
+        self.tracks = VehicleTracks()
+        for sink in (self.chart_histories.publish, self.batteries.publish, self.tracks.publish):
+            self.ingest.add_sink(sink)
+        self.shown_vehicle = None
+        self.shown_history = None
+        self.shown_battery = None
+        # Opened from GPSButton, created on first use
+        self.map_tiles = map_tiles
+        self.map_panel = None
+        self.ingest.start()
+
+        # The shown vehicle's store; render_telemetry() paints what changed at render_rate
+        self.telemetry_store = TelemetryStore()
+        self.rendered_version = 0
+        self.render_timer = QTimer(self)
+        self.render_timer.timeout.connect(self.render_telemetry)
+        self.render_timer.start(int(1000 / render_rate))
+
+        ui_log.info("MainWindow initialized")
 
         self.initialize_lcd_numbers()
+        self.bind_telemetry_widgets()
 
         self.populate_com_ports()
-        self.comboBoxPort.currentIndexChanged.connect(self.start_serial_thread)
+        self.setup_baud_selector()
+        self.setup_vehicle_selector()
+        self.setup_strip_charts(chart_channels)
+        self.setup_battery_estimate()
+        self.comboBoxPort.currentIndexChanged.connect(self.connect_selected_port)
+        self.comboBoxBaud.currentIndexChanged.connect(self.connect_selected_port)
+        self.comboBoxVehicle.currentIndexChanged.connect(self.show_selected_vehicle)
         # self.Disconnect.clicked.connect(self.disconnect_serial)
-        self.CaptureButton.clicked.connect(self.capture_image)
+        # On press, not on release: the snapshot is the frame captured closest to the press
+        self.CaptureButton.pressed.connect(self.capture_image)
+        self.GPSButton.clicked.connect(self.show_map)
+        self.video_recorder = None
+        self.setup_record_button()
+        self.RecordButton.clicked.connect(self.toggle_video_recording)
         
-        self.camera_thread = CameraThread()
-        self.camera_thread.frame_received.connect(self.update_camera_feed)
-        self.camera_thread.start()
+        # The camera worker overwrites one mailbox slot, the display timer takes the newest frame
+        self.frame_mailbox = FrameMailbox()
+        self.displayed_frame = None
+        self.display_rate = RateMeter()
+        # In a capture process, frames reach the mailbox through a shared-memory ring instead
+        camera_class = CameraThread
+        if capture_process:
+            from frame_ring import CaptureProcess
+
+            camera_class = CaptureProcess
+        self.camera_thread = camera_class(mailbox=self.frame_mailbox, profile=CaptureProfile.load())
+        self.camera_thread.set_target_size(self.labelCameraFeed.width(), self.labelCameraFeed.height())
+        self.snapshots = SnapshotCapture(snapshot_dir, snapshot_frames, snapshot_burst)
+        self.camera_thread.snapshots = self.snapshots
+        # Frames arrive at the label's size, Qt does not need to rescale them
+        self.labelCameraFeed.setScaledContents(False)
+        if fast_start:
+            QTimer.singleShot(0, self.camera_thread.start)   # once the window has been shown
+        else:
+            self.camera_thread.start()
+        self.display_timer = QTimer(self)
+        self.display_timer.timeout.connect(self.display_camera_frame)
+        self.display_timer.start(int(1000 / display_rate))
+
+        self.stats_timer = QTimer(self)
+        self.stats_timer.timeout.connect(self.show_pipeline_stats)
+        self.stats_timer.timeout.connect(self.show_battery_estimate)
+        self.stats_timer.start(1000)
+
+        # A vehicle whose port fails (e.g. a loose USB cable) is reopened in the background
+        self.reconnector = LinkReconnector()
+        self.reconnect_timer = QTimer(self)
+        self.reconnect_timer.timeout.connect(self.reconnect_links)
+        self.reconnect_timer.start(RECONNECT_CHECK_MS)
+
+        # Charts scroll at their own, lower rate; each repaint costs about one point pair per pixel column
+        self.chart_timer = QTimer(self)
+        self.chart_timer.timeout.connect(self.update_strip_charts)
+        self.chart_timer.start(int(1000 / CHART_RATE_HZ))
 
         self.timer = QTimer(self)
         self.timer.timeout.connect(self.update_timer)
@@ -104,6 +227,18 @@ class MainWindow(QMainWindow, Ui_DroneDashboard):
 
         self.CloseButton.clicked.connect(self.close)  # Connect CloseButton to close method
 
+        # Latency tracing: Ctrl+T toggles it, Ctrl+L dumps the per-stage percentiles
+        QShortcut(QKeySequence("Ctrl+T"), self, self.toggle_tracing)
+        QShortcut(QKeySequence("Ctrl+L"), self, self.dump_latency_trace)
+        # Ctrl+D switches DEBUG logging on and off for every subsystem
+        QShortcut(QKeySequence("Ctrl+D"), self, self.toggle_debug_logging)
+
+        for vehicle_id, port, baudrate in vehicles:
+            self.connect_vehicle(vehicle_id, port, baudrate)
+
+        startup_timer.mark('window_ready')
+        QTimer.singleShot(int(STARTUP_REPORT_DELAY * 1000), startup_timer.log_report)
+
     def initialize_lcd_numbers(self):
         self.lcdNumber = self.findChild(QLCDNumber, 'lcdNumber')
         self.lcdNumber_2 = self.findChild(QLCDNumber, 'lcdNumber_2')
@@ -121,24 +256,247 @@ class MainWindow(QMainWindow, Ui_DroneDashboard):
         self.lcdNumber_14 = self.findChild(QLCDNumber, 'lcdNumber_14')
         self.lcdNumber_15 = self.findChild(QLCDNumber, 'lcdNumber_15')
 
-        print(f'lcdNumber_13: {self.lcdNumber_13}')
-        print(f'lcdNumber_14: {self.lcdNumber_14}')
+        ui_log.debug('lcdNumber_13: %s', self.lcdNumber_13)
+        ui_log.debug('lcdNumber_14: %s', self.lcdNumber_14)
 
-    def populate_com_ports(self):
-        ports = serial.tools.list_ports.comports()
-        print("Available COM ports:", [port.device for port in ports])
-        for port in ports:
-            self.comboBoxPort.addItem(port.device)
+    def bind_telemetry_widgets(self):
+        # Resolve every schema widget binding once, so an update is one dict lookup and one call
+        self.telemetry_bindings = {}
+        for key, spec in TELEMETRY_SCHEMA.items():
+            widget = getattr(self, spec.widget, None)
+            if widget is None:
+                ui_log.warning("%s is not initialized", spec.widget)
+                continue
+            self.telemetry_bindings[key] = (getattr(widget, spec.method), spec.formatter)
 
-    def start_serial_thread(self):
+    def populate_com_ports(self):
+        for port in self.extra_ports:
+            self.comboBoxPort.addItem(port)
+        known = None
+        if not self.fast_start:
+            known = list_ports()
+            self.add_com_ports(known)
+        # Enumerating ports can take a while on Windows; with fast start the window does not
+        # wait for it and the watcher's first listing fills the selector
+        self.port_watcher = PortWatcher(known)
+        self.port_watcher.ports_listed.connect(self.add_com_ports)
+        self.port_watcher.ports_changed.connect(self.update_com_ports)
+        QTimer.singleShot(0, self.port_watcher.start)
+
+    def add_com_ports(self, devices):
+        serial_log.info("Available COM ports: %s", devices)
+        startup_timer.mark('ports_scanned')
+        # Physical ports go before the extra ones; listing them is not selecting one
+        self.comboBoxPort.blockSignals(True)
+        for index, device in enumerate(devices):
+            self.comboBoxPort.insertItem(index, device)
+        self.comboBoxPort.blockSignals(False)
+
+    def update_com_ports(self, added, removed):
+        # Hot-plugged ports go after the physical ones already listed, before the extra ones
+        now = time.monotonic()
+        self.comboBoxPort.blockSignals(True)
+        for device in removed:
+            index = self.comboBoxPort.findText(device)
+            if index >= 0:
+                selected = index == self.comboBoxPort.currentIndex()
+                self.comboBoxPort.removeItem(index)
+                if selected:
+                    self.comboBoxPort.setCurrentIndex(-1)   # rather than seem to select its neighbour
+        for device in added:
+            if self.comboBoxPort.findText(device) < 0:
+                self.comboBoxPort.insertItem(self.comboBoxPort.count() - len(self.extra_ports), device)
+            self.reconnector.port_added(device, now)
+        self.comboBoxPort.blockSignals(False)
+        if added:
+            self.reconnect_links()
+
+    def reconnect_links(self):
+        now = time.monotonic()
+        for vehicle_id, link in list(self.ingest.links.items()):
+            if link.error is not None:
+                self.reconnector.link_failed(vehicle_id, link.port, link.baudrate, link.failed_at or now)
+        for outage in self.reconnector.due(now):
+            link = self.ingest.links.get(outage.vehicle_id)
+            if link is not None and link.error is None:
+                # Reconnected by hand from the port selector
+                self.report_reconnect(outage, now)
+            elif self.connect_vehicle(outage.vehicle_id, outage.port, outage.baudrate, show=False) is None:
+                self.reconnector.attempt_failed(outage.vehicle_id, now)
+                serial_log.info("Vehicle %s: reopening %s failed (attempt %d), next in %.1f s", outage.vehicle_id,
+                                outage.port, outage.attempts, outage.retry_at - now)
+            else:
+                self.report_reconnect(outage, time.monotonic())
+
+    def report_reconnect(self, outage, now):
+        duration, latency = self.reconnector.reconnected(outage.vehicle_id, now)
+        back = "" if latency is None else f", {latency * 1000:.0f} ms after the port came back"
+        serial_log.warning("Vehicle %s: reconnected on %s after a %.1f s outage%s",
+                           outage.vehicle_id, outage.port, duration, back)
+        if self.comboBoxPort.currentIndex() < 0:
+            self.comboBoxPort.blockSignals(True)
+            self.comboBoxPort.setCurrentIndex(self.comboBoxPort.findText(outage.port))
+            self.comboBoxPort.blockSignals(False)
+
+    def ui_style_sheet(self, widget):
+        """The style sheet drone.ui gives `widget`, also when it went into the application style sheet."""
+        return self.ui_style_sheets.get(widget.objectName()) or widget.styleSheet()
+
+    def setup_baud_selector(self):
+        # Not part of drone.ui, placed next to the port selector with the same look
+        self.comboBoxBaud = QComboBox(self.centralwidget)
+        self.comboBoxBaud.setGeometry(QRect(220, 250, 121, 51))
+        self.comboBoxBaud.setStyleSheet(self.ui_style_sheet(self.comboBoxPort))
+        self.comboBoxBaud.setObjectName("comboBoxBaud")
+        for baudrate in BAUD_RATES:
+            self.comboBoxBaud.addItem(str(baudrate), baudrate)
+
+    def setup_record_button(self):
+        # Not part of drone.ui, placed next to the Capture button with the same look
+        self.RecordButton = QPushButton(self.centralwidget)
+        self.RecordButton.setGeometry(QRect(1090, 780, 191, 61))
+        self.RecordButton.setFont(self.CaptureButton.font())
+        self.RecordButton.setStyleSheet(self.ui_style_sheet(self.CaptureButton))
+        self.RecordButton.setObjectName("RecordButton")
+        self.RecordButton.setText("Record")
+
+    def setup_vehicle_selector(self):
+        # Not part of drone.ui: which connected vehicle the dashboard shows
+        self.comboBoxVehicle = QComboBox(self.centralwidget)
+        self.comboBoxVehicle.setGeometry(QRect(50, 310, 291, 51))
+        self.comboBoxVehicle.setStyleSheet(self.ui_style_sheet(self.comboBoxPort))
+        self.comboBoxVehicle.setObjectName("comboBoxVehicle")
+
+    def setup_strip_charts(self, channels):
+        # Not part of drone.ui: a row of charts between the camera feed and the Capture button
+        self.strip_charts = []
+        if not channels:
+            return
+        left, top, width, height = 430, 690, 1101, 84
+        chart_width = width // len(channels)
+        for index, key in enumerate(channels):
+            chart = StripChart(self.centralwidget, key, CHART_COLORS[index % len(CHART_COLORS)])
+            chart.setGeometry(QRect(left + index * chart_width, top, chart_width - 6, height))
+            chart.setObjectName(f"chart{index}")
+            self.strip_charts.append(chart)
+
+    def setup_battery_estimate(self):
+        # Not part of drone.ui: discharge rate and time left, below the battery voltage
+        self.battery_estimate = QLabel(self.centralwidget)
+        self.battery_estimate.setGeometry(QRect(1730, 980, 171, 41))
+        font = self.battery_status.font()
+        font.setPointSize(9)
+        self.battery_estimate.setFont(font)
+        self.battery_estimate.setStyleSheet(self.ui_style_sheet(self.battery_status))
+        self.battery_estimate.setObjectName("battery_estimate")
+        self.battery_warning = False
+
+    def show_battery_estimate(self):
+        estimate = self.shown_battery.estimate() if self.shown_battery else None
+        self.battery_estimate.setText(format_estimate(estimate))
+        warning = estimate is not None and estimate['to_warning'] == 0
+        if warning != self.battery_warning:
+            # Restyled only on change, a style sheet repolishes the widget
+            self.battery_warning = warning
+            self.battery_estimate.setStyleSheet("QLabel {\n    color: orange;\n}" if warning
+                                                else self.ui_style_sheet(self.battery_status))
+
+    def show_map(self):
+        if self.map_panel is None:
+            from gps_map import MapPanel
+
+            self.map_panel = MapPanel(self.map_tiles, self)
+            if self.shown_vehicle is not None:
+                self.map_panel.set_track(self.tracks.track(self.shown_vehicle))
+        self.map_panel.show()
+        self.map_panel.raise_()
+
+    def update_strip_charts(self):
+        for chart in self.strip_charts:
+            chart.update()
+
+    def connect_selected_port(self):
+        # Selecting a port connects it as one more vehicle; the ports already open keep running
         selected_port = self.comboBoxPort.currentText()
-        print(f"Selected COM port: {selected_port}")
+        baudrate = self.comboBoxBaud.currentData()
+        serial_log.info("Selected COM port: %s at %s baud", selected_port, baudrate)
         if selected_port:
-            if self.serial_thread:
-                self.serial_thread.stop()
-            self.serial_thread = SerialThread(selected_port)
-            self.serial_thread.data_received.connect(self.update_telemetry_data)
-            self.serial_thread.start()
+            self.connect_vehicle(selected_port, selected_port, baudrate)
+
+    def connect_vehicle(self, vehicle_id, port, baudrate, show=True):
+        """Open `port` for `vehicle_id` unless it is open already; return its link, or None if it cannot be opened.
+
+        With `show`, the dashboard switches to the vehicle.
+        """
+        link = self.ingest.links.get(vehicle_id)
+        if link is None or link.baudrate != baudrate or link.error is not None:
+            recorder_path = self.flight_log_path(vehicle_id)
+            try:
+                link = self.ingest.add_vehicle(vehicle_id, port, baudrate, recorder_path=recorder_path)
+            except serial.SerialException as e:
+                serial_log.error("Serial exception: %s", e)
+                return None
+            serial_log.info("Recording telemetry of %s to %s", vehicle_id, recorder_path)
+        # Signals blocked: adding the first item selects it as well, and the vehicle is shown once below
+        self.comboBoxVehicle.blockSignals(True)
+        index = self.comboBoxVehicle.findData(vehicle_id)
+        if index < 0:
+            self.comboBoxVehicle.addItem(f"{vehicle_id} ({port})", vehicle_id)
+            index = self.comboBoxVehicle.count() - 1
+        if show:
+            self.comboBoxVehicle.setCurrentIndex(index)
+        self.comboBoxVehicle.blockSignals(False)
+        if index == self.comboBoxVehicle.currentIndex():
+            self.show_selected_vehicle()   # newly selected, or reconnected: show the new store
+        return link
+
+    def show_selected_vehicle(self):
+        vehicle_id = self.comboBoxVehicle.currentData()
+        if vehicle_id not in self.ingest.links:
+            return
+        ui_log.info("Showing vehicle %s", vehicle_id)
+        self.telemetry_store = self.ingest.store(vehicle_id)
+        self.shown_vehicle = vehicle_id
+        if self.map_panel is not None:
+            self.map_panel.set_track(self.tracks.track(vehicle_id))
+        self.shown_history = self.chart_histories.history(vehicle_id)
+        self.shown_battery = self.batteries.estimator(vehicle_id)
+        for chart in self.strip_charts:
+            chart.set_history(self.shown_history[chart.title])
+        # Repaint every field from the new store, blank those it has not received yet
+        self.rendered_version = 0
+        for setter, formatter in self.telemetry_bindings.values():
+            setter("")
+        self.render_telemetry()
+
+    def flight_log_path(self, vehicle_id):
+        os.makedirs(FLIGHTS_DIR, exist_ok=True)
+        name = "".join(c if c.isalnum() else "_" for c in vehicle_id).strip("_")
+        return os.path.join(FLIGHTS_DIR, time.strftime("flight-%Y%m%d-%H%M%S-") + name + ".dlog")
+
+    def toggle_video_recording(self):
+        if self.video_recorder:
+            self.stop_video_recording()
+            return
+        os.makedirs(FLIGHTS_DIR, exist_ok=True)
+        path = os.path.join(FLIGHTS_DIR, time.strftime("video-%Y%m%d-%H%M%S") + VIDEO_EXTENSION)
+        camera_log.info("Recording video to %s", path)
+        fps = self.camera_thread.negotiated.get('fps') or self.camera_thread.profile.fps
+        self.video_recorder = VideoRecorder(path, fps)
+        self.video_recorder.start()
+        self.camera_thread.video_recorder = self.video_recorder
+        self.RecordButton.setText("Stop")
+
+    def stop_video_recording(self):
+        self.camera_thread.video_recorder = None
+        video_recorder, self.video_recorder = self.video_recorder, None
+        video_recorder.stop()
+        stats = video_recorder.stats()
+        log = camera_log.warning if stats['dropped'] or stats['failed'] else camera_log.info
+        log("Video recording %s stopped after %.1f s: %d frames submitted, %d dropped%s", stats['path'],
+            stats['elapsed'], stats['submitted'], stats['dropped'], ", encoder failed" if stats['failed'] else "")
+        self.RecordButton.setText("Record")
+        return video_recorder
 
     # def disconnect_serial(self):
     #     print("Disconnect button clicked")
@@ -147,141 +505,222 @@ class MainWindow(QMainWindow, Ui_DroneDashboard):
     #         self.serial_thread = None 
     #         print("SerialThread disconnected")
 
+    def render_telemetry(self):
+        # Render tick: push only the fields that changed since the previous tick
+        trace = self.telemetry_store.take_trace() if tracer.enabled else None
+        if trace is not None:
+            trace.mark()   # slot_entered
+        self.rendered_version, changed = self.telemetry_store.changed_since(self.rendered_version)
+        if changed:
+            self.update_telemetry_data(changed)
+        if trace is not None:
+            trace.mark()   # widget_updated
+            tracer.finish(trace)
+
     def update_telemetry_data(self, data):
-        print(data, "telemetry_data")
-        print("update_telemetry_data called")
-        print("self:", self)
-        print("data:", data)
+        debug = ui_log.isEnabledFor(logging.DEBUG)
+        if debug:
+            ui_log.debug("update_telemetry_data called with %s", data)
 
         for key, value in data.items():
-            print(f"Updating key: {key} with value: {value}")
-            if key == 'Battery Voltage':
-                if self.battery_status:
-                    # self.battery_status.display(float(value))
-                    self.battery_status.setText(f"{float(value):.2f}") 
-                    
-                else:
-                    print("battery status is not initialized")
-            elif key == 'Roll':
-                if self.lcdNumber_4:
-                    self.lcdNumber_4.display(float(value))
-                else:
-                    print("lcdNumber_4 is not initialized")
-            elif key == 'Pitch':
-                if self.lcdNumber_5:
-                    self.lcdNumber_5.display(float(value))
-                else:
-                    print("lcdNumber_5 is not initialized")
-            elif key == 'Heading':
-                if self.lcdNumber_6:
-                    self.lcdNumber_6.display(float(value))
-                else:
-                    print("lcdNumber_6 is not initialized")
-            elif key == 'Number of Satellites':
-                if self.lcdNumber_7:
-                    self.lcdNumber_7.display(int(value))
-                else:
-                    print("lcdNumber_7 is not initialized")
-            elif key == 'Main Mode':
-                if self.mainmode_status:
-                    self.mainmode_status.display(str(value))
-                else:
-                    print("mainmode status is not initialized")
-            elif key == 'Sub Mode':
-                if self.submode_status:
-                    self.submode_status.display(str(value))
-                else:
-                    print("submode status is not initialized")
-            elif key == 'Error':
-                if self.error_status:
-                    # self.error_status.display(int(value))
-                      self.error_status.setText(f"{float(value):.2f}") 
-                else:
-                    print("error status is not initialized")
-            elif key == 'GPS Status':
-                if self.gps_status_status:
-                    # self.error_status.display(int(value))
-                      self.gps_status.setText(f"{float(value):.2f}") 
-                else:
-                    print("error status is not initialized")
-            elif key == 'Latitude':
-                if self.lcdNumber:
-                    self.lcdNumber.display(float(value))
-                else:
-                    print("lcdNumber is not initialized")
-            elif key == 'Longitude':
-                if self.lcdNumber_3:
-                    self.lcdNumber_3.display(float(value))
-                else:
-                    print("lcdNumber_3 is not initialized")
-            elif key == 'Altitude':
-                if self.lcdNumber_2:
-                    self.lcdNumber_2.display(float(value))
-                else:
-                    print("lcdNumber_2 is not initialized")
-            elif key == 'Distance Right':
-                if self.lcdNumber_9:
-                    self.lcdNumber_9.display(int(value))
-                else:
-                    print("lcdNumber_9 is not initialized")
-            elif key == 'Distance Left':
-                if self.lcdNumber_10:
-                    self.lcdNumber_10.display(int(value))
-                else:
-                    print("lcdNumber_10 is not initialized")
-            elif key == 'Distance Upper':
-                if self.lcdNumber_12:
-                    self.lcdNumber_12.display(int(value))
-                else:
-                    print("lcdNumber_12 is not initialized")
-            elif key == 'Armed or Not':
-                if self.armed_status:
-                    self.armed_status.setText(str(value))
-                else:
-                    print("armed status is not initialized")
-                if value.lower() == 'yes' and not self.timer_started:
-                    self.timer_started = True
-                    self.start_timer()
+            binding = self.telemetry_bindings.get(key)
+            if binding is None:
+                continue
+            if debug:
+                ui_log.debug("Updating key: %s with value: %s", key, value)
+            setter, formatter = binding
+            setter(formatter(value) if formatter else value)
+
+        armed = data.get('Armed or Not')
+        if armed is not None and armed.lower() == 'yes' and not self.timer_started:
+            self.timer_started = True
+            self.start_timer()
 
     def update_camera_feed(self, image):
         self.labelCameraFeed.setPixmap(QPixmap.fromImage(image))
 
+    def display_camera_frame(self):
+        display_frame = self.frame_mailbox.take()
+        if display_frame is None:
+            return
+        if not startup_timer.reported:
+            startup_timer.mark('first_frame')
+            startup_timer.log_report()
+        # Already scaled to the label and in Qt's native format, so the pixmap shares the
+        # pooled buffer instead of copying it. The buffer goes back to the camera thread
+        # only once the next frame has replaced it on screen.
+        self.update_camera_feed(display_frame.image)
+        if display_frame.trace is not None:
+            display_frame.trace.mark()   # pixmap_set
+            tracer.finish(display_frame.trace)
+            display_frame.trace = None
+        if self.displayed_frame is not None:
+            self.displayed_frame.release()
+        self.displayed_frame = display_frame
+        self.display_rate.tick()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if self.camera_thread:
+            self.camera_thread.set_target_size(self.labelCameraFeed.width(), self.labelCameraFeed.height())
+
+    def show_pipeline_stats(self):
+        negotiated = self.camera_thread.negotiated
+        capture_mode = ""
+        if negotiated.get('opened'):
+            capture_mode = (f"{negotiated['width']}x{negotiated['height']} {negotiated['fourcc']} "
+                            f"@ {negotiated['fps']:.0f} ({negotiated['backend']}), ")
+        self.statusbar.showMessage(
+            f"Camera: {capture_mode}capture {self.camera_thread.capture_rate.rate:.1f} fps, "
+            f"display {self.display_rate.rate:.1f} fps, "
+            f"dropped {self.frame_mailbox.dropped}{self.video_recording_status()}{self.link_status()}")
+
+    def link_status(self):
+        now = time.monotonic()
+        return "".join(f" | {outage.vehicle_id} LINK DOWN {now - outage.started:.0f} s, "
+                       f"retry in {max(outage.retry_at - now, 0):.0f} s"
+                       for outage in self.reconnector.outages.values())
+
+    def video_recording_status(self):
+        if not self.video_recorder:
+            return ""
+        if self.video_recorder.failed:
+            return " | REC failed: cannot open the video writer"
+        elapsed = time.strftime("%M:%S", time.gmtime(self.video_recorder.elapsed))
+        return (f" | REC {elapsed}, {self.video_recorder.written} frames written, "
+                f"{self.video_recorder.dropped} dropped by the encoder queue")
+
+    def toggle_tracing(self):
+        tracer.set_enabled(not tracer.enabled)
+        self.statusbar.showMessage(f"Latency tracing {'on' if tracer.enabled else 'off'}", 2000)
+
+    def toggle_debug_logging(self):
+        set_debug(not debug_enabled('serial'))
+        self.statusbar.showMessage(f"Debug logging {'on' if debug_enabled('serial') else 'off'}", 2000)
+
+    def dump_latency_trace(self):
+        path = time.strftime("latency-%Y%m%d-%H%M%S.json")
+        tracer.dump(path)
+        ui_log.info("Latency trace written to %s\n%s", path, tracer.format_summary())
+
     def start_timer(self):
-        print("Timer started")
+        ui_log.info("Timer started")
         self.start_time = time.time()
         self.timer.start(1000)
 
     def update_timer(self):
         elapsed_time = time.time() - self.start_time
-        print(f"Elapsed time: {elapsed_time}")
+        ui_log.debug("Elapsed time: %s", elapsed_time)
         self.LabelTimer.setText(time.strftime("%H:%M:%S", time.gmtime(elapsed_time)))
 
     def capture_image(self):
-        print("Capture button clicked")
-        dialog = QFileDialog(self)
-        dialog.setFileMode(QFileDialog.AnyFile)
-        dialog.setAcceptMode(QFileDialog.AcceptSave)
-        dialog.setNameFilter("Images (*.png *.jpg *.bmp)")
-
-        if dialog.exec_():
-            file_path = dialog.selectedFiles()[0]
-            print(f"Saving captured image to :{file_path}")
-            pixmap = self.labelCameraFeed.pixmap()
-            if pixmap and not pixmap.isNull():
-                pixmap.save(file_path)
+        # Full-resolution camera frames from the pre-trigger ring, encoded in the background
+        ui_log.debug("Capture button pressed")
+        self.snapshots.trigger(time.monotonic())
+        self.statusbar.showMessage(f"Saving snapshot to {self.snapshots.directory}", 2000)
 
     def showEvent(self, event):
         self.showFullScreen()
 
     def closeEvent(self, event):
-        if self.serial_thread:
-            self.serial_thread.stop()
+        # Closes every port and its flight recorder
+        self.reconnect_timer.stop()
+        self.port_watcher.stop()
+        self.ingest.stop()
+        stats = self.reconnector.stats()
+        if stats['outages']:
+            latency = stats['median_latency']
+            serial_log.info("Link outages: %d, %.1f s in total, longest %.1f s; median reconnect latency %s",
+                            stats['outages'], stats['total_outage'], stats['longest_outage'],
+                            "n/a" if latency is None else f"{latency * 1000:.0f} ms")
+        if self.video_recorder:
+            # Give the encoder a moment to finish the queued frames and close the file
+            self.stop_video_recording().join(2.0)
         if self.camera_thread:
             self.camera_thread.stop()
+        self.snapshots.close()
+        if self.map_panel is not None:
+            self.map_panel.shutdown()
+            self.map_panel.deleteLater()
         super().closeEvent(event)
 
+def chart_channel(key):
+    spec = TELEMETRY_SCHEMA.get(key)
+    if spec is None or spec.converter is str.strip:
+        raise argparse.ArgumentTypeError(f"not a numeric telemetry field: {key!r}")
+    return key
+
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    main_window = MainWindow()
+    parser = argparse.ArgumentParser(description="Drone flight monitor dashboard.")
+    parser.add_argument('--simulate', nargs='?', type=float, const=DEFAULT_RATE, metavar='RATE',
+                        help="offer a simulated telemetry port streaming RATE records per second")
+    parser.add_argument('--replay', metavar='LOG', help="simulated port replays this flight recording")
+    parser.add_argument('--realtime', action='store_true', help="replay with the recorded timing")
+    parser.add_argument('--binary', action='store_true', help="simulated port sends binary frames")
+    parser.add_argument('--trace', action='store_true', help="start with latency tracing on (Ctrl+T toggles)")
+    parser.add_argument('--debug', action='store_true', help="log at DEBUG for every subsystem (Ctrl+D toggles)")
+    parser.add_argument('--log', metavar='LEVELS', type=parse_levels, default={},
+                        help="per-subsystem log levels, e.g. serial=DEBUG,camera=WARNING")
+    parser.add_argument('--vehicle', metavar='ID=PORT[@BAUD]', type=parse_vehicle, action='append', default=[],
+                        help="connect a vehicle at startup; repeat for several vehicles")
+    parser.add_argument('--serve', nargs='?', type=int, const=TCP_PORT, metavar='PORT',
+                        help=f"republish telemetry to TCP clients on PORT (default {TCP_PORT}) "
+                             f"and to multicast group {MULTICAST_GROUP[0]}:{MULTICAST_GROUP[1]}")
+    parser.add_argument('--ingest-process', action='store_true',
+                        help="read the serial ports in a separate process that shares the values through shared memory")
+    parser.add_argument('--chart', metavar='FIELD', type=chart_channel, action='append',
+                        help=f"chart FIELD below the camera feed; repeat for several "
+                             f"(default {', '.join(CHART_CHANNELS)})")
+    parser.add_argument('--battery-cells', type=int, metavar='N',
+                        help="cells in series of the flight battery (default: guessed from the first voltage)")
+    parser.add_argument('--tiles', metavar='PATH', default=MAP_TILES,
+                        help=f"map tiles for the GPS map: a <z>/<x>/<y>.png directory or an MBTiles file "
+                             f"(default {MAP_TILES})")
+    parser.add_argument('--fast-start', action='store_true',
+                        help="show the window first: one merged style sheet, port scan and camera start "
+                             "in the background")
+    parser.add_argument('--snapshots', metavar='DIR', default=SNAPSHOT_DIR,
+                        help=f"directory the Capture button saves full-resolution frames to (default {SNAPSHOT_DIR})")
+    parser.add_argument('--snapshot-burst', type=int, default=0, metavar='N',
+                        help="save N frames before and after the one closest to the press as well")
+    parser.add_argument('--snapshot-frames', type=int, default=SNAPSHOT_FRAMES, metavar='N',
+                        help=f"full-resolution frames kept for snapshots (default {SNAPSHOT_FRAMES})")
+    parser.add_argument('--capture-process', action='store_true',
+                        help="capture the camera in a separate process that hands frames over in shared memory")
+    # Anything else is left for Qt (-platform, -style, ...)
+    args, qt_args = parser.parse_known_args()
+
+    configure_logging(args.debug, args.log)
+    app = QApplication(sys.argv[:1] + qt_args)
+    startup_timer.mark('qt_app')
+    tracer.set_enabled(args.trace)
+    simulator = None
+    if args.simulate is not None or args.replay:
+        simulator = create_simulator(args.simulate or DEFAULT_RATE, args.replay, args.realtime, args.binary)
+        simulator.start()
+        serial_log.info("Simulated telemetry on %s", simulator.port)
+    fanout = None
+    if args.ingest_process:
+        from shared_telemetry import IngestProcess
+
+        # The fan-out runs in the ingest process, next to the samples
+        ingest = IngestProcess(fanout_port=args.serve)
+    else:
+        if args.serve is not None:
+            fanout = TelemetryFanout(tcp_address=('', args.serve))
+            fanout.start()
+        ingest = IngestService(sink=fanout.publish if fanout else None)
+    main_window = MainWindow(extra_ports=[simulator.port] if simulator else [], vehicles=args.vehicle, ingest=ingest,
+                             capture_process=args.capture_process, chart_channels=args.chart or CHART_CHANNELS,
+                             battery_cells=args.battery_cells, map_tiles=args.tiles,
+                             fast_start=args.fast_start, snapshot_dir=args.snapshots,
+                             snapshot_frames=args.snapshot_frames, snapshot_burst=args.snapshot_burst)
     main_window.show()
-    sys.exit(app.exec_())
\ No newline at end of file
+    startup_timer.mark('window_shown')
+    QTimer.singleShot(0, lambda: startup_timer.mark('event_loop'))
+    exit_code = app.exec_()
+    if fanout:
+        fanout.stop()
+    if simulator:
+        simulator.stop()
+    sys.exit(exit_code)
\ No newline at end of file
@@ -0,0 +1,172 @@
+# Serial port hot-plug detection and automatic reconnection.
+#
+# PortWatcher is a thread that reports serial ports as they come and go. On
+# Linux with pyudev installed it sleeps until udev announces a tty device;
+# elsewhere it lists the ports every `interval` seconds and diffs the
+# result. Either way the names come from serial.tools.list_ports, the same
+# ones the port selector shows.
+#
+# LinkReconnector decides when a vehicle whose port failed is opened again:
+# at once when the port reappears, otherwise after exponentially growing
+# delays. It keeps the outage durations and how soon after the port came
+# back the link was open again (the reconnect latency).
+
+import threading
+from collections import deque
+
+import serial.tools.list_ports
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from ringlog import get_logger
+
+log = get_logger('serial')
+
+PORT_POLL_INTERVAL = 1.0    # seconds between listings without udev
+UDEV_SETTLE = 0.1           # one adapter sends several events; list once they stop
+RETRY_INITIAL = 0.5         # seconds before the first reopen attempt
+RETRY_MAXIMUM = 30.0
+RETRY_FACTOR = 2.0
+OUTAGE_HISTORY = 256        # finished outages kept for the statistics
+
+
+def list_ports():
+    return [port.device for port in serial.tools.list_ports.comports()]
+
+
+class PortWatcher(QThread):
+    """Reports added and removed serial ports; see the module comment.
+
+    Without `known` ports, the first listing is emitted by ports_listed;
+    every change after that by ports_changed.
+    """
+
+    ports_listed = pyqtSignal(list)
+    ports_changed = pyqtSignal(list, list)   # added, removed device names
+
+    def __init__(self, known=None, interval=PORT_POLL_INTERVAL):
+        super().__init__()
+        self.interval = interval
+        self.ports = None if known is None else set(known)
+        self.event_driven = False
+        self._stopping = threading.Event()
+
+    def run(self):
+        monitor = self._udev_monitor()
+        self.event_driven = monitor is not None
+        log.info("Watching serial ports %s", "through udev" if monitor else f"every {self.interval:g} s")
+        self._scan()
+        while not self._stopping.is_set():
+            if monitor is None:
+                if self._stopping.wait(self.interval):
+                    break
+            elif monitor.poll(timeout=1.0) is None:
+                continue   # nothing happened; check for stop() again
+            else:
+                while monitor.poll(timeout=UDEV_SETTLE) is not None:
+                    pass
+            self._scan()
+
+    @staticmethod
+    def _udev_monitor():
+        try:
+            import pyudev
+
+            monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+            monitor.filter_by('tty')
+            monitor.start()
+            return monitor
+        except (ImportError, OSError):
+            return None
+
+    def _scan(self):
+        try:
+            ports = list_ports()
+        except OSError as e:
+            log.warning("Cannot list serial ports: %s", e)
+            return
+        if self.ports is None:
+            self.ports = set(ports)
+            self.ports_listed.emit(ports)
+            return
+        added = [port for port in ports if port not in self.ports]
+        removed = sorted(self.ports.difference(ports))
+        if added or removed:
+            self.ports = set(ports)
+            log.info("Serial ports added %s, removed %s", added, removed)
+            self.ports_changed.emit(added, removed)
+
+    def stop(self):
+        self._stopping.set()
+        self.wait()
+
+
+class Outage:
+    """A vehicle link that failed and has not been reopened yet."""
+
+    def __init__(self, vehicle_id, port, baudrate, started, retry_at):
+        self.vehicle_id = vehicle_id
+        self.port = port
+        self.baudrate = baudrate
+        self.started = started
+        self.retry_at = retry_at
+        self.attempts = 0
+        self.port_returned = None   # when the port was last seen coming back
+
+
+class LinkReconnector:
+    """Reopen schedule and outage statistics of failed links; see the module comment.
+
+    Times are time.monotonic() values passed in by the caller.
+    """
+
+    def __init__(self, initial=RETRY_INITIAL, maximum=RETRY_MAXIMUM, factor=RETRY_FACTOR):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.outages = {}   # vehicle_id -> Outage
+        self.history = deque(maxlen=OUTAGE_HISTORY)   # (vehicle_id, outage seconds, latency seconds or None)
+
+    def delay(self, attempts):
+        """Seconds to wait after `attempts` failed reopen attempts."""
+        return min(self.initial * self.factor ** attempts, self.maximum)
+
+    def link_failed(self, vehicle_id, port, baudrate, now):
+        if vehicle_id not in self.outages:
+            log.warning("Vehicle %s: link on %s lost, reconnecting", vehicle_id, port)
+            self.outages[vehicle_id] = Outage(vehicle_id, port, baudrate, now, now + self.initial)
+
+    def port_added(self, port, now):
+        # Back: try right away, and start the backoff over if that is too early
+        for outage in self.outages.values():
+            if outage.port == port:
+                outage.port_returned = now
+                outage.retry_at = now
+                outage.attempts = 0
+
+    def due(self, now):
+        return [outage for outage in self.outages.values() if outage.retry_at <= now]
+
+    def attempt_failed(self, vehicle_id, now):
+        outage = self.outages[vehicle_id]
+        outage.attempts += 1
+        outage.retry_at = now + self.delay(outage.attempts)
+
+    def reconnected(self, vehicle_id, now):
+        """Close the vehicle's outage; return (outage seconds, reconnect latency seconds or None)."""
+        outage = self.outages.pop(vehicle_id)
+        duration = now - outage.started
+        latency = None if outage.port_returned is None else now - outage.port_returned
+        self.history.append((vehicle_id, duration, latency))
+        return duration, latency
+
+    def cancel(self, vehicle_id):
+        self.outages.pop(vehicle_id, None)
+
+    def stats(self):
+        durations = sorted(duration for _, duration, _ in self.history)
+        latencies = sorted(latency for _, _, latency in self.history if latency is not None)
+        return {'outages': len(durations), 'down': len(self.outages),
+                'total_outage': sum(durations), 'longest_outage': durations[-1] if durations else None,
+                'median_outage': durations[len(durations) // 2] if durations else None,
+                'median_latency': latencies[len(latencies) // 2] if latencies else None,
+                'worst_latency': latencies[-1] if latencies else None}
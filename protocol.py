@@ -0,0 +1,161 @@
+# Compact binary telemetry protocol.
+#
+# Besides the original "Key: Value" text lines, the firmware can send one
+# fixed-layout frame per telemetry cycle:
+#
+#   COBS( FRAME_STRUCT.pack(version, sequence, *fields) + CRC16 ) + b'\x00'
+#
+# COBS framing guarantees the payload never contains a zero byte, so 0x00
+# marks the end of every frame. The CRC is CRC-16/CCITT-FALSE (poly 0x1021,
+# init 0xFFFF) over the packed struct, stored little-endian. Text lines never
+# contain a zero byte either, which is what the reader uses to auto-detect
+# the protocol.
+
+import binascii
+import struct
+
+from telemetry import FIELDS
+
+PROTOCOL_VERSION = 1
+
+# Field order matches telemetry.FIELDS
+FRAME_STRUCT = struct.Struct(
+    '<BH'     # version, sequence
+    'ffff'    # Battery Voltage, Roll, Pitch, Heading
+    'BBB'     # Number of Satellites, Main Mode, Sub Mode
+    'f'       # Error
+    'B'       # GPS
+    'ddf'     # Latitude, Longitude, Altitude
+    'HHH'     # Distance Right, Distance Left, Distance Upper
+    'B'       # Armed or Not
+)
+CRC_STRUCT = struct.Struct('<H')
+FRAME_SIZE = FRAME_STRUCT.size + CRC_STRUCT.size
+# Longest frame on the wire: COBS adds a code byte per 254 data bytes, plus the zero
+MAX_ENCODED_SIZE = FRAME_SIZE + FRAME_SIZE // 254 + 2
+
+BAUD_RATES = (9600, 19200, 38400, 57600, 115200, 230400, 460800, 921600)
+
+_ARMED = {0: 'No', 1: 'Yes'}
+MODE_FIELDS = ('Main Mode', 'Sub Mode')
+_BYTE = 0xFF
+_SHORT = 0xFFFF
+
+
+class FrameError(ValueError):
+    pass
+
+
+def crc16(data):
+    return binascii.crc_hqx(data, 0xFFFF)
+
+
+def cobs_encode(data):
+    out = bytearray(b'\x00')   # placeholder for the first code byte
+    code_index = 0
+    code = 1
+    for byte in data:
+        if byte:
+            out.append(byte)
+            code += 1
+        if not byte or code == 0xFF:
+            out[code_index] = code
+            code_index = len(out)
+            out.append(0)
+            code = 1
+    out[code_index] = code
+    return bytes(out)
+
+
+def cobs_decode(buffer, start=0, end=None):
+    """Decode the COBS block buffer[start:end] (without the trailing zero)."""
+    if end is None:
+        end = len(buffer)
+    out = bytearray()
+    index = start
+    while index < end:
+        code = buffer[index]
+        if code == 0:
+            raise FrameError("zero byte inside COBS block")
+        block_end = index + code
+        if block_end > end:
+            raise FrameError("truncated COBS block")
+        out += buffer[index + 1:block_end]
+        index = block_end
+        if code < 0xFF and index < end:
+            out.append(0)
+    return out
+
+
+def field_code(key, value, limit):
+    """The unsigned integer a frame stores for `value`; raises FrameError unless it is a number 0-`limit`."""
+    try:
+        code = int(float(value))
+    except (TypeError, ValueError, OverflowError):
+        raise FrameError(f"{key} {value!r} is not numeric") from None
+    if not 0 <= code <= limit:
+        raise FrameError(f"{key} {value!r} is outside the frame's range 0-{limit}")
+    return code
+
+
+def mode_code(key, value):
+    """The frame byte of a Main Mode or Sub Mode value; raises FrameError unless it is a number 0-255."""
+    try:
+        float(value)
+    except (TypeError, ValueError):
+        raise FrameError(f"{key} {value!r} is not numeric, binary frames carry modes as numbers") from None
+    return field_code(key, value, _BYTE)
+
+
+def encode_frame(values, sequence=0):
+    """Pack a {key: value} cycle into a framed, zero-terminated binary frame.
+
+    Raises FrameError for values the frame cannot carry: non-numeric modes
+    (see mode_code()), integers outside their field or non-numeric floats.
+    """
+    try:
+        payload = FRAME_STRUCT.pack(
+            PROTOCOL_VERSION, sequence & 0xFFFF,
+            float(values.get('Battery Voltage', 0.0)),
+            float(values.get('Roll', 0.0)),
+            float(values.get('Pitch', 0.0)),
+            float(values.get('Heading', 0.0)),
+            field_code('Number of Satellites', values.get('Number of Satellites', 0), _BYTE),
+            mode_code('Main Mode', values.get('Main Mode', 0)),
+            mode_code('Sub Mode', values.get('Sub Mode', 0)),
+            float(values.get('Error', 0.0)),
+            field_code('GPS', values.get('GPS', 0), _BYTE),
+            float(values.get('Latitude', 0.0)),
+            float(values.get('Longitude', 0.0)),
+            float(values.get('Altitude', 0.0)),
+            field_code('Distance Right', values.get('Distance Right', 0), _SHORT),
+            field_code('Distance Left', values.get('Distance Left', 0), _SHORT),
+            field_code('Distance Upper', values.get('Distance Upper', 0), _SHORT),
+            1 if str(values.get('Armed or Not', 'No')).lower() == 'yes' else 0,
+        )
+    except FrameError:
+        raise
+    except (TypeError, ValueError, OverflowError, struct.error) as e:
+        # float() of a non-number, or a float too large for an 'f' field
+        raise FrameError(f"cycle does not fit a binary frame: {e}") from None
+    return cobs_encode(payload + CRC_STRUCT.pack(crc16(payload))) + b'\x00'
+
+
+def decode_frame(buffer, start=0, end=None):
+    """Decode one COBS block from the receive buffer into (sequence, {key: value})."""
+    raw = cobs_decode(buffer, start, end)
+    if len(raw) != FRAME_SIZE:
+        raise FrameError(f"frame is {len(raw)} bytes, expected {FRAME_SIZE}")
+    (crc,) = CRC_STRUCT.unpack_from(raw, FRAME_STRUCT.size)
+    if crc != crc16(memoryview(raw)[:FRAME_STRUCT.size]):
+        raise FrameError("CRC mismatch")
+    fields = FRAME_STRUCT.unpack_from(raw)
+    if fields[0] != PROTOCOL_VERSION:
+        raise FrameError(f"unsupported protocol version {fields[0]}")
+    values = dict(zip(FIELDS, fields[2:]))
+    # Keep the same Python types the text protocol produces
+    values['Main Mode'] = str(values['Main Mode'])
+    values['Sub Mode'] = str(values['Sub Mode'])
+    values['GPS'] = float(values['GPS'])
+    values['Armed or Not'] = _ARMED.get(values['Armed or Not'], 'No')
+    return fields[1], values
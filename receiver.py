@@ -1,72 +1,236 @@
+# Headless telemetry daemon for a companion computer.
+#
+# Reads one or more serial ports on an asyncio event loop and writes every
+# decoded sample to the configured sinks as JSON lines:
+#
+#   {"time": 1718000000.123, "vehicle": "COM15", "key": "Roll", "value": -2.37}
+#
+# Nothing here imports Qt (or NumPy), so it runs without a display and
+# starts in a fraction of a second. Importing the module opens nothing;
+# TelemetryDaemon can be embedded in another asyncio program, and its
+# latest values are available through latest().
+#
+# Usage: python receiver.py [PORT | ID=PORT[@BAUD] ...] [BAUD] [--stdout] [--file PATH] [--socket HOST:PORT]
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
 import serial
-ser = serial.Serial('COM15', 9600, timeout=1)
-try:
-    while True:
-        if ser.in_waiting > 0:
-            line = ser.readline().decode('utf-8').rstrip()
-            # print(line)
-            
-            # Split the line into key and value based on ':'
-            key_value = line.split(':')
-            
-            if len(key_value) == 2:
-                key = key_value[0].strip()
-                value = key_value[1].strip()
-                
-                # Assign variables based on key
-                if key == 'Battery Voltage':
-                    battery_voltage = float(value)
-                    print(f"Battery Voltage: {battery_voltage}")
-                elif key == 'Roll':
-                    roll = float(value)
-                    print(f"Roll: {roll}")
-                elif key == 'Pitch':
-                    pitch = float(value)
-                    print(f"Pitch: {pitch}")
-                elif key == 'Heading':
-                    heading = float(value)
-                    print(f"Heading: {heading}")
-                elif key == 'Number of Satellites':
-                    num_satellites = int(value)
-                    print(f"Number of Satellites: {num_satellites}")
-                elif key == 'Main Mode':
-                    mainmode = str(value)
-                    print(f"Mode: {mainmode}")
-                elif key == 'Sub Mode':
-                    submode = str(value)
-                    print(f"Mode: {submode}")
-                elif key == 'Error':
-                    error = int(value)
-                    print(f"Error: {error}")
-                elif key == 'GPS':
-                    gps = bool(value)
-                    print(f"GPS Status: {gps}")
-                elif key == 'Latitude':
-                    latitude = float(value)
-                    print(f"Latitude: {latitude}")
-                elif key == 'Longitude':
-                    longitude = float(value)
-                    print(f"Longitude: {longitude}")
-                elif key == 'Altitude':
-                    altitude = float(value)
-                    print(f"Altitude: {altitude}")
-                elif key == 'Distance Right':
-                    distance_right = int(value)
-                    print(f"Distance Right: {distance_right}")
-                elif key == 'Distance Left':
-                    distance_left = int(value)
-                    print(f"Distance Left: {distance_left}")
-                elif key == 'Distance Upper':
-                    distance_upper = int(value)
-                    print(f"Distance Upper: {distance_upper}")
-                elif key == 'Armed or Not':  
-                    armed = str(value)
-                    print(f"Armed or Not: {armed}")
-                     
-                    
-except KeyboardInterrupt:
-    print("Exiting program")
-finally:
-    ser.close()
-    
 
+from ingest import VehicleLink, parse_vehicle
+from ringlog import configure_logging, get_logger
+
+log = get_logger('ingest')
+
+DEFAULT_PORT = 'COM15'
+DEFAULT_BAUD = 9600
+
+
+class StreamSink:
+    """JSON lines to a binary stream (stdout or a file)."""
+
+    def __init__(self, stream, flush_interval=0.5):
+        self.stream = stream
+        self.flush_interval = flush_interval
+        self._flushed_at = time.monotonic()
+
+    async def start(self):
+        pass
+
+    def write(self, data):
+        self.stream.write(data)
+        now = time.monotonic()
+        if now - self._flushed_at >= self.flush_interval:
+            self.stream.flush()
+            self._flushed_at = now
+
+    async def close(self):
+        self.stream.flush()
+        if self.stream is not sys.stdout.buffer:
+            self.stream.close()
+
+
+class SocketSink:
+    """JSON lines to a TCP listener, reconnecting in the background when it goes away.
+
+    Lines are dropped (and counted) while disconnected or while more than
+    `max_buffer` bytes are waiting to be sent, so a slow listener never
+    holds up the serial ports.
+    """
+
+    def __init__(self, host, port, max_buffer=1 << 20, retry_interval=2.0):
+        self.host = host
+        self.port = port
+        self.max_buffer = max_buffer
+        self.retry_interval = retry_interval
+        self.writer = None
+        self.dropped = 0
+        self._task = None
+
+    async def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._connect())
+
+    async def _connect(self):
+        while True:
+            try:
+                _, self.writer = await asyncio.open_connection(self.host, self.port)
+                log.info("Socket sink connected to %s:%s", self.host, self.port)
+                return
+            except OSError as e:
+                log.warning("Socket sink cannot connect to %s:%s: %s", self.host, self.port, e)
+                await asyncio.sleep(self.retry_interval)
+
+    def write(self, data):
+        writer = self.writer
+        if writer is None:
+            self.dropped += 1
+            return
+        if writer.is_closing():
+            log.warning("Socket sink %s:%s disconnected", self.host, self.port)
+            self.writer = None
+            self._task = asyncio.get_running_loop().create_task(self._connect())
+            self.dropped += 1
+            return
+        if writer.transport.get_write_buffer_size() > self.max_buffer:
+            self.dropped += 1
+            return
+        writer.write(data)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+        if self.writer is not None:
+            self.writer.close()
+
+
+class TelemetryDaemon:
+    """Reads `vehicles` ((id, port, baudrate) tuples) and writes their samples to `sinks`."""
+
+    def __init__(self, vehicles, sinks=(), poll_interval=0.005):
+        self.vehicles = list(vehicles)
+        self.sinks = list(sinks)
+        self.poll_interval = poll_interval
+        self.links = {}
+        self._done = None
+
+    def latest(self, key, vehicle_id=None):
+        """Newest value of `key` (e.g. 'Battery Voltage'), from the first vehicle by default."""
+        link = self.links.get(vehicle_id) if vehicle_id is not None else next(iter(self.links.values()), None)
+        return link.store.get(key) if link is not None else None
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self._done = loop.create_future()
+        for sink in self.sinks:
+            await sink.start()
+        poller = None
+        try:
+            for vehicle_id, port, baudrate in self.vehicles:
+                link = VehicleLink(vehicle_id, port, baudrate)
+                link.open()
+                self.links[vehicle_id] = link
+                log.info("Vehicle %s connected on %s at %s baud", vehicle_id, port, baudrate)
+            if os.name == 'posix':
+                # The event loop waits on the port file descriptors themselves
+                for link in self.links.values():
+                    loop.add_reader(link.fileno(), self._read, link)
+            else:
+                poller = loop.create_task(self._poll_ports())
+            await self._done
+        finally:
+            if poller is not None:
+                poller.cancel()
+            for link in self.links.values():
+                if link.error is None and os.name == 'posix':
+                    loop.remove_reader(link.fileno())
+                link.close()
+            for sink in self.sinks:
+                await sink.close()
+
+    async def _poll_ports(self):
+        # Windows: serial handles cannot be waited on by the event loop
+        while True:
+            busy = False
+            for link in list(self.links.values()):
+                if link.error is None and link.in_waiting:
+                    busy = True
+                    self._read(link)
+            if not busy:
+                await asyncio.sleep(self.poll_interval)
+
+    def _read(self, link):
+        try:
+            samples = link.poll()
+        except (serial.SerialException, OSError) as e:
+            log.error("Vehicle %s: serial error on %s: %s", link.vehicle_id, link.port, e)
+            link.error = str(e)
+            if os.name == 'posix':
+                asyncio.get_running_loop().remove_reader(link.fileno())
+            if all(other.error is not None for other in self.links.values()):
+                self.stop()
+            return
+        if samples:
+            now = time.time()
+            data = ''.join(json.dumps({'time': now, 'vehicle': link.vehicle_id, 'key': key, 'value': value},
+                                      separators=(',', ':')) + '\n' for key, value in samples).encode('utf-8')
+            for sink in self.sinks:
+                sink.write(data)
+
+    def stop(self):
+        if self._done is not None and not self._done.done():
+            self._done.set_result(None)
+
+    def stats(self):
+        return {vehicle_id: link.stats() for vehicle_id, link in self.links.items()}
+
+
+def _socket_address(spec):
+    host, _, port = spec.rpartition(':')
+    return host or 'localhost', int(port)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless telemetry receiver writing JSON lines.")
+    parser.add_argument('ports', nargs='*', metavar='PORT',
+                        help=f"serial port or ID=PORT[@BAUD], repeat for several vehicles (default {DEFAULT_PORT}); "
+                             f"a trailing number is taken as the baud rate")
+    parser.add_argument('--baud', type=int, help=f"baud rate of ports without @BAUD (default {DEFAULT_BAUD})")
+    parser.add_argument('--stdout', action='store_true', help="write JSON lines to stdout (the default sink)")
+    parser.add_argument('--file', metavar='PATH', action='append', default=[], help="append JSON lines to PATH")
+    parser.add_argument('--socket', metavar='HOST:PORT', type=_socket_address, action='append', default=[],
+                        help="send JSON lines to a TCP listener")
+    parser.add_argument('--debug', action='store_true', help="log at DEBUG")
+    args = parser.parse_args(argv)
+
+    ports = list(args.ports)
+    baudrate = args.baud or DEFAULT_BAUD
+    if ports and ports[-1].isdigit():   # the old "receiver.py PORT BAUD" form
+        baudrate = args.baud or int(ports.pop())
+    vehicles = [parse_vehicle(spec, baudrate) for spec in ports or [DEFAULT_PORT]]
+
+    # Logs go to stderr, stdout may be a sink
+    configure_logging(args.debug, stream=sys.stderr)
+    sinks = [StreamSink(open(path, 'ab')) for path in args.file]
+    sinks += [SocketSink(host, port) for host, port in args.socket]
+    if args.stdout or not sinks:
+        sinks.append(StreamSink(sys.stdout.buffer, flush_interval=0))
+
+    daemon = TelemetryDaemon(vehicles, sinks)
+    try:
+        asyncio.run(daemon.run())
+    except serial.SerialException as e:
+        log.error("Serial exception: %s", e)
+        return 1
+    except KeyboardInterrupt:
+        pass
+    for vehicle_id, stats in daemon.stats().items():
+        log.info("Decoder stats %s: %s", vehicle_id, stats)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
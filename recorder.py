@@ -0,0 +1,219 @@
+# Append-only binary flight recorder.
+#
+# Every decoded telemetry sample is logged with its time.monotonic()
+# timestamp. The file is a fixed header followed by an array of 24-byte
+# records (RECORD_DTYPE), so a whole flight can be opened with numpy.memmap
+# without parsing:
+#
+#   header    HEADER_STRUCT, then a JSON description padded to `data_offset`
+#   records   time f8 | channel u2 | flags u2 | count u4 | value f8
+#
+# Every `block_records`-th record is an index record (channel ==
+# INDEX_CHANNEL) holding the time of the next sample, the block number and
+# the number of samples written before it. The index is therefore the
+# strided view records[::block_records], which FlightLog uses for seeking.
+#
+# Text values (modes, armed state) are stored as codes into a string table
+# kept next to the log in "<log>.strings", one string per line, and flagged
+# with FLAG_STRING.
+
+import json
+import os
+import struct
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from telemetry import FIELDS
+
+MAGIC = b'DRONELOG'
+FORMAT_VERSION = 1
+HEADER_STRUCT = struct.Struct('<8sHHII')   # magic, version, record size, block_records, data_offset
+
+RECORD_DTYPE = np.dtype([
+    ('time', '<f8'),
+    ('channel', '<u2'),
+    ('flags', '<u2'),
+    ('count', '<u4'),
+    ('value', '<f8'),
+])
+INDEX_CHANNEL = 0xFFFF
+FLAG_STRING = 0x0001   # value is a code into the string table
+
+_SAMPLE_DTYPE = np.dtype([('time', '<f8'), ('channel', '<u2'), ('flags', '<u2'), ('value', '<f8')])
+
+
+class FlightRecorder:
+    """Buffers samples in memory and appends them to the log on a background thread.
+
+    record() and record_many() only append to a deque, so the serial
+    reader never waits on the disk.
+    """
+
+    def __init__(self, path, block_records=4096, flush_interval=0.25, channels=FIELDS):
+        self.path = path
+        self.block_records = block_records
+        self.flush_interval = flush_interval
+        self.channels = {name: index for index, name in enumerate(channels)}
+        self.strings = {}
+
+        self._pending = deque()
+        self._position = 0        # records written, index records included
+        self.blocks = 0
+        self.samples_written = 0
+        self.dropped = 0          # samples for unknown channels or unconvertible values
+
+        self._file = open(path, 'wb')
+        self._strings_file = open(path + '.strings', 'w', encoding='utf-8')
+        self._write_header()
+
+        self._wake = threading.Event()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='FlightRecorder', daemon=True)
+        self._thread.start()
+
+    def _write_header(self):
+        description = json.dumps({
+            'channels': list(self.channels),
+            'monotonic_start': time.monotonic(),
+            'wall_start': time.time(),
+        }).encode('utf-8')
+        data_offset = HEADER_STRUCT.size + len(description)
+        data_offset += -data_offset % 64
+        header = HEADER_STRUCT.pack(MAGIC, FORMAT_VERSION, RECORD_DTYPE.itemsize, self.block_records, data_offset)
+        self._file.write((header + description).ljust(data_offset, b' '))
+
+    def record(self, key, value, timestamp=None):
+        self._pending.append((time.monotonic() if timestamp is None else timestamp, ((key, value),)))
+
+    def record_many(self, items, timestamp=None):
+        """Log several (key, value) pairs that arrived together."""
+        self._pending.append((time.monotonic() if timestamp is None else timestamp, items))
+
+    def _run(self):
+        while self._running:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self._flush()
+        self._flush()
+
+    def _flush(self):
+        samples = []
+        pending = self._pending
+        while pending:
+            timestamp, items = pending.popleft()
+            for key, value in items:
+                sample = self._encode(timestamp, key, value)
+                if sample is None:
+                    self.dropped += 1
+                else:
+                    samples.append(sample)
+        if samples:
+            self._write_samples(np.array(samples, dtype=_SAMPLE_DTYPE))
+
+    def _encode(self, timestamp, key, value):
+        channel = self.channels.get(key)
+        if channel is None:
+            return None
+        if isinstance(value, str):
+            code = self.strings.get(value)
+            if code is None:
+                code = self.strings[value] = len(self.strings)
+                self._strings_file.write(value.replace('\n', ' ') + '\n')
+            return timestamp, channel, FLAG_STRING, float(code)
+        try:
+            return timestamp, channel, 0, float(value)
+        except (TypeError, ValueError):
+            return None
+
+    def _write_samples(self, samples):
+        # Copy the samples into the record layout block by block, starting each block with its index record
+        count = len(samples)
+        records = np.zeros(count + count // (self.block_records - 1) + 1, RECORD_DTYPE)
+        out = 0
+        taken = 0
+        while taken < count:
+            if self._position % self.block_records == 0:
+                records[out] = (samples['time'][taken], INDEX_CHANNEL, 0, self.blocks, self.samples_written + taken)
+                out += 1
+                self._position += 1
+                self.blocks += 1
+            take = min(self.block_records - self._position % self.block_records, count - taken)
+            chunk = records[out:out + take]
+            for name in _SAMPLE_DTYPE.names:
+                chunk[name] = samples[name][taken:taken + take]
+            out += take
+            taken += take
+            self._position += take
+        self._file.write(records[:out].tobytes())
+        self._file.flush()
+        self._strings_file.flush()
+        self.samples_written += count
+
+    def close(self):
+        if not self._running:
+            return
+        self._running = False
+        self._wake.set()
+        self._thread.join()
+        self._file.close()
+        self._strings_file.close()
+
+
+class FlightLog:
+    """Zero-copy read access to a recorded flight through numpy.memmap."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as log_file:
+            header = log_file.read(HEADER_STRUCT.size)
+            magic, version, record_size, self.block_records, data_offset = HEADER_STRUCT.unpack(header)
+            if magic != MAGIC or version != FORMAT_VERSION or record_size != RECORD_DTYPE.itemsize:
+                raise ValueError(f"{path} is not a version {FORMAT_VERSION} flight log")
+            self.description = json.loads(log_file.read(data_offset - HEADER_STRUCT.size))
+        self.channels = self.description['channels']
+
+        count = (os.path.getsize(path) - data_offset) // RECORD_DTYPE.itemsize
+        if count:
+            self.records = np.memmap(path, RECORD_DTYPE, mode='r', offset=data_offset, shape=(count,))
+        else:
+            self.records = np.zeros(0, RECORD_DTYPE)   # mmap cannot map an empty range
+        self.index = self.records[::self.block_records]
+
+        strings_path = path + '.strings'
+        self.strings = []
+        if os.path.exists(strings_path):
+            with open(strings_path, encoding='utf-8') as strings_file:
+                self.strings = strings_file.read().splitlines()
+
+    @property
+    def samples(self):
+        """Every sample record (index records removed; this one copies)."""
+        return self.records[self.records['channel'] != INDEX_CHANNEL]
+
+    def channel(self, name, records=None):
+        """Return (times, values) of one channel; string channels give a list of str."""
+        channel = self.channels.index(name)
+        records = self.records if records is None else records
+        selected = records[records['channel'] == channel]
+        if len(selected) and selected['flags'][0] & FLAG_STRING:
+            return selected['time'], [self.strings[int(code)] for code in selected['value']]
+        return selected['time'], selected['value']
+
+    def seek(self, start, end=None):
+        """Records between monotonic times `start` and `end`, as a view found through the index."""
+        first_block = max(int(np.searchsorted(self.index['time'], start, side='right')) - 1, 0)
+        stop = len(self.records)
+        if end is not None:
+            last_block = int(np.searchsorted(self.index['time'], end, side='right'))
+            stop = min(last_block * self.block_records, stop)
+        records = self.records[first_block * self.block_records:stop]
+        # Trim the partial blocks at both ends with a search on that small range only
+        times = records['time']
+        lo = int(np.searchsorted(times[:self.block_records], start))
+        if end is None:
+            return records[lo:]
+        tail = times[-self.block_records:]
+        hi = len(records) - len(tail) + int(np.searchsorted(tail, end, side='right'))
+        return records[lo:max(hi, lo)]
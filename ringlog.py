@@ -0,0 +1,131 @@
+# Leveled, ring-buffered logging for the dashboard.
+#
+# Every subsystem logs through its own stdlib logger under "drone"
+# (drone.serial, drone.camera, drone.ui, ...), so levels can be set per
+# subsystem. Records are not formatted or written by the thread that logs
+# them: RingBufferHandler only appends them to a bounded deque, and a
+# background thread formats and writes them a few times per second. If the
+# writer falls behind, the oldest records are dropped and counted.
+#
+# Per-line messages are logged at DEBUG. With the default INFO level the
+# logger's level check rejects them before a LogRecord is even created, and
+# hot loops additionally hoist that check out of the loop.
+
+import atexit
+import logging
+import sys
+import threading
+from collections import deque
+
+ROOT_LOGGER = 'drone'
+SUBSYSTEMS = ('serial', 'camera', 'ui', 'recorder', 'ingest', 'network')
+LOG_FORMAT = '%(asctime)s %(levelname)-7s %(name)s: %(message)s'
+
+
+def get_logger(subsystem):
+    return logging.getLogger(f"{ROOT_LOGGER}.{subsystem}")
+
+
+class RingBufferHandler(logging.Handler):
+    """Queues records in a fixed-size ring and writes them from a background thread."""
+
+    def __init__(self, stream=None, capacity=10000, flush_interval=0.2):
+        super().__init__()
+        self.stream = stream or sys.stdout
+        self.records = deque(maxlen=capacity)
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._wake = threading.Event()
+        self._running = True
+        self._flush_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='RingBufferHandler', daemon=True)
+        self._thread.start()
+
+    def emit(self, record):
+        records = self.records
+        if len(records) == records.maxlen:
+            self.dropped += 1
+        records.append(record)
+
+    def handle(self, record):
+        # deque.append is thread-safe, so skip Handler.handle's per-record lock
+        if self.filter(record):
+            self.emit(record)
+        return record
+
+    def _run(self):
+        while self._running:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        with self._flush_lock:
+            records = self.records
+            if not records:
+                return
+            lines = []
+            while records:
+                try:
+                    lines.append(self.format(records.popleft()))
+                except Exception:
+                    lines.append('<unformattable log record>')
+            try:
+                self.stream.write('\n'.join(lines) + '\n')
+                self.stream.flush()
+            except (OSError, ValueError):
+                pass   # stream closed during shutdown
+
+    def close(self):
+        self._running = False
+        self._wake.set()
+        self._thread.join(timeout=1.0)
+        self.flush()
+        super().close()
+
+
+_handler = None
+_configured_levels = {}   # restored when debug mode is switched off
+
+
+def configure_logging(debug=False, levels=None, stream=None, capacity=10000, flush_interval=0.2):
+    """Install the ring-buffer handler on the "drone" logger.
+
+    `levels` maps subsystem names to level names, e.g. {'serial': 'DEBUG'};
+    `debug` sets every subsystem to DEBUG.
+    """
+    global _handler
+    root = logging.getLogger(ROOT_LOGGER)
+    if _handler is None:
+        _handler = RingBufferHandler(stream, capacity, flush_interval)
+        _handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        root.addHandler(_handler)
+        root.propagate = False
+        atexit.register(_handler.close)
+    root.setLevel(logging.INFO)
+    _configured_levels.clear()
+    _configured_levels.update({subsystem: level.upper() for subsystem, level in (levels or {}).items()})
+    set_debug(debug)
+    return _handler
+
+
+def set_debug(enabled, subsystem=None):
+    """Switch DEBUG on or off at runtime, for one subsystem or all of them."""
+    for name in ([subsystem] if subsystem else set(SUBSYSTEMS) | set(_configured_levels)):
+        get_logger(name).setLevel(logging.DEBUG if enabled else _configured_levels.get(name, logging.NOTSET))
+
+
+def debug_enabled(subsystem=None):
+    logger = get_logger(subsystem) if subsystem else logging.getLogger(ROOT_LOGGER)
+    return logger.isEnabledFor(logging.DEBUG)
+
+
+def parse_levels(spec):
+    """Parse "serial=DEBUG,camera=WARNING" into {'serial': 'DEBUG', 'camera': 'WARNING'}."""
+    levels = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        subsystem, _, level = item.partition('=')
+        if not isinstance(logging.getLevelName(level.upper()), int):
+            raise ValueError(f"unknown log level {level!r} for {subsystem!r}")
+        levels[subsystem] = level.upper()
+    return levels
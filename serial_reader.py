@@ -0,0 +1,158 @@
+# Blocking, chunked line reader for the telemetry serial link.
+#
+# Instead of spinning on `ser.in_waiting` and calling readline() per line,
+# the reader blocks in read() until data arrives (or the port timeout
+# expires), pulls everything that is buffered in one call and splits lines
+# out of a reusable bytearray. Binary frames (see protocol.py) are split
+# out of the same buffer on their zero delimiter.
+
+import time
+
+from protocol import MAX_ENCODED_SIZE, FrameError, decode_frame
+
+PROTOCOLS = ('auto', 'text', 'binary')
+
+
+class SerialLineReader:
+    """Reads newline terminated lines from an open serial port.
+
+    `ser` only needs `read(n)`, `in_waiting` and a read timeout, so any
+    pyserial port (or a file-like stand-in) works. A partial line at the
+    end of a chunk is carried over and completed by the next read.
+
+    With protocol='auto' the reader switches to binary frames as soon as
+    a valid one arrives; text-only firmware never sends a zero byte, so it
+    keeps being read as lines. Until then lines are only split once more
+    than a whole frame's worth of bytes arrived without a zero byte, so the
+    start of a binary stream is not taken for text.
+    """
+
+    def __init__(self, ser, max_line_length=4096, stats_interval=1.0, protocol='auto'):
+        if protocol not in PROTOCOLS:
+            raise ValueError(f"protocol must be one of {PROTOCOLS}")
+        self.ser = ser
+        self.buffer = bytearray()
+        self.max_line_length = max_line_length
+        self.stats_interval = stats_interval
+        self.protocol = protocol
+
+        self.bytes_total = 0
+        self.lines_total = 0
+        self.frames_total = 0
+        self.frame_errors = 0
+        self.carry_over_total = 0   # chunks that ended in the middle of a line
+        self.overflows = 0          # partial lines dropped for exceeding max_line_length
+        self.bytes_per_second = 0.0
+        self.lines_per_second = 0.0
+        self.read_at = None         # time.perf_counter() of the last read that returned data
+        self._text_seen = False     # auto: too many bytes without a zero byte for a frame
+        self._window_start = time.monotonic()
+        self._window_bytes = 0
+        self._window_lines = 0
+
+    def read_chunk(self):
+        # read(1) blocks until the first byte arrives or the timeout expires,
+        # so an idle link costs no CPU; anything already buffered comes along
+        data = self.ser.read(self.ser.in_waiting or 1)
+        if data:
+            self.read_at = time.perf_counter()
+            self.buffer += data
+            self.bytes_total += len(data)
+            self._window_bytes += len(data)
+        return data
+
+    def split_lines(self):
+        buffer = self.buffer
+        # One decode for every complete line of the chunk rather than one per line;
+        # a newline never falls inside a UTF-8 sequence, so the result is the same
+        end = buffer.rfind(b'\n')
+        if end == -1:
+            lines = []
+        else:
+            lines = [line.rstrip() for line in buffer[:end].decode('utf-8', errors='replace').split('\n')]
+            del buffer[:end + 1]
+        if buffer:
+            self.carry_over_total += 1
+            if len(buffer) > self.max_line_length:
+                self.overflows += 1
+                buffer.clear()
+        self.lines_total += len(lines)
+        self._window_lines += len(lines)
+        return lines
+
+    def split_frames(self):
+        buffer = self.buffer
+        frames = []
+        start = 0
+        end = buffer.find(0, start)
+        while end != -1:
+            if end > start:
+                try:
+                    frames.append(decode_frame(buffer, start, end))
+                except FrameError:
+                    self.frame_errors += 1
+            start = end + 1
+            end = buffer.find(0, start)
+        if start:
+            del buffer[:start]
+        if buffer:
+            self.carry_over_total += 1
+            if len(buffer) > self.max_line_length:
+                self.overflows += 1
+                buffer.clear()
+        self.frames_total += len(frames)
+        # A frame carries a whole cycle; it counts as one record in the rate
+        self._window_lines += len(frames)
+        return frames
+
+    def read_records(self):
+        """Block for up to the port timeout and return the complete records received.
+
+        Text lines come back as str, binary frames as (sequence, {key: value}).
+        """
+        records = []
+        if self.read_chunk():
+            if self.protocol == 'text':
+                records = self.split_lines()
+            elif self.protocol == 'binary':
+                records = self.split_frames()
+            elif 0 in self.buffer:
+                records = self.split_frames()
+                if records:
+                    self.protocol = 'binary'
+            elif self._text_seen or (len(self.buffer) > MAX_ENCODED_SIZE and b'\n' in self.buffer):
+                self._text_seen = True
+                records = self.split_lines()
+            elif len(self.buffer) > self.max_line_length:
+                self.overflows += 1
+                self.buffer.clear()
+        self._update_rates()
+        return records
+
+    def _update_rates(self):
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed >= self.stats_interval:
+            self.bytes_per_second = self._window_bytes / elapsed
+            self.lines_per_second = self._window_lines / elapsed
+            self._window_start = now
+            self._window_bytes = 0
+            self._window_lines = 0
+
+    @property
+    def carry_over_bytes(self):
+        return len(self.buffer)
+
+    def stats(self):
+        return {
+            'bytes_per_second': self.bytes_per_second,
+            'lines_per_second': self.lines_per_second,
+            'carry_over_bytes': self.carry_over_bytes,
+            'carry_over_total': self.carry_over_total,
+            'bytes_total': self.bytes_total,
+            'lines_total': self.lines_total,
+            'frames_total': self.frames_total,
+            'frame_errors': self.frame_errors,
+            'protocol': self.protocol,
+            'overflows': self.overflows,
+        }
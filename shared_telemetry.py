@@ -0,0 +1,369 @@
+# Serial ingest in a separate process, publishing through shared memory.
+#
+# Serial parsing, camera capture and Qt painting otherwise share one
+# interpreter and its GIL. IngestProcess moves the IngestService into a
+# child process. Each vehicle gets a SharedTelemetryBlock, a small
+# multiprocessing.shared_memory segment laid out as BLOCK_DTYPE: the latest
+# value of every FIELDS entry plus a per-field change version, exactly what
+# TelemetryStore holds. The render tick reads the blocks; decoded samples
+# are also forwarded, one pickled chunk per read, to the parent's sinks
+# (strip charts, battery estimate, GPS tracks), which need every sample of
+# every vehicle rather than the latest values.
+#
+# The child is the only writer. It brackets every update with a seqlock:
+# `sequence` is odd while an update is in progress and incremented again
+# when it is complete. Readers copy the block without taking any lock and
+# retry if `sequence` was odd or changed meanwhile, so the render tick never
+# waits on the ingest process.
+
+import itertools
+import multiprocessing
+import queue
+import threading
+import time
+
+import numpy as np
+import serial
+from multiprocessing import shared_memory
+
+from ringlog import get_logger
+from telemetry import FIELDS, TELEMETRY_SCHEMA, _to_int
+
+log = get_logger('ingest')
+
+TEXT_SIZE = 32   # bytes kept of a text value (modes, armed state)
+SAMPLE_CHUNKS = 4096   # decoded chunks in flight to the parent's sinks at most
+
+BLOCK_DTYPE = np.dtype([
+    ('sequence', '<u8'),
+    ('version', '<u8'),
+    ('failed', '<u8'),    # set by the ingest process when the port went away
+    ('versions', '<u8', (len(FIELDS),)),
+    ('values', '<f8', (len(FIELDS),)),
+    ('text', f'S{TEXT_SIZE}', (len(FIELDS),)),
+])
+
+_INDEX = {key: index for index, key in enumerate(FIELDS)}
+# 's': stored in `text`, 'i': stored in `values` and read back as int, 'f': float
+_KINDS = tuple('s' if TELEMETRY_SCHEMA[key].converter is str.strip else
+               'i' if TELEMETRY_SCHEMA[key].converter is _to_int else 'f' for key in FIELDS)
+
+
+class SharedTelemetryBlock:
+    """Latest telemetry values of one vehicle in shared memory.
+
+    The writer side offers TelemetryStore.update(); the reader side offers
+    changed_since(), get(), snapshot() and take_trace(), so the dashboard
+    can render from either store.
+    """
+
+    def __init__(self, name=None, create=False):
+        self._shm = shared_memory.SharedMemory(name, create=create, size=BLOCK_DTYPE.itemsize if create else 0)
+        self.name = self._shm.name
+        self._owner = create
+        self._closed_copy = None   # what readers see once the block is closed
+        self._block = np.ndarray((), BLOCK_DTYPE, buffer=self._shm.buf)
+        if create:
+            self._block[()] = 0
+        self._header = np.ndarray(3, '<u8', buffer=self._shm.buf)   # sequence, version, failed
+        self._versions = self._block['versions']
+        self._values = self._block['values']
+        self._text = self._block['text']
+        # The writer compares against plain Python copies, element access on the arrays is slow
+        self._written = [None] * len(FIELDS)
+
+    # Writer (ingest process)
+
+    def update(self, values, trace=None):
+        header = self._header
+        sequence = int(header[0])
+        header[0] = sequence + 1   # odd: update in progress
+        version = int(header[1]) + 1
+        header[1] = version
+        written, versions = self._written, self._versions
+        for key, value in values.items():
+            index = _INDEX.get(key)
+            if index is None:
+                continue
+            if _KINDS[index] == 's':
+                value = str(value).encode('utf-8')[:TEXT_SIZE]
+                if value != written[index]:
+                    self._text[index] = value
+                    written[index] = value
+                    versions[index] = version
+                continue
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                continue
+            if value != written[index]:
+                self._values[index] = value
+                written[index] = value
+                versions[index] = version
+        header[0] = sequence + 2   # even: consistent again
+
+    def set_failed(self, failed=True):
+        self._header[2] = int(failed)
+
+    # Reader (dashboard)
+
+    def _read(self):
+        """Consistent copy of (version, versions, values, text), retried while the writer is mid-update."""
+        if self._block is None:
+            return self._closed_copy
+        header = self._header
+        spins = 0
+        while True:
+            sequence = int(header[0])
+            if not sequence & 1:
+                version = int(header[1])
+                versions = self._versions.copy()
+                values = self._values.copy()
+                text = self._text.copy()
+                if int(header[0]) == sequence:
+                    return version, versions, values, text
+            spins += 1
+            if spins % 100 == 0:
+                time.sleep(0)   # let the writer finish
+
+    @staticmethod
+    def _value(index, values, text):
+        kind = _KINDS[index]
+        if kind == 's':
+            return text[index].decode('utf-8', errors='replace')
+        return int(values[index]) if kind == 'i' else float(values[index])
+
+    def changed_since(self, version):
+        """Return (current version, {key: value} of the fields changed after `version`)."""
+        current, versions, values, text = self._read()
+        changed = {FIELDS[index]: self._value(index, values, text)
+                   for index in np.flatnonzero(versions > version)}
+        return current, changed
+
+    def snapshot(self):
+        return self.changed_since(0)[1]
+
+    def get(self, key, default=None):
+        return self.snapshot().get(key, default)
+
+    def take_trace(self):
+        return None   # latency traces do not cross the process boundary
+
+    @property
+    def version(self):
+        return self._read()[0]
+
+    @property
+    def failed(self):
+        return self._block is not None and bool(self._header[2])
+
+    def close(self):
+        if self._block is None:
+            return
+        self._closed_copy = self._read()
+        self._header = self._versions = self._values = self._text = self._block = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+
+def _run_ingest(commands, replies, samples, samples_dropped, fanout_port):
+    """Ingest process: an IngestService whose vehicle stores are shared blocks."""
+    from ingest import IngestService
+
+    def forward(vehicle_id, chunk):
+        try:
+            samples.put_nowait((vehicle_id, chunk))
+        except queue.Full:
+            samples_dropped.value += 1   # the parent's sinks are behind
+
+    fanout = None
+    if fanout_port is not None:
+        from fanout import TelemetryFanout
+
+        fanout = TelemetryFanout(tcp_address=('', fanout_port))
+        fanout.start()
+
+    blocks = {}
+    retired = []   # (link, block) of removed vehicles; a block is closed once the ingest thread closed its link
+    ingest = IngestService(sink=forward)
+    if fanout is not None:
+        ingest.add_sink(fanout.publish)
+    ingest.start()
+
+    def retire(vehicle_id):
+        link = ingest.links.get(vehicle_id)
+        ingest.remove_vehicle(vehicle_id)
+        block = blocks.pop(vehicle_id, None)
+        if block is not None:
+            retired.append((link, block))
+
+    def close_retired():
+        for link, block in list(retired):
+            if link is None or link.closed:
+                block.close()
+                retired.remove((link, block))
+
+    try:
+        while True:
+            close_retired()
+            try:
+                command = commands.get(timeout=0.5)
+            except queue.Empty:
+                # Report ports that went away through their block
+                for vehicle_id, link in list(ingest.links.items()):
+                    if link.error is not None and vehicle_id in blocks:
+                        blocks[vehicle_id].set_failed()
+                continue
+            action = command[0]
+            if action == 'stop':
+                break
+            if action == 'add':
+                _, request, vehicle_id, port, baudrate, protocol, recorder_path, block_name = command
+                if vehicle_id in blocks:
+                    retire(vehicle_id)
+                try:
+                    block = SharedTelemetryBlock(block_name)
+                except FileNotFoundError:
+                    # The parent gave up waiting and unlinked it; its 'remove' follows
+                    replies.put((request, f"shared block {block_name} is gone"))
+                    continue
+                try:
+                    ingest.add_vehicle(vehicle_id, port, baudrate, protocol, recorder_path=recorder_path, store=block)
+                except serial.SerialException as e:
+                    block.close()
+                    replies.put((request, str(e)))
+                    continue
+                blocks[vehicle_id] = block
+                replies.put((request, None))
+            elif action == 'remove':
+                retire(command[1])
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ingest.stop()
+        if fanout is not None:
+            fanout.stop()
+        for block in list(blocks.values()) + [block for _, block in retired]:
+            block.close()
+
+
+class SharedVehicleLink:
+    """The dashboard's view of a vehicle read by the ingest process."""
+
+    def __init__(self, vehicle_id, port, baudrate, store):
+        self.vehicle_id = vehicle_id
+        self.port = port
+        self.baudrate = baudrate
+        self.store = store
+        self.failed_at = None   # not known here; the dashboard notices within a stats poll
+
+    @property
+    def error(self):
+        return "serial port lost in the ingest process" if self.store.failed else None
+
+
+class IngestProcess:
+    """IngestService in a child process; same add/remove/store/add_sink interface.
+
+    Sinks are called as sink(vehicle_id, samples) with every chunk the
+    child decoded, on a thread of this process. With `fanout_port` the
+    network fan-out (see fanout.py) runs in the child as well, next to the
+    samples it publishes.
+    """
+
+    def __init__(self, fanout_port=None, reply_timeout=5.0):
+        self.reply_timeout = reply_timeout
+        self.links = {}
+        self.sinks = []
+        # spawn: forking a process that runs Qt and capture threads is not safe
+        context = multiprocessing.get_context('spawn')
+        self._commands = context.Queue()
+        self._replies = context.Queue()
+        self._samples = context.Queue(SAMPLE_CHUNKS)
+        self._samples_dropped = context.RawValue('q', 0)
+        self._requests = itertools.count()   # replies are matched on these, not on the vehicle
+        self._process = context.Process(
+            target=_run_ingest, name='IngestProcess',
+            args=(self._commands, self._replies, self._samples, self._samples_dropped, fanout_port))
+        self._sink_thread = threading.Thread(target=self._run_sinks, name='IngestSinks', daemon=True)
+
+    def start(self):
+        self._process.start()
+        self._sink_thread.start()
+        log.info("Serial ingest running in process %s", self._process.pid)
+
+    def add_sink(self, sink):
+        # Replaced, not appended to: the sink thread may be iterating the old list
+        self.sinks = self.sinks + [sink]
+
+    def _run_sinks(self):
+        while True:
+            item = self._samples.get()
+            if item is None:
+                break
+            vehicle_id, samples = item
+            for sink in self.sinks:
+                sink(vehicle_id, samples)
+
+    @property
+    def samples_dropped(self):
+        """Decoded chunks the child could not forward because the sinks were behind."""
+        return self._samples_dropped.value
+
+    def add_vehicle(self, vehicle_id, port, baudrate=9600, protocol='auto', recorder_path=None):
+        """Have the ingest process open `port`; raises serial.SerialException if it cannot."""
+        self.remove_vehicle(vehicle_id)
+        block = SharedTelemetryBlock(create=True)
+        request = next(self._requests)
+        self._commands.put(('add', request, vehicle_id, port, baudrate, protocol, recorder_path, block.name))
+        deadline = time.monotonic() + self.reply_timeout
+        while True:
+            try:
+                reply, error = self._replies.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                # Undo the add should the child still get to it; a late reply is skipped by its request
+                self._commands.put(('remove', vehicle_id))
+                block.close()
+                raise serial.SerialException(f"ingest process did not open {port}")
+            if reply == request:
+                break
+        if error is not None:
+            block.close()
+            raise serial.SerialException(error)
+        link = self.links[vehicle_id] = SharedVehicleLink(vehicle_id, port, baudrate, block)
+        log.info("Vehicle %s connected on %s at %s baud (ingest process)", vehicle_id, port, baudrate)
+        return link
+
+    def remove_vehicle(self, vehicle_id):
+        link = self.links.pop(vehicle_id, None)
+        if link is not None:
+            self._commands.put(('remove', vehicle_id))
+            # The child may still be attached; unlinking only removes the name
+            link.store.close()
+            log.info("Vehicle %s disconnected", vehicle_id)
+
+    def store(self, vehicle_id):
+        return self.links[vehicle_id].store
+
+    def stats(self):
+        return {vehicle_id: {'vehicle_id': vehicle_id, 'port': link.port, 'baudrate': link.baudrate,
+                             'error': link.error, 'version': link.store.version}
+                for vehicle_id, link in self.links.items()}
+
+    def stop(self):
+        if self._process.is_alive():
+            self._commands.put(('stop',))
+            # The sink thread keeps draining meanwhile, the child's last chunks must get out
+            self._process.join(timeout=3.0)
+            if self._process.is_alive():
+                self._process.terminate()
+        if self._sink_thread.is_alive():
+            self._samples.put(None)
+            self._sink_thread.join(timeout=2.0)
+        if self.samples_dropped:
+            log.warning("%d decoded chunks never reached the dashboard's sinks", self.samples_dropped)
+        for link in self.links.values():
+            link.store.close()
+        self.links.clear()
+
@@ -0,0 +1,222 @@
+# Virtual serial link for development and load testing.
+#
+# TelemetrySimulator creates a pseudo-terminal pair and streams telemetry
+# into it, so the dashboard and receiver.py can open the slave end (e.g.
+# /dev/pts/5) exactly like the Arduino's COM port. The stream is either a
+# synthetic flight covering all 16 fields, or a replay of a recording made
+# by recorder.FlightRecorder.
+#
+# Usage: python simulator.py [--rate LINES_PER_S] [--replay LOG [--realtime]] [--binary]
+#
+# POSIX only (pty).
+
+import argparse
+import itertools
+import math
+import os
+import sys
+import threading
+import time
+
+from protocol import FrameError, encode_frame
+from telemetry import FIELDS
+
+# Nominal firmware rate: 10 cycles per second of 16 lines
+DEFAULT_RATE = 10 * len(FIELDS)
+
+
+def synthetic_cycles(cycle_rate=10.0):
+    """Endless plausible telemetry, one {key: value} dict per cycle."""
+    cycle = 0
+    while True:
+        t = cycle / cycle_rate
+        yield {
+            'Battery Voltage': round(12.6 - 0.0008 * t - 0.15 * (math.sin(t) > 0.8), 2),
+            'Roll': round(15 * math.sin(t * 0.7), 2),
+            'Pitch': round(10 * math.sin(t * 0.5 + 1), 2),
+            'Heading': round((t * 6) % 360, 1),
+            'Number of Satellites': 8 + int(3 * math.sin(t * 0.05)),
+            'Main Mode': str(1 + (int(t) // 30) % 3),
+            'Sub Mode': str((int(t) // 10) % 4),
+            'Error': 0,
+            'GPS': 1,
+            'Latitude': round(12.971599 + 0.001 * math.sin(t * 0.01), 6),
+            'Longitude': round(77.594566 + 0.001 * math.cos(t * 0.01), 6),
+            'Altitude': round(40 + 10 * math.sin(t * 0.1), 1),
+            'Distance Right': 150 + int(50 * math.sin(t)),
+            'Distance Left': 150 + int(50 * math.cos(t)),
+            'Distance Upper': 90 + int(20 * math.sin(t * 0.3)),
+            'Armed or Not': 'Yes' if t > 3 else 'No',
+        }
+        cycle += 1
+
+
+def text_records(cycles):
+    for values in cycles:
+        for key, value in values.items():
+            yield f"{key}: {value}\n".encode('ascii')
+
+
+def binary_records(cycles):
+    for sequence, values in enumerate(cycles):
+        yield encode_frame(values, sequence)
+
+
+def binary_groups(groups):
+    """The (timestamp, values) groups that fit a binary frame.
+
+    Frames carry the modes as numbers and the counts in fixed-size fields;
+    groups that do not fit are left out, with a note on stderr, rather than
+    stopping the replay halfway.
+    """
+    kept = []
+    for timestamp, values in groups:
+        try:
+            encode_frame(values)
+        except FrameError as e:
+            print(f"Not replayed as a binary frame: {e}", file=sys.stderr)
+            continue
+        kept.append((timestamp, values))
+    return kept
+
+
+def replay_cycles(path):
+    """Yield (timestamp, {key: value}) groups from a flight recording, in recorded order.
+
+    The recorder stamps every sample of a read chunk with the same time, so a
+    repeated key also starts a new group: one group per telemetry cycle.
+    """
+    from recorder import INDEX_CHANNEL, FLAG_STRING, FlightLog
+
+    log = FlightLog(path)
+    group_time = None
+    group = {}
+    for record in log.records:
+        if record['channel'] == INDEX_CHANNEL:
+            continue
+        timestamp = float(record['time'])
+        key = log.channels[record['channel']]
+        if group and (timestamp != group_time or key in group):
+            yield group_time, group
+            group = {}
+        group_time = timestamp
+        value = record['value']
+        if record['flags'] & FLAG_STRING:
+            value = log.strings[int(value)]
+        group[key] = value
+    if group:
+        yield group_time, group
+
+
+class TelemetrySimulator:
+    """Streams telemetry records into a pty at a fixed rate.
+
+    `records` yields bytes, one line or one binary frame each; `rate` is in
+    records per second. With `schedule` (timestamps matching the records)
+    the original timing is kept instead.
+    """
+
+    def __init__(self, records, rate=DEFAULT_RATE, schedule=None):
+        if os.name != 'posix':
+            raise RuntimeError("the telemetry simulator needs a POSIX pty")
+        import tty
+
+        self.records = iter(records)
+        self.rate = rate
+        self.schedule = schedule
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        self.sent = 0
+        self.running = False
+        self._thread = None
+
+    def start(self):
+        self.running = True
+        self._thread = threading.Thread(target=self._run, name='TelemetrySimulator', daemon=True)
+        self._thread.start()
+        return self.port
+
+    def _run(self):
+        start = time.perf_counter()
+        schedule = iter(self.schedule) if self.schedule is not None else None
+        first_time = None
+        while self.running:
+            elapsed = time.perf_counter() - start
+            if schedule is not None:
+                # Realtime replay: one record per recorded timestamp
+                timestamp = next(schedule, None)
+                if timestamp is None:
+                    break
+                if first_time is None:
+                    first_time = timestamp
+                delay = timestamp - first_time - elapsed
+                if delay > 0:
+                    time.sleep(delay)
+                due = 1
+            else:
+                due = int(elapsed * self.rate) - self.sent
+                if due <= 0:
+                    time.sleep(min(0.01, 1.0 / self.rate))
+                    continue
+            records = list(itertools.islice(self.records, due))
+            if not records:
+                break
+            # Blocks when the reader falls behind, which throttles the simulator to the reader's pace
+            os.write(self.master, b''.join(records))
+            self.sent += len(records)   # fewer than due at the end of a replay
+        self.running = False
+
+    def achieved_rate(self, elapsed):
+        return self.sent / elapsed if elapsed else 0.0
+
+    def stop(self):
+        self.running = False
+        if self._thread:
+            self._thread.join(timeout=1.0)
+        os.close(self.master)
+        os.close(self.slave)
+
+
+def create_simulator(rate=DEFAULT_RATE, replay=None, realtime=False, binary=False):
+    if replay:
+        groups = list(replay_cycles(replay))
+        if binary:
+            groups = binary_groups(groups)
+        cycles = (values for _, values in groups)
+        schedule = [timestamp for timestamp, _ in groups] if realtime else None
+        if schedule is not None and not binary:
+            # One timestamp per line of each recorded group
+            schedule = [timestamp for timestamp, values in groups for _ in values]
+    else:
+        cycles = synthetic_cycles()
+        schedule = None
+    records = binary_records(cycles) if binary else text_records(cycles)
+    return TelemetrySimulator(records, rate, schedule)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream synthetic or recorded telemetry into a pty.")
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE,
+                        help="records per second (lines, or frames with --binary)")
+    parser.add_argument('--replay', metavar='LOG', help="flight recording to replay instead of synthetic data")
+    parser.add_argument('--realtime', action='store_true', help="replay with the recorded timing")
+    parser.add_argument('--binary', action='store_true', help="send binary frames instead of text lines")
+    args = parser.parse_args()
+
+    simulator = create_simulator(args.rate, args.replay, args.realtime, args.binary)
+    print(f"Simulated telemetry on {simulator.port}", flush=True)
+    start = time.perf_counter()
+    simulator.start()
+    try:
+        while simulator.running:
+            time.sleep(1.0)
+            print(f"{simulator.achieved_rate(time.perf_counter() - start):,.0f} records/s", file=sys.stderr)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        simulator.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+# Pre-trigger snapshots of the full-resolution camera stream.
+#
+# The camera thread copies every captured frame into a SnapshotRing: the
+# last `capacity` frames in one preallocated array, allocated for the first
+# frame's shape, with their capture times. Each slot carries the index of
+# the frame it holds, set to -1 while the slot is being overwritten, so a
+# reader copies a slot and then checks the index is still the one it wanted
+# (a seqlock) instead of ever making the camera thread wait.
+#
+# SnapshotCapture.trigger() takes the time of the button press and returns
+# at once. A pool thread picks the frame captured closest to that time,
+# waiting briefly for the first frame after it, and, for a burst, for the
+# frames after the trigger. It copies the frames out of the ring and
+# encodes them into the snapshot directory. Snapshots are taken from the
+# camera frames themselves, not from the scaled display.
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from ringlog import get_logger
+
+log = get_logger('camera')
+
+SNAPSHOT_DIR = 'snapshots'
+SNAPSHOT_FRAMES = 16        # frames kept before the trigger; about 44 MB at 720p
+SNAPSHOT_EXTENSION = '.png'
+SNAPSHOT_WORKERS = 2
+FRAME_WAIT = 0.5            # seconds to wait for a frame that has not been captured yet
+RING_SLACK = 4              # slots a burst leaves free while its last frames arrive
+
+
+class SnapshotRing:
+    """The last `capacity` full-resolution frames and their capture times; see the module comment."""
+
+    def __init__(self, capacity=SNAPSHOT_FRAMES):
+        self.capacity = capacity
+        self._frames = None   # (capacity, height, width, channels), allocated for the first frame
+        self._indices = np.full(capacity, -1, np.int64)
+        self._times = np.zeros(capacity)
+        self._condition = threading.Condition()
+        self.count = 0        # frames added; the next frame's index
+
+    def add(self, frame, timestamp):
+        """Copy `frame`, captured at time.monotonic() `timestamp`, into the ring (camera thread)."""
+        frames = self._frames
+        if frames is None or frames.shape[1:] != frame.shape or frames.dtype != frame.dtype:
+            # First frame, or the camera was reopened at another resolution
+            self._indices[:] = -1
+            frames = self._frames = np.empty((self.capacity,) + frame.shape, frame.dtype)
+        index = self.count
+        slot = index % self.capacity
+        self._indices[slot] = -1   # being overwritten
+        np.copyto(frames[slot], frame)
+        self._times[slot] = timestamp
+        self._indices[slot] = index
+        with self._condition:
+            self.count = index + 1
+            self._condition.notify_all()
+
+    def wait_for(self, index, timeout):
+        """Wait until frame `index` has been added; False on timeout."""
+        with self._condition:
+            return self._condition.wait_for(lambda: self.count > index, timeout)
+
+    def closest(self, timestamp, timeout=FRAME_WAIT):
+        """Index of the frame captured closest to `timestamp`, or None if the ring is empty.
+
+        Waits up to `timeout` for a frame captured at or after `timestamp`,
+        the one that may be closer than the newest frame so far.
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self.count and self._times[(self.count - 1) % self.capacity] >= timestamp, timeout)
+        indices = self._indices.copy()
+        held = indices >= 0
+        if not held.any():
+            return None
+        return int(indices[held][np.argmin(np.abs(self._times[held] - timestamp))])
+
+    def frame_interval(self, default=FRAME_WAIT):
+        """Mean time between the frames in the ring, or `default` with fewer than two."""
+        times = self._times[self._indices >= 0]
+        if len(times) < 2:
+            return default
+        return float(times.max() - times.min()) / (len(times) - 1)
+
+    def copy(self, index):
+        """(copy of frame `index`, its capture time), or None if it is no longer in the ring."""
+        slot = index % self.capacity
+        frames = self._frames
+        if frames is None or self._indices[slot] != index:
+            return None
+        timestamp = float(self._times[slot])
+        frame = frames[slot].copy()
+        if self._indices[slot] != index:
+            return None   # overwritten while being copied
+        return frame, timestamp
+
+
+class SnapshotCapture:
+    """Saves the frame closest to a button press, or a burst around it, from a SnapshotRing.
+
+    `burst` frames before and after the trigger frame are saved with it.
+    The ring holds at least `frames` frames, more if a burst needs them.
+    """
+
+    def __init__(self, directory=SNAPSHOT_DIR, frames=SNAPSHOT_FRAMES, burst=0, workers=SNAPSHOT_WORKERS,
+                 extension=SNAPSHOT_EXTENSION):
+        self.directory = directory
+        self.burst = burst
+        self.extension = extension
+        self.ring = SnapshotRing(max(frames, 2 * burst + 1 + RING_SLACK))
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix='Snapshot')
+        self.saved = 0
+        self.missed = 0   # frames of a burst overwritten or never captured
+
+    def add(self, frame, timestamp):
+        self.ring.add(frame, timestamp)
+
+    def trigger(self, pressed=None):
+        """Save the snapshot for a press at time.monotonic() `pressed` in the background; returns a Future.
+
+        The Future's result is the list of written paths.
+        """
+        pressed = time.monotonic() if pressed is None else pressed
+        # Named after the wall-clock time of the press, not of the encoding
+        now = time.time()
+        stem = time.strftime("snapshot-%Y%m%d-%H%M%S", time.localtime(now)) + f"-{int(now % 1 * 1000):03d}"
+        future = self._pool.submit(self._save, pressed, stem)
+        future.add_done_callback(_log_failure)
+        return future
+
+    def _save(self, pressed, stem):
+        import cv2
+
+        ring = self.ring
+        index = ring.closest(pressed)
+        if index is None:
+            log.warning("Snapshot: no camera frames to save")
+            return []
+        first, last = index - self.burst, index + self.burst
+        # The ring's slack keeps the first frames while the last ones arrive
+        if not ring.wait_for(last, FRAME_WAIT + self.burst * ring.frame_interval()):
+            last = ring.count - 1
+        frames = []
+        for frame_index in range(first, last + 1):
+            copied = ring.copy(frame_index)
+            if copied is None:
+                self.missed += 1
+                continue
+            frames.append((frame_index - index, copied[0], copied[1]))
+
+        os.makedirs(self.directory, exist_ok=True)
+        paths = []
+        for offset, frame, timestamp in frames:
+            name = stem if not self.burst else f"{stem}_{offset:+03d}"
+            path = os.path.join(self.directory, name + self.extension)
+            if cv2.imwrite(path, frame):
+                paths.append(path)
+            else:
+                log.error("Snapshot: cannot write %s", path)
+        if self.burst and paths:
+            # As for video recordings: capture times on the flight recorder's clock
+            with open(os.path.join(self.directory, stem + '.timestamps.csv'), 'w') as timestamps:
+                timestamps.write('offset,monotonic_time\n')
+                for offset, _, timestamp in frames:
+                    timestamps.write(f'{offset},{timestamp:.6f}\n')
+        self.saved += len(paths)
+        trigger_time = next((timestamp for offset, _, timestamp in frames if offset == 0), None)
+        offset = "" if trigger_time is None else f", captured {(trigger_time - pressed) * 1000:+.0f} ms from the press"
+        log.info("Snapshot: %d frame%s saved to %s%s", len(paths), "" if len(paths) == 1 else "s",
+                 os.path.join(self.directory, stem + ('*' if self.burst else '') + self.extension), offset)
+        return paths
+
+    def close(self):
+        """Finish the pending snapshots."""
+        self._pool.shutdown(wait=True)
+
+
+def _log_failure(future):
+    # Otherwise an exception in the pool (e.g. an unwritable directory) would go unnoticed
+    if future.exception() is not None:
+        log.error("Snapshot failed: %s", future.exception())
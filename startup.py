@@ -0,0 +1,107 @@
+# Startup timing and the merged dashboard style sheet.
+#
+# startup_timer records when each startup phase finished, counted from the
+# import of this module, which new.py does before anything heavy. Phases
+# may be marked from any thread; report() lists them in the order they
+# completed.
+#
+# drone.py, generated from drone.ui, gives about 40 widgets a style sheet
+# of their own. Every setStyleSheet() call sets up a style for that widget
+# and repolishes it. collect_style_sheets() records those calls during
+# setupUi() instead, and merged_style_sheet() turns them into one
+# application style sheet with every rule scoped to its widget's object
+# name, e.g. "QLabel { color: cyan; }" on Roll becomes "QLabel#Roll { ... }".
+
+import contextlib
+import re
+import threading
+import time
+
+from ringlog import get_logger
+
+log = get_logger('ui')
+
+_RULE = re.compile(r'([^{}]*)\{([^{}]*)\}')
+
+
+class StartupTimer:
+    """Completion time of each startup phase, in seconds since this module was imported."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = []   # (name, seconds since started)
+        self._lock = threading.Lock()
+        self.reported = False
+
+    def mark(self, name):
+        with self._lock:
+            self.phases.append((name, time.perf_counter() - self.started))
+
+    def report(self):
+        with self._lock:
+            phases = list(self.phases)
+        lines = ["Startup timing (ms since start, ms since the previous phase):"]
+        previous = 0.0
+        for name, elapsed in phases:
+            lines.append(f"  {name:<16} {elapsed * 1000:8.0f} {(elapsed - previous) * 1000:+8.0f}")
+            previous = elapsed
+        return "\n".join(lines)
+
+    def log_report(self):
+        """Log the report, the first time only."""
+        if not self.reported:
+            self.reported = True
+            log.info("%s", self.report())
+
+
+startup_timer = StartupTimer()
+
+
+@contextlib.contextmanager
+def collect_style_sheets():
+    """Record instead of apply every QWidget.setStyleSheet() call made inside the block.
+
+    Yields the list of (widget, style sheet) calls.
+    """
+    from PyQt5.QtWidgets import QWidget
+
+    original = QWidget.__dict__['setStyleSheet']
+    calls = []
+    QWidget.setStyleSheet = lambda widget, sheet: calls.append((widget, sheet))
+    try:
+        yield calls
+    finally:
+        QWidget.setStyleSheet = original
+
+
+def _scope(selector, name):
+    # Pin the first compound selector to the widget: "QPushButton:hover" -> "QPushButton#CaptureButton:hover"
+    selector = selector.strip()
+    head, separator, rest = selector.partition(' ')
+    if '#' in head:
+        return selector   # already names a widget
+    match = re.match(r'[\w*]*', head)
+    return f"{head[:match.end()] or '*'}#{name}{head[match.end():]}{separator}{rest}"
+
+
+def merged_style_sheet(calls):
+    """Return (application style sheet, {widget: style sheet} of the calls that could not be merged).
+
+    Sheets of widgets without an object name are returned for applying as before.
+    """
+    rules = []
+    unmerged = {}
+    for widget, sheet in calls:
+        name = widget.objectName()
+        if not sheet.strip():
+            continue
+        if not name:
+            unmerged[widget] = sheet
+            continue
+        if '{' not in sheet:
+            rules.append(f"*#{name} {{{sheet}}}")   # bare declarations apply to the widget itself
+            continue
+        for selectors, body in _RULE.findall(sheet):
+            scoped = ', '.join(_scope(selector, name) for selector in selectors.split(','))
+            rules.append(f"{scoped} {{{body}}}")
+    return "\n".join(rules), unmerged
@@ -0,0 +1,262 @@
+# Rolling strip charts of telemetry channels.
+#
+# Every charted channel keeps its history in two fixed-size NumPy rings:
+#
+#   raw      the last `capacity` samples (monotonic time, value)
+#   buckets  (time, min, max) of every `bucket` consecutive samples, the
+#            last `capacity` of them; at the defaults 64x the raw span
+#
+# so a vehicle's history costs the same few hundred KB per channel after a
+# minute or after five hours. The ingest thread appends; the GUI asks for a
+# time window decimated to the chart's pixel width. Decimation is min/max
+# per pixel column with ufunc.reduceat, so spikes survive and painting
+# costs one polyline of at most 2 points per column, however many samples
+# the window holds.
+
+import threading
+import time
+
+import numpy as np
+from PyQt5.QtCore import QPointF, QRectF, Qt
+from PyQt5.QtGui import QColor, QFont, QPainter, QPen, QPolygonF
+from PyQt5.QtWidgets import QWidget
+
+RAW_SAMPLES = 8192
+BUCKET_SAMPLES = 64
+CHART_CHANNELS = ('Altitude', 'Battery Voltage', 'Roll', 'Pitch')
+CHART_SPAN = 120.0        # seconds shown by default; the mouse wheel zooms
+MIN_SPAN = 10.0
+MAX_SPAN = 8 * 3600.0
+CHART_RATE_HZ = 10
+CHART_COLORS = ('#00ff7f', '#ffd700', '#ff6347', '#1e90ff', '#ee82ee', '#00ffff')
+
+
+def _ordered(array, index, full):
+    """The ring `array` (next write at `index`) as its oldest and newest segments."""
+    return (array[index:], array[:index]) if full else (array[:0], array[:index])
+
+
+def min_max_decimate(times, mins, maxs, start, end, columns):
+    """Reduce time-sorted samples in [start, end] to per-column extremes.
+
+    Returns (columns, mins, maxs) for the pixel columns that hold any sample.
+    """
+    if not len(times):
+        return np.empty(0, np.intp), mins[:0], maxs[:0]
+    column = ((times - start) * (columns / (end - start))).astype(np.intp)
+    np.clip(column, 0, columns - 1, out=column)
+    starts = np.flatnonzero(np.diff(column, prepend=-1))
+    return column[starts], np.minimum.reduceat(mins, starts), np.maximum.reduceat(maxs, starts)
+
+
+class ChannelHistory:
+    """Raw and min/max bucket rings of one channel; see the module comment."""
+
+    def __init__(self, capacity=RAW_SAMPLES, bucket=BUCKET_SAMPLES):
+        self.capacity = capacity
+        self.bucket = bucket
+        self._lock = threading.Lock()
+        self._times = np.zeros(capacity, np.float64)
+        self._values = np.zeros(capacity, np.float32)
+        self._index = 0
+        self._full = False
+        self._bucket_times = np.zeros(capacity, np.float64)
+        self._bucket_mins = np.zeros(capacity, np.float32)
+        self._bucket_maxs = np.zeros(capacity, np.float32)
+        self._bucket_index = 0
+        self._buckets_full = False
+        # The bucket being filled, as plain floats
+        self._pending = 0
+        self._pending_time = self._pending_min = self._pending_max = 0.0
+        self.count = 0
+        self.latest = None
+
+    def append(self, timestamp, value):
+        with self._lock:
+            index = self._index
+            self._times[index] = timestamp
+            self._values[index] = value
+            index += 1
+            if index == self.capacity:
+                index = 0
+                self._full = True
+            self._index = index
+            self.count += 1
+            self.latest = value
+
+            if not self._pending:
+                self._pending_time = timestamp
+                self._pending_min = self._pending_max = value
+            elif value < self._pending_min:
+                self._pending_min = value
+            elif value > self._pending_max:
+                self._pending_max = value
+            self._pending += 1
+            if self._pending == self.bucket:
+                index = self._bucket_index
+                self._bucket_times[index] = self._pending_time
+                self._bucket_mins[index] = self._pending_min
+                self._bucket_maxs[index] = self._pending_max
+                index += 1
+                if index == self.capacity:
+                    index = 0
+                    self._buckets_full = True
+                self._bucket_index = index
+                self._pending = 0
+
+    def window(self, start, end):
+        """Copies of (times, mins, maxs) of the samples between `start` and `end`, oldest first.
+
+        Raw samples cover the recent part; buckets extend the window back to
+        where the raw ring has already been overwritten.
+        """
+        with self._lock:
+            parts = []
+            raw = []
+            for times, values in zip(_ordered(self._times, self._index, self._full),
+                                     _ordered(self._values, self._index, self._full)):
+                first, last = times.searchsorted(start), times.searchsorted(end, 'right')
+                raw.append((times[first:last], values[first:last]))
+            raw_start = self._times[self._index] if self._full else (self._times[0] if self._index else end)
+            if start < raw_start:
+                for times, mins, maxs in zip(*(_ordered(array, self._bucket_index, self._buckets_full) for array in
+                                               (self._bucket_times, self._bucket_mins, self._bucket_maxs))):
+                    first, last = times.searchsorted(start), times.searchsorted(raw_start)
+                    if first < last:
+                        parts.append((times[first:last], mins[first:last], maxs[first:last]))
+            for times, values in raw:
+                if len(times):
+                    parts.append((times, values, values))
+            if not parts:
+                empty = np.empty(0)
+                return empty, empty.astype(np.float32), empty.astype(np.float32)
+            return tuple(np.concatenate(column) for column in zip(*parts))
+
+    def clear(self):
+        with self._lock:
+            self._index = self._bucket_index = self._pending = self.count = 0
+            self._full = self._buckets_full = False
+            self.latest = None
+
+
+class TelemetryHistory:
+    """ChannelHistory of every charted channel of one vehicle."""
+
+    def __init__(self, channels=CHART_CHANNELS, capacity=RAW_SAMPLES, bucket=BUCKET_SAMPLES):
+        self.channels = {key: ChannelHistory(capacity, bucket) for key in channels}
+
+    def record(self, samples, timestamp=None):
+        """Append (key, value) samples; keys that are not charted are ignored."""
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        channels = self.channels
+        for key, value in samples:
+            history = channels.get(key)
+            if history is not None:
+                try:
+                    history.append(timestamp, float(value))
+                except (TypeError, ValueError):
+                    continue
+
+    def __getitem__(self, key):
+        return self.channels[key]
+
+
+class VehicleHistories:
+    """A TelemetryHistory per vehicle; publish() has the IngestService sink signature."""
+
+    def __init__(self, channels=CHART_CHANNELS, capacity=RAW_SAMPLES, bucket=BUCKET_SAMPLES):
+        self.channels = tuple(channels)
+        self.capacity = capacity
+        self.bucket = bucket
+        self._lock = threading.Lock()
+        self._vehicles = {}
+
+    def history(self, vehicle_id):
+        history = self._vehicles.get(vehicle_id)
+        if history is None:
+            with self._lock:
+                history = self._vehicles.setdefault(
+                    vehicle_id, TelemetryHistory(self.channels, self.capacity, self.bucket))
+        return history
+
+    def publish(self, vehicle_id, samples):
+        self.history(vehicle_id).record(samples)
+
+
+def make_polygon(xs, ys):
+    """QPolygonF of the points (xs[i], ys[i])."""
+    # Filled through the polygon's own memory instead of a QPointF per point
+    polygon = QPolygonF(len(xs))
+    pointer = polygon.data()
+    pointer.setsize(len(xs) * 2 * 8)
+    points = np.frombuffer(pointer, np.float64).reshape(-1, 2)
+    points[:, 0] = xs
+    points[:, 1] = ys
+    return polygon
+
+
+class StripChart(QWidget):
+    """Scrolling chart of one channel over the last `span` seconds."""
+
+    def __init__(self, parent, title, color, span=CHART_SPAN):
+        super().__init__(parent)
+        self.title = title
+        self.color = QColor(color)
+        self.span = span
+        self.history = None   # ChannelHistory shown, set by the dashboard
+        self.setAttribute(Qt.WA_OpaquePaintEvent)
+        self._font = QFont("Arial Narrow", 9)
+
+    def set_history(self, history):
+        self.history = history
+        self.update()
+
+    def wheelEvent(self, event):
+        # Zoom the time axis
+        self.span = min(max(self.span * (0.5 if event.angleDelta().y() > 0 else 2.0), MIN_SPAN), MAX_SPAN)
+        self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), Qt.black)
+        painter.setPen(QPen(QColor('#303030')))
+        painter.drawRect(self.rect().adjusted(0, 0, -1, -1))
+        painter.setFont(self._font)
+        width, height = self.width(), self.height()
+        top, bottom = 16, height - 4
+
+        history = self.history
+        latest = history.latest if history is not None else None
+        painter.setPen(Qt.cyan)
+        label = self.title if latest is None else f"{self.title}  {latest:.2f}"
+        span = f"{self.span:.0f} s" if self.span < 600 else f"{self.span / 60:.0f} min"
+        painter.drawText(QRectF(4, 0, width - 8, top), Qt.AlignLeft | Qt.AlignVCenter, label)
+        painter.drawText(QRectF(4, 0, width - 8, top), Qt.AlignRight | Qt.AlignVCenter, span)
+        if latest is None or width < 4:
+            return
+
+        end = time.monotonic()
+        start = end - self.span
+        times, mins, maxs = history.window(start, end)
+        columns, low, high = min_max_decimate(times, mins, maxs, start, end, width - 2)
+        if not len(columns):
+            return
+        y_min, y_max = float(low.min()), float(high.max())
+        if y_max - y_min < 1e-6:
+            y_min, y_max = y_min - 1.0, y_max + 1.0
+        scale = (bottom - top) / (y_max - y_min)
+
+        painter.setPen(QPen(QColor('#606060')))
+        painter.drawText(QRectF(4, top, width - 8, bottom - top), Qt.AlignRight | Qt.AlignTop, f"{y_max:.2f}")
+        painter.drawText(QRectF(4, top, width - 8, bottom - top), Qt.AlignRight | Qt.AlignBottom, f"{y_min:.2f}")
+
+        # Zig-zag through each column's extremes: a vertical stroke per column, joined to the next
+        xs = np.repeat(columns + 1.0, 2)
+        ys = np.empty(len(xs))
+        ys[0::2] = bottom - (high - y_min) * scale
+        ys[1::2] = bottom - (low - y_min) * scale
+        painter.setRenderHint(QPainter.Antialiasing, False)
+        painter.setPen(QPen(self.color, 1))
+        painter.drawPolyline(make_polygon(xs, ys))
+        if len(columns) == 1:
+            painter.drawPoint(QPointF(xs[0], ys[0]))
@@ -0,0 +1,116 @@
+# Telemetry schema and line decoder for the drone dashboard.
+#
+# The Arduino sends one "Key: Value" line per field, 16 fields per cycle.
+# TELEMETRY_SCHEMA is the single description of those fields, shared by
+# receiver.py and the dashboard in new.py: how to convert the value, which
+# variable it lands in and which dashboard widget shows it.
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except ValueError:
+        return int(float(value))
+
+
+def _two_decimals(value):
+    return f"{value:.2f}"
+
+
+class FieldSpec:
+    """One telemetry field: converter, target slot and widget binding.
+
+    `widget` is the attribute name in Ui_DroneDashboard, `method` the widget
+    method that shows the value and `formatter` turns the typed value into
+    that method's argument.
+    """
+
+    __slots__ = ('key', 'converter', 'slot', 'widget', 'method', 'formatter')
+
+    def __init__(self, key, converter, slot, widget, method='display', formatter=None):
+        self.key = key
+        self.converter = converter
+        self.slot = slot
+        self.widget = widget
+        self.method = method
+        self.formatter = formatter
+
+    def __repr__(self):
+        return f"FieldSpec({self.key!r} -> {self.slot}, {self.widget}.{self.method})"
+
+
+# Field order is the field order of binary frames (protocol.py) and shared blocks
+TELEMETRY_SCHEMA = {spec.key: spec for spec in (
+    FieldSpec('Battery Voltage', float, 'battery_voltage', 'battery_status', 'setText', _two_decimals),
+    FieldSpec('Roll', float, 'roll', 'lcdNumber_4'),
+    FieldSpec('Pitch', float, 'pitch', 'lcdNumber_5'),
+    FieldSpec('Heading', float, 'heading', 'lcdNumber_6'),
+    FieldSpec('Number of Satellites', _to_int, 'num_satellites', 'lcdNumber_7'),
+    FieldSpec('Main Mode', str.strip, 'mainmode', 'mainmode_status', 'setText'),
+    FieldSpec('Sub Mode', str.strip, 'submode', 'submode_status', 'setText'),
+    FieldSpec('Error', float, 'error', 'error_status', 'setText', _two_decimals),
+    FieldSpec('GPS', float, 'gps', 'gps_status', 'setText', _two_decimals),
+    FieldSpec('Latitude', float, 'latitude', 'lcdNumber'),
+    FieldSpec('Longitude', float, 'longitude', 'lcdNumber_3'),
+    FieldSpec('Altitude', float, 'altitude', 'lcdNumber_2'),
+    FieldSpec('Distance Right', _to_int, 'distance_right', 'lcdNumber_9'),
+    FieldSpec('Distance Left', _to_int, 'distance_left', 'lcdNumber_10'),
+    FieldSpec('Distance Upper', _to_int, 'distance_upper', 'lcdNumber_12'),
+    FieldSpec('Armed or Not', str.strip, 'armed', 'armed_status', 'setText'),
+)}
+
+# Older dashboard code expected 'GPS Status' for the key the firmware sends as 'GPS'
+KEY_ALIASES = {
+    'GPS Status': 'GPS',
+}
+
+FIELDS = tuple(TELEMETRY_SCHEMA)
+
+
+class TelemetryDecoder:
+    """Turns "Key: Value" lines into (FieldSpec, typed value) pairs.
+
+    Lookup is one dict access per line. Lines with an unknown key or a value
+    the converter rejects are counted rather than reported.
+    """
+
+    def __init__(self, schema=TELEMETRY_SCHEMA, aliases=KEY_ALIASES):
+        self.table = dict(schema)
+        for alias, key in aliases.items():
+            self.table[alias] = schema[key]
+        self.decoded = 0
+        self.unknown = 0
+        self.malformed = 0
+        self.unknown_keys = {}
+
+    def decode_line(self, line):
+        key, separator, value = line.partition(':')
+        spec = self.table.get(key)
+        if spec is None:
+            if not separator:
+                self.malformed += 1
+                return None
+            key = key.strip()
+            spec = self.table.get(key)
+            if spec is None:
+                self.unknown += 1
+                # Bounded, so line noise cannot grow it forever
+                if key in self.unknown_keys or len(self.unknown_keys) < 64:
+                    self.unknown_keys[key] = self.unknown_keys.get(key, 0) + 1
+                return None
+        try:
+            # float() and int() ignore surrounding whitespace, text fields use str.strip
+            value = spec.converter(value)
+        except (ValueError, OverflowError):   # OverflowError: "inf" in an integer field
+            self.malformed += 1
+            return None
+        self.decoded += 1
+        return spec, value
+
+    def stats(self):
+        return {
+            'decoded': self.decoded,
+            'unknown': self.unknown,
+            'malformed': self.malformed,
+            'unknown_keys': dict(self.unknown_keys),
+        }
@@ -0,0 +1,61 @@
+# Thread-safe latest-value telemetry store.
+#
+# The serial thread writes decoded values as fast as they arrive; the GUI
+# reads only what changed since its last render tick. Ingest rate and paint
+# rate are decoupled: a field that changes 500 times between two ticks is
+# painted once, with its newest value.
+
+import threading
+
+
+class TelemetryStore:
+    """Latest value of every telemetry field plus a per-field change version."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+        self._versions = {}
+        self.version = 0
+        self.updates = 0
+        self._trace = None
+
+    def update(self, values, trace=None):
+        """Store a batch of {key: value}; only values that differ bump their version.
+
+        `trace` is an optional tracing.Trace; the oldest one not yet taken is kept.
+        """
+        with self._lock:
+            self.version += 1
+            self.updates += len(values)
+            version = self.version
+            stored = self._values
+            for key, value in values.items():
+                if key not in stored or stored[key] != value:
+                    stored[key] = value
+                    self._versions[key] = version
+            if trace is not None and self._trace is None:
+                trace.mark()   # signal_emitted: visible to the render tick from here on
+                self._trace = trace
+
+    def set(self, key, value):
+        self.update({key: value})
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self._values.get(key, default)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def take_trace(self):
+        with self._lock:
+            trace, self._trace = self._trace, None
+            return trace
+
+    def changed_since(self, version):
+        """Return (current version, {key: value} of the fields changed after `version`)."""
+        with self._lock:
+            changed = {key: self._values[key]
+                       for key, key_version in self._versions.items() if key_version > version}
+            return self.version, changed
@@ -0,0 +1,116 @@
+# End-to-end latency tracing for telemetry samples and camera frames.
+#
+# A Trace collects one time.perf_counter() timestamp per pipeline stage as
+# a sample or frame moves from the serial port / camera to the screen. When
+# the last stage is reached, LatencyTracer.finish() stores the time spent in
+# every stage in fixed-size ring arrays, from which rolling p50/p95/p99 are
+# computed on demand.
+#
+# Tracing is off by default. Every instrumentation point is guarded by
+# `if tracer.enabled`, so the cost when off is one attribute check. NumPy
+# is only imported once a trace is recorded, which keeps it out of the
+# headless receiver's start-up.
+
+import json
+import time
+
+PIPELINES = {
+    # 'signal_emitted' is the handoff to the GUI thread: a queued signal or a TelemetryStore update
+    'telemetry': ('bytes_received', 'line_decoded', 'signal_emitted', 'slot_entered', 'widget_updated'),
+    'camera': ('frame_read', 'color_converted', 'frame_emitted', 'pixmap_set'),
+}
+
+PERCENTILES = (50, 95, 99)
+
+
+class Trace:
+    __slots__ = ('pipeline', 'times')
+
+    def __init__(self, pipeline, timestamp=None):
+        self.pipeline = pipeline
+        self.times = [time.perf_counter() if timestamp is None else timestamp]
+
+    def mark(self, timestamp=None):
+        """Record that the next stage of the pipeline was reached."""
+        self.times.append(time.perf_counter() if timestamp is None else timestamp)
+
+
+class LatencyTracer:
+    """Rolling per-stage latency histograms over the last `capacity` traces."""
+
+    def __init__(self, capacity=2048, enabled=False):
+        self.capacity = capacity
+        self.enabled = enabled
+        self._latencies = None
+        self._counts = {name: 0 for name in PIPELINES}
+        self.incomplete = 0
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+
+    def _arrays(self):
+        if self._latencies is None:
+            import numpy as np
+
+            # Row 0 is the end-to-end latency, row i the time from stage i-1 to stage i
+            self._latencies = {name: np.zeros((len(stages), self.capacity)) for name, stages in PIPELINES.items()}
+        return self._latencies
+
+    def start(self, pipeline, timestamp=None):
+        return Trace(pipeline, timestamp) if self.enabled else None
+
+    def finish(self, trace):
+        if trace is None:
+            return
+        times = trace.times
+        latencies = self._arrays()[trace.pipeline]
+        if len(times) != latencies.shape[0]:
+            self.incomplete += 1
+            return
+        column = self._counts[trace.pipeline] % self.capacity
+        for row in range(1, len(times)):
+            latencies[row, column] = times[row] - times[row - 1]
+        latencies[0, column] = times[-1] - times[0]
+        self._counts[trace.pipeline] += 1
+
+    def reset(self):
+        for latencies in self._arrays().values():
+            latencies[:] = 0
+        self._counts = {name: 0 for name in PIPELINES}
+        self.incomplete = 0
+
+    def summary(self):
+        """{pipeline: {stage: {'p50': ms, 'p95': ms, 'p99': ms}}, with 'total' for end to end."""
+        import numpy as np
+
+        summary = {}
+        for name, stages in PIPELINES.items():
+            filled = min(self._counts[name], self.capacity)
+            pipeline = {'traces': self._counts[name]}
+            if filled:
+                percentiles = np.percentile(self._arrays()[name][:, :filled], PERCENTILES, axis=1) * 1000
+                labels = ('total',) + stages[1:]
+                for row, label in enumerate(labels):
+                    pipeline[label] = {f"p{p}": round(float(percentiles[i, row]), 3)
+                                       for i, p in enumerate(PERCENTILES)}
+            summary[name] = pipeline
+        return summary
+
+    def format_summary(self):
+        lines = []
+        for name, pipeline in self.summary().items():
+            lines.append(f"{name} ({pipeline['traces']} traces)")
+            for stage, values in pipeline.items():
+                if stage == 'traces':
+                    continue
+                lines.append(f"  {stage:16} p50 {values['p50']:9.3f} ms  p95 {values['p95']:9.3f} ms  "
+                             f"p99 {values['p99']:9.3f} ms")
+        return '\n'.join(lines)
+
+    def dump(self, path):
+        with open(path, 'w') as dump_file:
+            json.dump(self.summary(), dump_file, indent=2)
+
+
+# Shared by the serial thread, the camera thread and the dashboard
+tracer = LatencyTracer()
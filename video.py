@@ -0,0 +1,281 @@
+# Camera pipeline helpers: a latest-frame mailbox, rate meters and the
+# worker-side frame scaler.
+#
+# The camera worker overwrites a single slot; the GUI takes the newest
+# frame at display rate. When the GUI falls behind (modal dialogs, heavy
+# repaints) frames are dropped and counted instead of queueing up in the
+# Qt event loop.
+#
+# FrameScaler does the resize and color conversion on the camera thread,
+# into a small pool of preallocated buffers, so the GUI thread only has to
+# blit an image that already has the label's size and Qt's native format.
+#
+# OpenCV is imported by the functions that use it, on the camera thread,
+# so importing this module does not load it.
+
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+from PyQt5.QtGui import QImage
+
+
+class FrameMailbox:
+    """Single-slot mailbox holding only the newest frame."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._frame = None
+        self.put_count = 0
+        self.take_count = 0
+        self.dropped = 0   # frames overwritten before the GUI took them
+
+    def put(self, frame):
+        """Store `frame`; return the frame it replaced (a dropped one) or None."""
+        with self._lock:
+            if frame.trace is not None:
+                frame.trace.mark()   # frame_emitted: takeable by the GUI from here on
+            replaced = self._frame
+            if replaced is not None:
+                self.dropped += 1
+            self._frame = frame
+            self.put_count += 1
+            return replaced
+
+    def take(self):
+        """Return the pending frame and empty the slot, or None if nothing new arrived."""
+        with self._lock:
+            frame = self._frame
+            self._frame = None
+            if frame is not None:
+                self.take_count += 1
+            return frame
+
+
+class RateMeter:
+    """Events per second, recomputed once per `interval` seconds."""
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.rate = 0.0
+        self._count = 0
+        self._start = time.monotonic()
+
+    def tick(self, count=1):
+        self._count += count
+        now = time.monotonic()
+        elapsed = now - self._start
+        if elapsed >= self.interval:
+            self.rate = self._count / elapsed
+            self._count = 0
+            self._start = now
+
+
+class FrameBufferPool:
+    """Fixed set of preallocated BGRA buffers of one size, handed out and returned."""
+
+    def __init__(self, size, count=3):
+        self.size = size
+        width, height = size
+        self._lock = threading.Lock()
+        self._free = deque(np.empty((height, width, 4), np.uint8) for _ in range(count))
+
+    def acquire(self):
+        with self._lock:
+            return self._free.popleft() if self._free else None
+
+    def release(self, buffer):
+        with self._lock:
+            self._free.append(buffer)
+
+
+class DisplayFrame:
+    """A QImage plus the pooled buffer backing it.
+
+    The QImage does not own its pixels, and a QPixmap made from it shares
+    them. Holding the buffer here keeps the pixels alive until release()
+    hands the buffer back to the pool.
+    """
+
+    __slots__ = ('image', 'buffer', 'pool', 'trace')
+
+    def __init__(self, image, buffer, pool):
+        self.image = image
+        self.buffer = buffer
+        self.pool = pool
+        self.trace = None   # tracing.Trace while latency tracing is on
+
+    def release(self):
+        if self.buffer is not None:
+            self.pool.release(self.buffer)
+            self.buffer = None
+
+
+class FrameScaler:
+    """Resizes BGR camera frames to the display size and converts them for Qt.
+
+    The output is 4 bytes per pixel in B, G, R, A order, which is
+    QImage.Format_RGB32 on little-endian machines, so QPixmap.fromImage
+    needs no further conversion.
+    """
+
+    def __init__(self, pool_size=3):
+        # Three buffers: one on screen, one waiting in the mailbox, one being converted
+        self.pool_size = pool_size
+        self.target_size = None   # (width, height); None keeps the camera resolution
+        self.pool = None
+        self._scratch = None
+        self.pool_exhausted = 0   # frames skipped because every buffer was still in use
+
+    def set_target_size(self, width, height):
+        self.target_size = (width, height) if width > 0 and height > 0 else None
+
+    def convert(self, frame):
+        height, width = frame.shape[:2]
+        size = self.target_size or (width, height)
+        if self.pool is None or self.pool.size != size:
+            # Buffers of the old size still out are dropped when released
+            self.pool = FrameBufferPool(size, self.pool_size)
+        pool = self.pool
+        buffer = pool.acquire()
+        if buffer is None:
+            self.pool_exhausted += 1
+            return None
+        self._scratch = convert_frame(frame, size, buffer, self._scratch)
+        image = QImage(buffer.data, size[0], size[1], size[0] * 4, QImage.Format_RGB32)
+        return DisplayFrame(image, buffer, pool)
+
+
+def convert_frame(frame, size, dst, scratch=None):
+    """Resize a BGR `frame` to `size` (width, height) and write it to `dst` as BGRA.
+
+    `scratch` is an optional buffer for the intermediate image; the one
+    used is returned, pass it back in on the next call.
+    """
+    import cv2
+
+    height, width = frame.shape[:2]
+    if size == (width, height):
+        cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA, dst=dst)
+        return scratch
+    if size[0] * 2 <= width:
+        # INTER_AREA where nearest neighbour would alias, at 2x and more; converted after the shrink
+        shape = (size[1], size[0], 3)
+        if scratch is None or scratch.shape != shape:
+            scratch = np.empty(shape, np.uint8)
+        cv2.cvtColor(cv2.resize(frame, size, dst=scratch, interpolation=cv2.INTER_AREA),
+                     cv2.COLOR_BGR2BGRA, dst=dst)
+        return scratch
+    # Nearest neighbour, like the Qt FastTransformation scaling the label used to do. Converted
+    # first: OpenCV picks 4-byte pixels about three times faster than 3-byte ones
+    shape = (height, width, 4)
+    if scratch is None or scratch.shape != shape:
+        scratch = np.empty(shape, np.uint8)
+    cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA, dst=scratch), size, dst=dst,
+               interpolation=cv2.INTER_NEAREST)
+    return scratch
+
+
+# Backend name -> cv2 constant name
+CAPTURE_BACKENDS = {
+    'any': 'CAP_ANY',
+    'dshow': 'CAP_DSHOW',
+    'msmf': 'CAP_MSMF',
+    'v4l2': 'CAP_V4L2',
+    'gstreamer': 'CAP_GSTREAMER',
+    'ffmpeg': 'CAP_FFMPEG',
+    'avfoundation': 'CAP_AVFOUNDATION',
+}
+
+# Profile file read by CaptureProfile.load() when no path is given
+CAPTURE_PROFILE_ENV = 'DRONE_CAMERA_PROFILE'
+CAPTURE_PROFILE_FILE = 'camera_profile.json'
+
+
+class CaptureProfile:
+    """Requested capture settings for a camera; None leaves the device default.
+
+    Example camera_profile.json:
+
+        {"width": 1280, "height": 720, "fps": 30, "fourcc": "MJPG",
+         "buffer_size": 1, "backend": "dshow"}
+    """
+
+    FIELDS = ('width', 'height', 'fps', 'fourcc', 'buffer_size', 'backend')
+
+    def __init__(self, width=None, height=None, fps=None, fourcc=None, buffer_size=None, backend=None):
+        if backend is not None and backend not in CAPTURE_BACKENDS:
+            raise ValueError(f"unknown capture backend {backend!r}, expected one of {sorted(CAPTURE_BACKENDS)}")
+        if fourcc is not None and len(fourcc) != 4:
+            raise ValueError(f"FOURCC must be 4 characters, got {fourcc!r}")
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.fourcc = fourcc
+        self.buffer_size = buffer_size
+        self.backend = backend
+
+    @classmethod
+    def from_dict(cls, settings):
+        unknown = set(settings) - set(cls.FIELDS)
+        if unknown:
+            raise ValueError(f"unknown capture profile settings: {sorted(unknown)}")
+        return cls(**settings)
+
+    @classmethod
+    def load(cls, path=None):
+        """Read a JSON profile from `path`, $DRONE_CAMERA_PROFILE or ./camera_profile.json.
+
+        Returns the default profile when no file exists.
+        """
+        path = path or os.environ.get(CAPTURE_PROFILE_ENV) or CAPTURE_PROFILE_FILE
+        if not os.path.exists(path):
+            return cls()
+        with open(path) as profile_file:
+            return cls.from_dict(json.load(profile_file))
+
+    def open(self, camera_port):
+        import cv2
+
+        cap = cv2.VideoCapture(camera_port, getattr(cv2, CAPTURE_BACKENDS[self.backend or 'any']))
+        # FOURCC goes first: many drivers only offer high resolutions/rates in MJPG
+        if self.fourcc:
+            cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*self.fourcc))
+        if self.width:
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        if self.height:
+            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        if self.fps:
+            cap.set(cv2.CAP_PROP_FPS, self.fps)
+        if self.buffer_size is not None:
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, self.buffer_size)
+        return cap
+
+    def __repr__(self):
+        settings = ', '.join(f"{name}={getattr(self, name)!r}" for name in self.FIELDS
+                             if getattr(self, name) is not None)
+        return f"CaptureProfile({settings})"
+
+
+def negotiated_settings(cap):
+    """Read back what the device actually agreed to."""
+    import cv2
+
+    fourcc = int(cap.get(cv2.CAP_PROP_FOURCC))
+    fourcc = ''.join(chr((fourcc >> shift) & 0xFF) for shift in (0, 8, 16, 24)) if fourcc > 0 else ''
+    try:
+        backend = cap.getBackendName()
+    except cv2.error:
+        backend = ''   # capture did not open
+    return {
+        'opened': cap.isOpened(),
+        'width': int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        'height': int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        'fps': cap.get(cv2.CAP_PROP_FPS),
+        'fourcc': fourcc.strip('\x00'),
+        'buffer_size': int(cap.get(cv2.CAP_PROP_BUFFERSIZE)),
+        'backend': backend,
+    }
@@ -0,0 +1,137 @@
+# Full-resolution video recording of the camera stream.
+#
+# The camera thread hands each captured frame to VideoRecorder.submit(),
+# which copies it into a bounded multiprocessing queue and returns at once.
+# A separate encoder process takes frames from the queue and writes them
+# with cv2.VideoWriter, so neither the capture loop nor the GUI ever waits
+# on the encoder or the disk. When the queue is full the frame is dropped
+# and counted; the recording's frame numbers then skip, so gaps are visible
+# in the output as well.
+#
+# Next to every video "<video>.timestamps.csv" lists, per written frame,
+# the capture frame number and its time.monotonic() capture time (the same
+# clock as the flight recorder, so video and telemetry can be lined up).
+
+import multiprocessing
+import queue
+import time
+
+VIDEO_FOURCC = 'MJPG'   # cheap to encode, supported by every OpenCV build
+VIDEO_EXTENSION = '.avi'
+QUEUE_FRAMES = 8        # about 22 MB of 720p frames in flight at most
+
+
+def _encode_frames(path, fps, frames, stop_event, written, failed):
+    """Encoder process: write frames from the queue until the None that stop() queues after the last one."""
+    import cv2
+
+    writer = None
+    with open(path + '.timestamps.csv', 'w') as timestamps:
+        timestamps.write('frame,monotonic_time\n')
+        while True:
+            try:
+                item = frames.get(timeout=0.1)
+            except queue.Empty:
+                if stop_event.is_set():
+                    break   # the queue was full when stop() ran; everything in it is written now
+                continue
+            if item is None:
+                break
+            index, timestamp, frame = item
+            if writer is None:
+                height, width = frame.shape[:2]
+                writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*VIDEO_FOURCC), fps, (width, height))
+                if not writer.isOpened():
+                    failed.value = 1
+                    break
+            writer.write(frame)
+            timestamps.write(f'{index},{timestamp:.6f}\n')
+            written.value += 1
+    if writer is not None:
+        writer.release()
+
+
+class VideoRecorder:
+    """Records submitted BGR frames to `path` in an encoder process.
+
+    submit() never blocks: frames the encoder cannot keep up with are
+    dropped and counted in `dropped`.
+    """
+
+    def __init__(self, path, fps=30.0, queue_frames=QUEUE_FRAMES):
+        self.path = path
+        self.fps = fps or 30.0
+        # spawn: forking a process that runs Qt and capture threads is not safe
+        context = multiprocessing.get_context('spawn')
+        self._frames = context.Queue(queue_frames)
+        self._stop_event = context.Event()
+        self._written = context.RawValue('q', 0)
+        self._failed = context.RawValue('b', 0)
+        self._process = context.Process(
+            target=_encode_frames, name='VideoEncoder',
+            args=(path, self.fps, self._frames, self._stop_event, self._written, self._failed))
+        self.submitted = 0
+        self.dropped = 0
+        self.started_at = None
+        self.running = False
+
+    def start(self):
+        self._process.start()
+        self.started_at = time.monotonic()
+        self.running = True
+
+    def submit(self, frame, timestamp=None):
+        """Queue a copy of `frame` for encoding, or drop it if the encoder is behind."""
+        if not self.running:
+            return False
+        index = self.submitted
+        self.submitted += 1
+        try:
+            # Copied because the capture loop decodes the next frame into the same array
+            self._frames.put_nowait((index, time.monotonic() if timestamp is None else timestamp, frame.copy()))
+        except (queue.Full, ValueError):   # ValueError: stopped meanwhile
+            self.dropped += 1
+            return False
+        return True
+
+    @property
+    def written(self):
+        return self._written.value
+
+    @property
+    def failed(self):
+        """True if the encoder could not open a writer for `path`."""
+        return bool(self._failed.value)
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started_at if self.started_at is not None else 0.0
+
+    def stats(self):
+        return {
+            'path': self.path,
+            'elapsed': self.elapsed,
+            'submitted': self.submitted,
+            'written': self.written,
+            'dropped': self.dropped,
+            'failed': self.failed,
+        }
+
+    def stop(self):
+        """Stop accepting frames; the encoder finishes the queued ones and exits on its own."""
+        if not self.running:
+            return
+        self.running = False
+        # Frames still in the queue's feeder thread arrive before the marker and are written.
+        # Called on the GUI thread, so it never waits for room: with the queue full the
+        # encoder instead stops once it has emptied the queue
+        try:
+            self._frames.put_nowait(None)
+        except queue.Full:
+            self._stop_event.set()
+        self._frames.close()
+
+    def join(self, timeout=None):
+        self.stop()
+        self._process.join(timeout)
+        return not self._process.is_alive()